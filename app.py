@@ -1,5 +1,6 @@
-from wodbooker import app
+from wodbooker import app, start_background_tasks
 
 
 if __name__ == "__main__":
+    start_background_tasks()
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the WodBuster parsing code, run on recorded responses
+
+Usage:
+    python benchmark.py json [--iterations N] [--days N] payload.json [payload.json ...]
+    python benchmark.py descriptions [--iterations N] payload.json [payload.json ...]
+    python benchmark.py schedule [--bookings N] [--days N]
+    python benchmark.py sync [--users N] [--days N] [--iterations N]
+
+Payloads are LoadClass.ashx responses saved as they were received from WodBuster
+(e.g. the body of a "Copy response" from the browser developer tools) or traffic archives
+recorded with WODBUSTER_RECORD_TRAFFIC (*.jsonl.gz), whose LoadClass.ashx responses are used.
+The schedule benchmark needs no payloads: it runs the Bookers and the background loops on a
+simulated clock, with stub scrapers and a temporary database. The sync benchmark writes
+synthetic data to the application database in a transaction that is rolled back.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+from flask import Flask
+from sqlalchemy.pool import NullPool
+from wodbooker import app, booker, clock, json_backend, notification_scheduler, recorder, scraper, _cleaning_loop
+from wodbooker.exceptions import BookingPenalization, ClassIsFull
+from wodbooker.models import db, Booking, Event, User, WodBusterBooking
+from wodbooker.scraper import Scraper
+from wodbooker.schedule import DaySchedule
+
+logging.basicConfig(format='%(asctime)s - %(threadName)s - %(message)s', level=logging.WARNING)
+
+
+def _load_payloads(paths):
+    payloads = []
+    for path in paths:
+        if path.endswith('.jsonl.gz'):
+            payloads.extend(recorder.load_responses(path, 'LoadClass.ashx'))
+            continue
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    return payloads
+
+
+def _time_per_payload(func, payloads, iterations):
+    """
+    Run func over every payload and return the average time per payload in microseconds
+    """
+    def run():
+        for payload in payloads:
+            func(payload)
+    best = min(timeit.repeat(run, number=iterations, repeat=3))
+    return best / (iterations * len(payloads)) * 1_000_000
+
+
+def _parse_day(payload):
+    response = scraper._json_loads(payload)
+    schedule = DaySchedule.from_response(response, datetime.date.today())
+    if schedule.descriptions_raw and schedule.descriptions_raw != '[]':
+        scraper._json_loads(schedule.descriptions_raw)
+    return schedule
+
+
+def benchmark_json(args):
+    """
+    Compare the JSON backends decoding LoadClass payloads. A sync fetches one LoadClass per day
+    and a window-open attempt one LoadClass plus the (small) enroll response
+    """
+    payloads = _load_payloads(args.payloads)
+    backends = ['json'] + (['orjson'] if json_backend.HAS_ORJSON else [])
+    if not json_backend.HAS_ORJSON:
+        print("orjson is not installed. Only the json backend is measured")
+
+    configured_backend = json_backend.JSON_BACKEND
+    print(f"{len(payloads)} payloads, average size {sum(map(len, payloads)) // len(payloads)} bytes")
+    print(f"{'backend':<10}{'decode (us)':>14}{'day (us)':>12}{'per sync (ms)':>16}{'per attempt (us)':>18}")
+    try:
+        for backend in backends:
+            json_backend.JSON_BACKEND = backend
+            decode = _time_per_payload(scraper._json_loads, payloads, args.iterations)
+            day = _time_per_payload(_parse_day, payloads, args.iterations)
+            enroll = _time_per_payload(scraper._json_loads,
+                                       [b'{"Res":{"EsCorrecto":true,"ErrorMsg":null}}'], args.iterations)
+            print(f"{backend:<10}{decode:>14.1f}{day:>12.1f}{day * args.days / 1000:>16.2f}{day + enroll:>18.1f}")
+    finally:
+        json_backend.JSON_BACKEND = configured_backend
+
+
+def _legacy_clean_html(text):
+    # Scraper._clean_html before the single-pass tokenizer
+    if not text:
+        return ""
+    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
+    text = text.replace('</p>', '\n')
+    text = re.sub(r'<[^<]+?>', '', text)
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return text.strip()
+
+
+def _legacy_split_training_header(description_clean):
+    # Header extraction of Scraper._parse_training_descriptions before the single-pass tokenizer
+    training_name = None
+    header_line_removed = False
+    if description_clean:
+        lines = description_clean.split('\n')
+        first_line = lines[0].strip() if lines else ''
+        for box_pattern in ['Mayanti Box', 'Box', 'CrossFit']:
+            if box_pattern in first_line:
+                training_name = first_line.split(box_pattern)[0].strip()
+                lines.pop(0)
+                if lines and not lines[0].strip():
+                    lines.pop(0)
+                description_clean = '\n'.join(lines).strip()
+                header_line_removed = True
+                break
+        if not training_name and first_line and not header_line_removed:
+            training_type_patterns = [
+                r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)(?=[A-Z])',
+                r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)\s+',
+                r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)$',
+            ]
+            for pattern in training_type_patterns:
+                match = re.match(pattern, first_line, re.IGNORECASE)
+                if match:
+                    training_name = match.group(1)
+                    lines.pop(0)
+                    if lines and not lines[0].strip():
+                        lines.pop(0)
+                    description_clean = '\n'.join(lines).strip()
+                    header_line_removed = True
+                    break
+    return training_name, description_clean, header_line_removed
+
+
+def _legacy_parse_description(description):
+    return _legacy_split_training_header(_legacy_clean_html(description))
+
+
+def _parse_description(description):
+    return Scraper._split_training_header(Scraper._clean_html(description))
+
+
+def benchmark_descriptions(args):
+    """
+    Compare the training description parser with the former implementation. Both must produce
+    the same output for every pizarra of the payloads
+    """
+    descriptions = []
+    for payload in _load_payloads(args.payloads):
+        clases_desc = scraper._json_loads(payload).get('ClasesDesc') or '[]'
+        descriptions.extend(pizarra.get('Descripcion', '') for pizarra in scraper._json_loads(clases_desc))
+    if not descriptions:
+        print("No training descriptions found in the payloads")
+        return 1
+
+    mismatches = [description for description in descriptions
+                  if _parse_description(description) != _legacy_parse_description(description)]
+    print(f"{len(descriptions)} descriptions, {len(mismatches)} with different output")
+    for description in mismatches[:5]:
+        print(f"  {description[:200]!r}")
+
+    legacy = _time_per_payload(_legacy_parse_description, descriptions, args.iterations)
+    current = _time_per_payload(_parse_description, descriptions, args.iterations)
+    print(f"{'parser':<10}{'us/description':>16}{'descriptions/s':>16}")
+    print(f"{'legacy':<10}{legacy:>16.1f}{1_000_000 / legacy:>16.0f}")
+    print(f"{'current':<10}{current:>16.1f}{1_000_000 / current:>16.0f}")
+    return 1 if mismatches else 0
+
+
+_SCHEDULE_BOX_URL = 'https://simulated.wodbuster.com'
+# Share of the first attempts of a window that find the class full or a penalization, so the
+# Bookers also run their event waits and penalization sleeps
+_SCHEDULE_FULL_SHARE = 0.1
+_SCHEDULE_PENALIZATION_SHARE = 0.1
+# Every Nth user has the push reminders enabled
+_SCHEDULE_REMINDER_USERS = 5
+
+
+class _EndingClock(clock.SimulatedClock):
+    """
+    Simulated clock ending each participant when it would sleep past the end of the simulation,
+    so the Bookers and the loops stop by themselves
+    """
+
+    def __init__(self, start, end):
+        super().__init__(start)
+        self._end = end.timestamp()
+
+    def sleep(self, seconds):
+        if self.time() + seconds >= self._end:
+            # Ends the thread silently
+            raise SystemExit()
+        super().sleep(seconds)
+
+
+class _ScheduleReport():
+    """
+    What the stub scrapers and the reminder sender observed during a schedule simulation
+    """
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.lock = threading.Lock()
+        self.attempts = 0
+        self.early_attempts = 0
+        self.booked = []
+        self.prewarms = 0
+        self.late_prewarms = 0
+        self.reminders = {}
+        self.duplicated_reminders = 0
+
+    def send_class_reminder(self, user, wodbuster_booking, reminder_minutes):
+        # Replaces push_notifications.send_class_reminder: no push service is called
+        class_at = booker._MADRID_TZ.localize(datetime.datetime.combine(wodbuster_booking.class_date,
+                                                                        wodbuster_booking.class_time))
+        key = (user.email, class_at, reminder_minutes)
+        with self.lock:
+            if key in self.reminders:
+                self.duplicated_reminders += 1
+            self.reminders[key] = clock.now(booker._MADRID_TZ)
+        return 1
+
+    def expected_reminders(self, reminder_users):
+        # A reminder is due when the class was booked at least one scheduler round before it
+        # and its round is within the simulation
+        round_duration = datetime.timedelta(seconds=60)
+        return {(email, class_at, minutes)
+                for email, class_at, booked_at in self.booked if email in reminder_users
+                for minutes in (60, 30, 15)
+                if booked_at + round_duration <= class_at - datetime.timedelta(minutes=minutes)
+                and class_at - datetime.timedelta(minutes=minutes) + round_duration <= self.end}
+
+
+class _StubScraper():
+    """
+    Scraper of a simulated user, for the Booker of its only booking. WodBuster answers at once
+    """
+
+    def __init__(self, email, booking_params, report):
+        self._email = email
+        self._offset, self._available_at = booking_params
+        self._report = report
+        self._attempts = {}
+
+    def _window(self, day_to_book):
+        return booker._MADRID_TZ.localize(datetime.datetime.combine(
+            day_to_book - datetime.timedelta(days=self._offset), self._available_at))
+
+    def prewarm(self, url, day_to_book, connections):
+        deadline = self._window(day_to_book) - datetime.timedelta(seconds=booker.PREWARM_SECONDS)
+        with self._report.lock:
+            self._report.prewarms += 1
+            # A window opening right after the start is prewarmed late on purpose
+            if deadline >= self._report.start and clock.now(booker._MADRID_TZ) != deadline:
+                self._report.late_prewarms += 1
+
+    def connection_state(self, url):
+        return "warm"
+
+    def book(self, url, datetime_to_book, type_class):
+        now = clock.now(booker._MADRID_TZ)
+        attempt = self._attempts[datetime_to_book] = self._attempts.get(datetime_to_book, 0) + 1
+        with self._report.lock:
+            self._report.attempts += 1
+            if now < self._window(datetime_to_book.date()):
+                self._report.early_attempts += 1
+        if attempt == 1:
+            outcome = random.random()
+            if outcome < _SCHEDULE_FULL_SHARE:
+                raise ClassIsFull("La clase está llena")
+            if outcome < _SCHEDULE_FULL_SHARE + _SCHEDULE_PENALIZATION_SHARE:
+                raise BookingPenalization(f"Podrás reservar en {random.randint(1, 10)} minutos")
+        with self._report.lock:
+            self._report.booked.append((self._email, datetime_to_book, now))
+        # What the box sync would mirror, so the notification scheduler sends its reminders
+        user = db.session.query(User).filter_by(email=self._email).one()
+        db.session.add(WodBusterBooking(user_id=user.id, class_id=attempt, class_date=datetime_to_book.date(),
+                                        class_time=datetime_to_book.time(), box_url=url))
+        return True
+
+    def wait_until_event(self, url, event_date, expected_events, max_datetime=None):
+        # Somebody cancels a booking a few minutes later, unless the class starts before
+        seconds = random.randint(30, 900)
+        if max_datetime:
+            seconds = min(seconds, (max_datetime - clock.now(booker._MADRID_TZ)).total_seconds())
+        clock.sleep(seconds)
+        return True
+
+    def get_cookies(self):
+        return ''
+
+    def get_cookie_expiration_date(self):
+        return None
+
+    def session_state_changed(self):
+        return False
+
+
+def _create_schedule_app(database_path):
+    # The simulation runs on its own database. Bookers sleep with connections checked out, so
+    # a pool limit would block the threads due and stop the clock
+    schedule_app = Flask(__name__)
+    schedule_app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    schedule_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': NullPool, 'connect_args': {'timeout': 60}}
+    db.init_app(schedule_app)
+    return schedule_app
+
+
+def _add_schedule_bookings(count, start):
+    # One user and booking per Booker, with events old enough for the cleaner
+    booking_params = {}
+    reminder_users = set()
+    for index in range(count):
+        booking_time = datetime.time(random.randint(6, 21), random.choice((0, 30)))
+        offset = random.randint(0, 3)
+        available_at = booking_time if offset else datetime.time(random.randint(0, booking_time.hour - 1))
+        reminders = index % _SCHEDULE_REMINDER_USERS == 0
+        user = User(email=f'simulated{index}@example.com', cookie='', push_notifications_enabled=reminders,
+                    push_reminder_1h=reminders, push_reminder_30m=reminders, push_reminder_15m=reminders)
+        booking = Booking(user=user, dow=random.randrange(7), time=booking_time, offset=offset,
+                          available_at=available_at, url=_SCHEDULE_BOX_URL, type_class=1, is_active=True)
+        db.session.add(booking)
+        db.session.add_all(Event(booking=booking, event=f"Simulated event {days} days ago",
+                                 date=start.replace(tzinfo=None) - datetime.timedelta(days=days))
+                           for days in (20, 17))
+        booking_params[user.email] = (offset, available_at)
+        if reminders:
+            reminder_users.add(user.email)
+    db.session.commit()
+    return booking_params, reminder_users
+
+
+def benchmark_schedule(args):
+    """
+    Run the Bookers of many bookings, the notification scheduler and the events cleaner for some
+    days on a simulated clock, against stub scrapers. Every window opening must be prewarmed at
+    its deadline and never attempted before, every reminder of a booked class must be sent once
+    within its round and the cleaner must remove the events older than 15 days
+    """
+    start = datetime.datetime.now(booker._MADRID_TZ).replace(microsecond=0)
+    end = start + datetime.timedelta(days=args.days)
+    report = _ScheduleReport(start, end)
+    simulated = _EndingClock(start, end)
+    patched = [(booker, 'get_scraper'), (booker, 'pin_scraper'), (booker, 'unpin_scraper'),
+               (notification_scheduler, 'send_class_reminder')]
+    originals = [getattr(module, name) for module, name in patched]
+    with tempfile.TemporaryDirectory() as directory:
+        schedule_app = _create_schedule_app(os.path.join(directory, 'schedule.sqlite'))
+        with schedule_app.app_context():
+            db.create_all()
+            booking_params, reminder_users = _add_schedule_bookings(args.bookings, start)
+            scrapers = {email: _StubScraper(email, params, report) for email, params in booking_params.items()}
+            threads = [booker.Booker(booking, schedule_app.app_context()) for booking in db.session.query(Booking)]
+            threads.append(threading.Thread(target=notification_scheduler._notification_scheduler_loop,
+                                            args=(schedule_app.app_context(),), name="notification_scheduler"))
+            threads.append(threading.Thread(target=_cleaning_loop, args=(schedule_app.app_context(),),
+                                            name="dbcleaner"))
+
+            booker.get_scraper = lambda email, cookie=None, session_state=None: scrapers[email]
+            booker.pin_scraper = booker.unpin_scraper = lambda email: None
+            notification_scheduler.send_class_reminder = report.send_class_reminder
+            previous_clock = clock.set_clock(simulated)
+            logging.disable(logging.WARNING)
+            wall_start = time.perf_counter()
+            try:
+                # The main thread holds the clock until every thread is running
+                with simulated.participant():
+                    for thread in threads:
+                        thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                logging.disable(logging.NOTSET)
+                clock.set_clock(previous_clock)
+                for (module, name), original in zip(patched, originals):
+                    setattr(module, name, original)
+            wall = time.perf_counter() - wall_start
+
+            expected = report.expected_reminders(reminder_users)
+            missing = expected - set(report.reminders)
+            off_round = [key for key, sent_at in report.reminders.items()
+                         if abs((sent_at - (key[1] - datetime.timedelta(minutes=key[2]))).total_seconds()) > 60]
+            old_events = db.session.query(Event).filter(
+                Event.date < start.replace(tzinfo=None) - datetime.timedelta(days=15)).count()
+
+    print(f"{args.bookings} bookings, {args.days} simulated days in {wall:.2f}s "
+          f"({args.days * 86400 / wall:.0f}x real time)")
+    print(f"{len(report.booked)} classes booked in {report.attempts} attempts, "
+          f"{report.early_attempts} before their window")
+    print(f"{report.prewarms} prewarms, {report.late_prewarms} off their deadline")
+    print(f"{len(report.reminders)} reminders sent, {len(missing)} missing, {len(off_round)} off their round, "
+          f"{report.duplicated_reminders} duplicated")
+    print(f"{old_events} of the {2 * args.bookings} events older than 15 days left by the cleaner")
+    # The first cleaning may run before the Bookers add newer events, and the last event of a
+    # booking is always kept, so the old events are only gone after the second one
+    failed = report.early_attempts or report.late_prewarms or missing or off_round or \
+        report.duplicated_reminders or (old_events and args.days > 1)
+    return 1 if failed else 0
+
+
+_SYNC_BOX_URL = 'https://benchmark.wodbuster.com'
+
+
+def _synthetic_week(days, bookings_per_day, descriptions_per_day):
+    # What get_day returns for a user with every day of the range booked
+    start = datetime.date.today()
+    week = {}
+    for offset in range(days):
+        class_date = start + datetime.timedelta(days=offset)
+        classes = [{'class_id': offset * 100 + index, 'date': class_date, 'time': datetime.time(7 + index),
+                    'class_name': 'WOD', 'class_type': 'wod'} for index in range(bookings_per_day)]
+        descriptions = [{'training_name': f'Training {index}', 'id_pizarra': offset * 100 + index,
+                         'description': f'Warm up\n{index + 1} rounds for time\n' * 4}
+                        for index in range(descriptions_per_day)]
+        week[class_date] = (classes, descriptions)
+    return week
+
+
+def _apply_orm(users, week):
+    # Former path: a savepoint per user and date, one ORM object per row
+    for user in users:
+        for class_date, (classes, _) in week.items():
+            with db.session.begin_nested():
+                booker._apply_booked_classes(user, _SYNC_BOX_URL, class_date, classes)
+    for class_date, (_, descriptions) in week.items():
+        with db.session.begin_nested():
+            booker._apply_training_descriptions(_SYNC_BOX_URL, class_date, descriptions)
+
+
+def _apply_bulk(users, week):
+    with db.session.begin_nested():
+        booker._upsert_booked_classes(_SYNC_BOX_URL, {(user.id, class_date): classes for user in users
+                                                      for class_date, (classes, _) in week.items()})
+        booker._upsert_training_descriptions({(_SYNC_BOX_URL, class_date): descriptions
+                                              for class_date, (_, descriptions) in week.items()})
+
+
+def _time_sync(apply, users, week, iterations, existing):
+    elapsed = 0
+    for _ in range(iterations):
+        savepoint = db.session.begin_nested()
+        if existing:
+            _apply_bulk(users, week)
+        # Every sync starts with an empty identity map, as in a new request or job
+        db.session.expire_all()
+        start = time.perf_counter()
+        apply(users, week)
+        elapsed += time.perf_counter() - start
+        savepoint.rollback()
+    return elapsed / iterations * 1000
+
+
+def benchmark_sync(args):
+    """
+    Compare the ORM and bulk upsert paths of the syncs writing the bookings and training
+    descriptions of a range of dates, for a first sync (inserts) and a resync (updates)
+    """
+    logging.getLogger('training_descriptions').setLevel(logging.WARNING)
+    week = _synthetic_week(args.days, args.bookings_per_day, args.descriptions_per_day)
+    with app.app_context():
+        try:
+            users = [User(email=f'benchmark{index}@example.com', cookie='', athlete_id=f'benchmark-{index}')
+                     for index in range(args.users)]
+            db.session.add_all(users)
+            db.session.flush()
+            # The descriptions are stored once for the box
+            rows = args.days * (args.users * args.bookings_per_day + args.descriptions_per_day)
+            print(f"{args.users} users, {args.days} days, {rows} rows per sync")
+            print(f"{'path':<8}{'first sync ms':>16}{'resync ms':>12}")
+            for name, apply in (('orm', _apply_orm), ('bulk', _apply_bulk)):
+                first = _time_sync(apply, users, week, args.iterations, existing=False)
+                resync = _time_sync(apply, users, week, args.iterations, existing=True)
+                print(f"{name:<8}{first:>16.2f}{resync:>12.2f}")
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='WodBooker parsing benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    json_parser = subparsers.add_parser('json', help='Compare JSON backends on LoadClass payloads')
+    json_parser.add_argument('payloads', nargs='+', help='Recorded LoadClass.ashx responses or traffic archives')
+    json_parser.add_argument('--iterations', type=int, default=200, help='Iterations per measurement')
+    json_parser.add_argument('--days', type=int, default=14, help='Days fetched per sync')
+    json_parser.set_defaults(func=benchmark_json)
+
+    descriptions_parser = subparsers.add_parser('descriptions',
+                                                help='Compare the training description parser with the former one')
+    descriptions_parser.add_argument('payloads', nargs='+', help='Recorded LoadClass.ashx responses or traffic archives')
+    descriptions_parser.add_argument('--iterations', type=int, default=200, help='Iterations per measurement')
+    descriptions_parser.set_defaults(func=benchmark_descriptions)
+
+    schedule_parser = subparsers.add_parser('schedule',
+                                            help='Run many Bookers, the reminders and the cleaner on a simulated clock')
+    schedule_parser.add_argument('--bookings', type=int, default=200, help='Simulated bookings, one Booker each')
+    schedule_parser.add_argument('--days', type=int, default=7, help='Simulated days')
+    schedule_parser.set_defaults(func=benchmark_schedule)
+
+    sync_parser = subparsers.add_parser('sync', help='Compare the ORM and bulk upsert paths of the syncs')
+    sync_parser.add_argument('--users', type=int, default=1, help='Users synced together (box sync)')
+    sync_parser.add_argument('--days', type=int, default=7, help='Synced days')
+    sync_parser.add_argument('--bookings-per-day', type=int, default=2, help='Booked classes per user and day')
+    sync_parser.add_argument('--descriptions-per-day', type=int, default=6, help='Training descriptions per day')
+    sync_parser.add_argument('--iterations', type=int, default=20, help='Iterations per measurement')
+    sync_parser.set_defaults(func=benchmark_sync)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
@@ -0,0 +1,5 @@
+-- Migration v1.13.0: Add session_state field to user table
+-- Stores the Cloudflare clearance cookies and box metadata of the WodBuster session (JSON)
+-- so a restarted instance can book without challenges or homepage scrapes
+
+ALTER TABLE user ADD COLUMN session_state TEXT;
@@ -0,0 +1,6 @@
+-- Migration v1.14.0: Add cookie_expires_at field to user table
+-- Stores the expiry of the WodBuster auth cookie (.WBAuth) so the session check of every request
+-- doesn't have to decode the stored cookies. Existing users are filled on their next request
+
+ALTER TABLE user ADD COLUMN cookie_expires_at DATETIME;
+CREATE INDEX ix_user_cookie_expires_at ON user (cookie_expires_at);
@@ -0,0 +1,14 @@
+-- Migration v1.15.0: Create sync_state table
+-- Stores the hash of the LoadClass.ashx content last synced for every user or box and date, so
+-- syncs skip the dates that haven't changed instead of rewriting their rows
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope VARCHAR(160) NOT NULL,
+    class_date DATE NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(scope, class_date)
+);
+
+CREATE INDEX IF NOT EXISTS ix_sync_state_class_date ON sync_state(class_date);
@@ -0,0 +1,29 @@
+-- Migration v1.16.0: Move the descriptions of class_training_description to box_training_description
+-- The pizarras of a date are the same for every athlete of a box, so they are stored once per
+-- box, date and id_pizarra instead of once per user
+
+-- Step 1: Create the box-scoped table
+CREATE TABLE IF NOT EXISTS box_training_description (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    box_url VARCHAR(128) NOT NULL,
+    class_date DATE NOT NULL,
+    training_name VARCHAR(128) NOT NULL,
+    description TEXT,
+    id_pizarra INTEGER NOT NULL,
+    fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(box_url, class_date, id_pizarra)
+);
+
+CREATE INDEX IF NOT EXISTS ix_box_training_description_class_date ON box_training_description(class_date);
+
+-- Step 2: Copy the per-user descriptions to every box their user has bookings in, as a user may
+-- book in several boxes. Rows are inserted from the oldest to the newest fetch, so the newest
+-- copy of a pizarra wins
+INSERT OR REPLACE INTO box_training_description (box_url, class_date, training_name, description, id_pizarra, fetched_at)
+SELECT b.url, ctd.class_date, ctd.training_name, ctd.description, ctd.id_pizarra, ctd.fetched_at
+FROM class_training_description ctd
+JOIN (SELECT DISTINCT user_id, url FROM booking WHERE url IS NOT NULL) b ON b.user_id = ctd.user_id
+ORDER BY ctd.fetched_at;
+
+-- class_training_description is no longer used but is kept, so the copy can be checked (or run
+-- again) before the table is dropped by a later migration
@@ -1,12 +1,9 @@
 import os
 import os.path as op
 from datetime import datetime, timedelta
-import time
 import threading
 import subprocess
-import pickle
 import requests
-import cloudscraper
 import logging
 from logging.handlers import TimedRotatingFileHandler
 from flask import Flask, redirect, request, session, g, jsonify, render_template, flash, url_for
@@ -15,14 +12,17 @@ from flask_admin import Admin
 import flask_login as login
 from flask_babel import Babel
 from flask_wtf.csrf import CSRFProtect
+from . import clock
 from .views import MyAdminIndexView, BookingAdmin, EventView, UserView
-from .models import User, Booking, Event, db, PushSubscription, WodBusterBooking
-from .booker import start_booking_loop, stop_booking_loop, is_booking_running, sync_wodbuster_bookings, _get_next_date_for_weekday, _MADRID_TZ
-from .scraper import refresh_scraper, get_scraper
+from .models import User, Booking, Event, db, PushSubscription, WodBusterBooking, SyncState
+from .booker import start_booking_loop, stop_booking_loop, is_booking_running, sync_all_boxes, _get_next_date_for_weekday, _MADRID_TZ
+from .scraper import refresh_scraper, get_scraper, get_scraper_stats, get_cookie_expiration_date
 from .constants import DAYS_OF_WEEK
 from .exceptions import InvalidWodBusterResponse, PasswordRequired, LoginError
 from .mailer import process_maling_queue
 from .notification_scheduler import _notification_scheduler_loop
+from .sync_jobs import submit_sync, get_sync_job, sync_worker_loop, SYNC_WORKERS, DONE, FAILED
+from .box_watcher import box_watch_loop, WATCH_DAYS
 
 # Configure logging
 # Create logs directory if it doesn't exist
@@ -235,15 +235,16 @@ def check_session_expired():
         if login.current_user.force_login:
             login.logout_user()
         else:
-            _session = cloudscraper.create_scraper()
-            _session.cookies.update(pickle.loads(login.current_user.cookie))
-            try:
-                expiration_timestamp = next(x for x in _session.cookies if x.name == '.WBAuth').expires
-                expiration_date = datetime.fromtimestamp(expiration_timestamp)
-                if datetime.now() > expiration_date:
-                    login.logout_user()
-            except (StopIteration, TypeError):
-                logging.exception("Error while getting expiration date of cookie")
+            user = login.current_user
+            if not user.cookie_expires_at and user.cookie:
+                # Users logged in before the expiry was stored on its own column
+                user.cookie_expires_at = get_cookie_expiration_date(user.cookie)
+                if user.cookie_expires_at:
+                    db.session.commit()
+                else:
+                    logging.error("Error while getting expiration date of cookie")
+            if user.cookie_expires_at and datetime.now() > user.cookie_expires_at:
+                login.logout_user()
 
 
 @app.before_request
@@ -511,36 +512,45 @@ def push_test():
         }), 500
 
 
+def _sync_job_response(job) -> dict:
+    response = {'success': job.status != FAILED, 'job_id': job.id, 'status': job.status}
+    if job.status == DONE:
+        result = job.result
+        response.update({
+            'new': result['new'],
+            'updated': result['updated'],
+            'cancelled': result['cancelled'],
+            'message': f"Sincronización completada: {result['new']} nuevas, {result['updated']} actualizadas, {result['cancelled']} canceladas"
+        })
+    elif job.status == FAILED:
+        response['error'] = "; ".join(job.result.get('errors') or [])
+    return response
+
+
 @app.route('/api/wodbuster/sync', methods=['POST'])
 @login.login_required
 @csrf.exempt
 def wodbuster_sync():
     """
-    Auto-sync WodBuster bookings endpoint (AJAX-compatible)
+    Auto-sync WodBuster bookings endpoint (AJAX-compatible). The sync runs in the background:
+    the response carries the job to poll, or the last result if the user was synced recently
     Note: Exempted from CSRF as it's already protected by login_required
     """
-    try:
-        result = sync_wodbuster_bookings(login.current_user)
-        if result['success']:
-            return jsonify({
-                'success': True,
-                'new': result['new'],
-                'updated': result['updated'],
-                'cancelled': result['cancelled'],
-                'message': f"Sincronización completada: {result['new']} nuevas, {result['updated']} actualizadas, {result['cancelled']} canceladas"
-            }), 200
-        else:
-            error_msg = "; ".join(result['errors'])
-            return jsonify({
-                'success': False,
-                'error': error_msg
-            }), 500
-    except Exception as e:
-        logging.exception("Error in sync endpoint")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    data = request.get_json(silent=True) or {}
+    job = submit_sync(login.current_user.id, force=bool(data.get('force')))
+    return jsonify(_sync_job_response(job)), 200 if job.is_finished else 202
+
+
+@app.route('/api/wodbuster/sync/<job_id>', methods=['GET'])
+@login.login_required
+def wodbuster_sync_status(job_id):
+    """
+    Status of a sync job of the current user
+    """
+    job = get_sync_job(job_id)
+    if not job or job.user_id != login.current_user.id:
+        return jsonify({'success': False, 'error': 'Sincronización no encontrada'}), 404
+    return jsonify(_sync_job_response(job)), 200
 
 
 @app.route('/weekly-classes')
@@ -560,7 +570,7 @@ def weekly_classes():
         else:
             # Try to get box URL directly
             try:
-                scraper = get_scraper(user.email, user.cookie)
+                scraper = get_scraper(user.email, user.cookie, user.session_state)
                 box_url = scraper.get_box_url()
             except Exception as e:
                 logging.warning("Could not get box URL for user %s: %s", user.email, str(e))
@@ -596,7 +606,7 @@ def weekly_classes():
             start_date = start_date + timedelta(days=7)
         
         # Get scraper and fetch week classes
-        scraper = get_scraper(user.email, user.cookie)
+        scraper = get_scraper(user.email, user.cookie, user.session_state)
         athlete_id = user.athlete_id if user.athlete_id else None
         
         week_classes = scraper.get_week_classes(box_url, start_date, athlete_id)
@@ -623,9 +633,9 @@ def weekly_classes():
         for date, classes in week_classes.items():
             processed_classes[date] = []
             for cls in classes:
-                id_e = cls.get('IdE')
+                id_e = cls.type_id
                 # Use NombreE from JSON as the friendly name
-                friendly_name = cls.get('NombreE', f'Type {id_e}')
+                friendly_name = cls.name
                 # Get color: first check by name (uppercase), then by ID, default to gray
                 friendly_name_upper = friendly_name.upper()
                 if friendly_name_upper in class_color_map_by_name:
@@ -633,11 +643,11 @@ def weekly_classes():
                 else:
                     color = class_color_map_by_id.get(id_e, '#64748b')
                 processed_classes[date].append({
-                    'time': cls.get('Hora', ''),
+                    'time': cls.hour,
                     'name': friendly_name,
                     'type': friendly_name,
                     'color': color,
-                    'id': cls.get('Id'),
+                    'id': cls.id,
                     'id_e': id_e
                 })
             # Sort classes by time
@@ -673,41 +683,89 @@ admin.add_view(BookingAdmin(Booking, db.session, 'Reservas'))
 admin.add_view(EventView(Event, db.session, 'Eventos'))
 admin.add_view(UserView(User, db.session, 'Preferencias'))
 
-# Start booking loop
-with app.app_context():
-    _bookings = db.session.query(Booking).all()
-    for _booking in _bookings:
-        if _booking.is_active:
-            start_booking_loop(_booking)
-
-# Start events cleaning loop
+# Events cleaning loop
 def _cleaning_loop(app_context):
     app_context.push()
-    with app_context:
+    with app_context, clock.participant():
         while True:
             high_level_logger.info("Cleaning events older than 15 days")
             bookings = db.session.query(Booking).all()
             for booking in bookings:
-                events_older_than_15_days = list(filter(lambda x: x.date < datetime.now() - timedelta(days=15),
+                events_older_than_15_days = list(filter(lambda x: x.date < clock.now() - timedelta(days=15),
                                                         booking.events[:-1]))
                 events_older_than_15_days = sorted(events_older_than_15_days, key=lambda x: x.date)
                 for event in events_older_than_15_days:
                     db.session.delete(event)
+            db.session.query(SyncState).filter(SyncState.class_date < clock.now().date() - timedelta(days=15)) \
+                .delete(synchronize_session=False)
             db.session.commit()
-            time.sleep(60 * 60 * 24)
-
-thread_cleaner = threading.Thread(target=_cleaning_loop,
-                                  args=(app.app_context(),),
-                                  daemon=True, name="dbcleaner")
-thread_cleaner.start()
-
-thread_mailer = threading.Thread(target=process_maling_queue,
-                                 args=(app.app_context(),),
-                                 daemon=True, name="mailer")
-thread_mailer.start()
-
-# Start notification scheduler loop
-thread_notification_scheduler = threading.Thread(target=_notification_scheduler_loop,
-                                                 args=(app.app_context(),),
-                                                 daemon=True, name="notification_scheduler")
-thread_notification_scheduler.start()
+            high_level_logger.info("Scraper registry stats: %s", get_scraper_stats())
+            clock.sleep(60 * 60 * 24)
+
+
+# Box sync loop: WodBusterBooking of every user, one request per box and date
+_BOX_SYNC_MINUTES = int(os.environ.get('WODBUSTER_BOX_SYNC_MINUTES', '60'))
+
+def _box_sync_loop(app_context):
+    app_context.push()
+    with app_context, clock.participant():
+        while True:
+            try:
+                results = sync_all_boxes()
+                high_level_logger.info("Box sync: %s", {box_url: {key: result[key] for key in ('users', 'dates', 'skipped', 'new', 'updated', 'cancelled')}
+                                                        for box_url, result in results.items()})
+            except Exception:
+                logging.exception("Unexpected error in box sync loop")
+                db.session.rollback()
+            clock.sleep(_BOX_SYNC_MINUTES * 60)
+
+
+def start_background_tasks():
+    """
+    Start the booking loops of the active bookings and the background threads of the app: the
+    events cleaner, the box sync and watcher, the sync workers, the mailer and the notification
+    scheduler. Called by the entry point of the app, so importing the package (e.g. from
+    benchmark.py) doesn't start them
+    """
+    # Start booking loop
+    with app.app_context():
+        for booking in db.session.query(Booking).all():
+            if booking.is_active:
+                start_booking_loop(booking)
+
+    # Start events cleaning loop
+    thread_cleaner = threading.Thread(target=_cleaning_loop,
+                                      args=(app.app_context(),),
+                                      daemon=True, name="dbcleaner")
+    thread_cleaner.start()
+
+    # Start box sync loop
+    if _BOX_SYNC_MINUTES > 0:
+        thread_box_sync = threading.Thread(target=_box_sync_loop,
+                                           args=(app.app_context(),),
+                                           daemon=True, name="boxsync")
+        thread_box_sync.start()
+
+    # Start box watcher: sync the dates of the booking hub events of every box
+    if WATCH_DAYS > 0:
+        thread_box_watch = threading.Thread(target=box_watch_loop,
+                                            args=(app.app_context(),),
+                                            daemon=True, name="boxwatch")
+        thread_box_watch.start()
+
+    # Start sync workers for the syncs requested from the web
+    for worker in range(SYNC_WORKERS):
+        threading.Thread(target=sync_worker_loop,
+                         args=(app.app_context(),),
+                         daemon=True, name=f"syncworker-{worker}").start()
+
+    thread_mailer = threading.Thread(target=process_maling_queue,
+                                     args=(app.app_context(),),
+                                     daemon=True, name="mailer")
+    thread_mailer.start()
+
+    # Start notification scheduler loop
+    thread_notification_scheduler = threading.Thread(target=_notification_scheduler_loop,
+                                                     args=(app.app_context(),),
+                                                     daemon=True, name="notification_scheduler")
+    thread_notification_scheduler.start()
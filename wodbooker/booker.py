@@ -2,25 +2,26 @@ from datetime import datetime, timedelta, date, time
 from abc import ABC, abstractmethod
 import random
 import logging
-import time as time_module
 import threading
 import pytz
 import os
 from flask import current_app as app
 from func_timeout import StoppableThread
 from requests.exceptions import RequestException
+from sqlalchemy import select, update, delete, tuple_
 from .constants import EventMessage, UNEXPECTED_ERROR_MAIL_SUBJECT, \
     UNEXPECTED_ERROR_MAIL_BODY, FULL_CLASS_BOOKED_MAIL_SUBJECT, \
     FULL_CLASS_BOOKED_MAIL_BODY, ERROR_AUTOHEALED_MAIL_SUBJECT, \
     ERROR_AUTOHEALED_MAIL_BODY, CLASS_BOOKED_MAIL_SUBJECT, \
     CLASS_BOOKED_MAIL_BODY
-from .scraper import get_scraper, Scraper
+from . import clock
+from .scraper import get_scraper, pin_scraper, unpin_scraper, wait_for_host, Scraper
 from .mailer import send_email, ErrorEmail, SuccessAfterErrorEmail, SuccessEmail
 from .push_notifications import send_booking_status_notification
 from .exceptions import BookingNotAvailable, InvalidWodBusterResponse, \
     ClassIsFull, LoginError, PasswordRequired, InvalidBox, \
-    ClassNotFound, BookingFailed, BookingPenalization, BookingLockedException
-from .models import db, Booking, Event, User, WodBusterBooking, ClassTrainingDescription
+    ClassNotFound, BookingFailed, BookingPenalization, BookingLockedException, HostUnavailable
+from .models import db, upsert_rows, Booking, Event, User, WodBusterBooking, BoxTrainingDescription, SyncState
 import re
 
 # Import high-level logger for important business events
@@ -49,6 +50,11 @@ _MAX_BOOKING_ATTEMPTS = 20
 GLOBAL_BOOKING_INTERVAL = 0.5
 BOOKING_RETRY_DELAY = 1
 BOOKING_LOCKED_DELAY = 0.2
+# Seconds before a booking window opens when connections to WodBuster are pre-warmed
+PREWARM_SECONDS = 5
+# Syncs write their whole date range with bulk INSERT ... ON CONFLICT statements instead of one
+# ORM object per row and date. WODBUSTER_SYNC_BULK_UPSERT=false goes back to the ORM path
+_SYNC_BULK_UPSERT = os.getenv('WODBUSTER_SYNC_BULK_UPSERT', 'true').lower() == 'true'
 
 __CURRENT_THREADS = {
 }
@@ -78,7 +84,7 @@ def _get_datetime_to_book(last_booking_date: date, dow: int, booking_time: time)
     :param booking_time: The time to book
     :return: The datetime to book
     """
-    now = datetime.now(_MADRID_TZ)
+    now = clock.now(_MADRID_TZ)
     today = now.date()
     
     # First, check if we can book for today
@@ -118,6 +124,7 @@ class Booker(StoppableThread):
         self._booking_id = booking.id
         self._session = None
         self._app_context = app_context
+        self._book_available_at = None
         self.name = f"Booker {self._booking_id}"
 
     def _wait_for_booking_window(self, waiter, day_to_book):
@@ -125,14 +132,31 @@ class Booker(StoppableThread):
             datetime.combine(
                 day_to_book - timedelta(days=self._booking.offset),
                 self._booking.available_at))
+        self._book_available_at = book_available_at
 
-        waiter = waiter or _TimeWaiter(self._booking, EventMessage.WAIT_UNTIL_BOOKING_OPEN % (book_available_at.strftime('%d/%m/%Y a las %H:%M:%S'),
-                                                                                                        day_to_book.strftime('%d/%m/%Y')),
-                                                book_available_at)
         if waiter:
             waiter.wait()
+            return None
+
+        log_message = EventMessage.WAIT_UNTIL_BOOKING_OPEN % (book_available_at.strftime('%d/%m/%Y a las %H:%M:%S'),
+                                                              day_to_book.strftime('%d/%m/%Y'))
+        _TimeWaiter(self._booking, log_message, book_available_at - timedelta(seconds=PREWARM_SECONDS)).wait()
+        if clock.now(_MADRID_TZ) < book_available_at:
+            self._prewarm(day_to_book, book_available_at)
+        _TimeWaiter(self._booking, log_message, book_available_at).wait()
         return None
 
+    def _prewarm(self, day_to_book, book_available_at):
+        """
+        Warm up the connections to WodBuster right before the booking window opens, so the
+        first booking request does not pay for DNS, TCP and TLS handshakes
+        :param day_to_book: The day of the class to book
+        :param book_available_at: The datetime when the booking window opens
+        """
+        connections = _count_bookings_due(self._booking.user_id, self._booking.url, book_available_at)
+        scraper = get_scraper(self._booking.user.email, self._booking.user.cookie, self._booking.user.session_state)
+        scraper.prewarm(self._booking.url, day_to_book, connections)
+
     def _attempt_booking(self, datetime_to_book, scraper):
         booking_successful = False
         force_exit = False
@@ -143,7 +167,7 @@ class Booker(StoppableThread):
             except BookingLockedException as e:
                 logging.warning("Booking locked for user %s: %s. Retrying in %.2f second...",
                                 self._booking.user.email, str(e), BOOKING_LOCKED_DELAY)
-                time_module.sleep(BOOKING_LOCKED_DELAY)
+                clock.sleep(BOOKING_LOCKED_DELAY)
                 continue
         return booking_successful
 
@@ -165,14 +189,37 @@ class Booker(StoppableThread):
         send_email(self._booking.user, email)
 
         self._booking.last_book_date = day_to_book
-        self._booking.booked_at = datetime.now().replace(microsecond=0)
+        self._booking.booked_at = clock.now().replace(microsecond=0)
         self._booking.user.cookie = scraper.get_cookies()
+        self._booking.user.cookie_expires_at = scraper.get_cookie_expiration_date()
         return event, errors, class_is_full_notification_sent
 
+    def _log_attempt(self, connection_state, successful):
+        """
+        Report the connection state used for a booking attempt together with the time elapsed
+        since the booking window opened (time-to-seat)
+        :param connection_state: "warm" or "cold" as reported by the scraper before the attempt
+        :param successful: Whether the attempt got the seat
+        """
+        time_to_seat = (clock.now(_MADRID_TZ) - self._book_available_at).total_seconds() \
+            if self._book_available_at else None
+        high_level_logger.info("Booking attempt for user %s (booking %s) used a %s connection. Successful: %s. Time since window opened: %s",
+                               self._booking.user.email, self._booking.id, connection_state, successful,
+                               f"{time_to_seat:.3f}s" if time_to_seat is not None else "unknown")
+
     def run(self) -> None:
+        # The booking loop only moves a simulated clock when it sleeps
+        with clock.participant():
+            self._run()
+
+    def _run(self) -> None:
+        pinned_email = None
         try:
             self._app_context.push()
             self._booking = db.session.query(Booking).filter_by(id=self._booking_id).first()
+            # Keep the scraper (and its warm connections) while the thread is running
+            pinned_email = self._booking.user.email
+            pin_scraper(pinned_email)
             errors = 0
             force_exit = False
             waiter = None
@@ -191,7 +238,7 @@ class Booker(StoppableThread):
 
                         # Add another sleep here in case we are trying to make multiple books due to previous penalizations
                         logging.info("Sleeping for %s seconds", sleep_milliseconds)
-                        time_module.sleep(sleep_milliseconds)
+                        clock.sleep(sleep_milliseconds)
 
                         # Continue after the sleep
                         event = Event(booking_id=self._booking.id,
@@ -212,31 +259,41 @@ class Booker(StoppableThread):
                     # Check if user has priority - non-priority users wait 1 second
                     if self._booking.user.email not in PRIORITY_USERS:
                         logging.info("User %s is not in priority list, waiting 1 second before booking", self._booking.user.email)
-                        time_module.sleep(1)
+                        clock.sleep(1)
                     else:
                         high_level_logger.info("User %s has priority, proceeding with booking immediately", self._booking.user.email)
 
-                    # Use coordinator to ensure 1-second minimum interval between bookings
+                    # Use coordinator to ensure a minimum interval between bookings. The turn is
+                    # reserved under the lock and waited for outside it: the Bookers queued behind
+                    # sleep on the clock instead of blocking on the lock (which would also stop a
+                    # simulated clock)
                     with _GLOBAL_BOOKING_LOCK:
                         global _LAST_GLOBAL_BOOKING_TIME
-                        now = datetime.now(_MADRID_TZ)
+                        now = clock.now(_MADRID_TZ)
+                        booking_turn = now
                         if _LAST_GLOBAL_BOOKING_TIME:
-                            time_since_last = (now - _LAST_GLOBAL_BOOKING_TIME).total_seconds()
-                            if time_since_last < GLOBAL_BOOKING_INTERVAL:
-                                sleep_time = GLOBAL_BOOKING_INTERVAL - time_since_last
-                                logging.info("Waiting %.2f seconds to maintain %.2f-second global booking interval", sleep_time, GLOBAL_BOOKING_INTERVAL)
-                                time_module.sleep(sleep_time)
-                        
-                        _LAST_GLOBAL_BOOKING_TIME = datetime.now(_MADRID_TZ)
+                            booking_turn = max(now, _LAST_GLOBAL_BOOKING_TIME + timedelta(seconds=GLOBAL_BOOKING_INTERVAL))
+                        _LAST_GLOBAL_BOOKING_TIME = booking_turn
+
+                    sleep_time = (booking_turn - now).total_seconds()
+                    if sleep_time > 0:
+                        logging.info("Waiting %.2f seconds to maintain %.2f-second global booking interval", sleep_time, GLOBAL_BOOKING_INTERVAL)
+                        clock.sleep(sleep_time)
 
                     # Refresh the scraper in case a new one is avaiable
-                    scraper = get_scraper(self._booking.user.email, self._booking.user.cookie)
+                    scraper = get_scraper(self._booking.user.email, self._booking.user.cookie, self._booking.user.session_state)
 
                     # generate a random number in milliseconds to avoid being detected as a bot
                     logging.info("Sleeping for %s seconds", sleep_milliseconds)
-                    time_module.sleep(sleep_milliseconds)
+                    clock.sleep(sleep_milliseconds)
 
-                    if self._attempt_booking(datetime_to_book, scraper):
+                    connection_state = scraper.connection_state(self._booking.url)
+                    booking_successful = False
+                    try:
+                        booking_successful = self._attempt_booking(datetime_to_book, scraper)
+                    finally:
+                        self._log_attempt(connection_state, booking_successful)
+                    if booking_successful:
                         event, errors, class_is_full_notification_sent = self._handle_successful_booking(day_to_book, scraper, errors, class_is_full_notification_sent)
 
                     # Send push notification for successful booking
@@ -256,7 +313,7 @@ class Booker(StoppableThread):
                         event = Event(booking_id=self._booking.id, event=EventMessage.CLASS_NOT_FOUND % (datetime_to_book.strftime("%d/%m/%Y"), datetime_to_book.strftime("%H:%M:%S")))
                         _add_event(event)
                     else:
-                        time_module.sleep(BOOKING_RETRY_DELAY)
+                        clock.sleep(BOOKING_RETRY_DELAY)
 
                 # In some boxes a penalty can be set in place when people make a book cancellation
                 # This should be managed in the scraper.py book function but I don't really know
@@ -281,11 +338,11 @@ class Booker(StoppableThread):
                     
                     if wait_time:
                         logging.info(f"Waiting for {wait_time} seconds due to penalization.")
-                        time_module.sleep(wait_time)
+                        clock.sleep(wait_time)
                     else:
                         # The minimum wait are 10 seconds, therefore let's sleep the thread for 10 seconds
-                        time_module.sleep(10)
-                        time_module.sleep(sleep_milliseconds)
+                        clock.sleep(10)
+                        clock.sleep(sleep_milliseconds)
                         waiter = _EventWaiter(self._booking, EventMessage.BOOKING_PENALIZATION % e,
                                           scraper, self._booking.url, day_to_book, ['changedBooking'], datetime_to_book)
                 except BookingFailed as e:
@@ -322,11 +379,18 @@ class Booker(StoppableThread):
                                               scraper, self._booking.url, day_to_book,
                                               ['changedPizarra', 'changedBooking'], datetime_to_book)
                     continue
+                except HostUnavailable as e:
+                    logging.warning("WodBuster host %s is unavailable. Waiting until it is back", e.host)
+                    waiter = _HostWaiter(self._booking, EventMessage.HOST_UNAVAILABLE, e.host, datetime_to_book)
+                    if errors == 0:
+                        send_email(self._booking.user, ErrorEmail(self._booking, UNEXPECTED_ERROR_MAIL_SUBJECT,
+                                                                  UNEXPECTED_ERROR_MAIL_BODY))
+                    errors += 1
                 except RequestException as e:
                     sleep_for = (errors + 1) * 60
                     logging.warning("Request Exception: %s", e)
                     waiter = _TimeWaiter(self._booking, EventMessage.UNEXPECTED_NETWORK_ERROR % sleep_for,
-                                            datetime.now(_MADRID_TZ) + timedelta(seconds=sleep_for))
+                                            clock.now(_MADRID_TZ) + timedelta(seconds=sleep_for))
                     if errors == 0:
                         send_email(self._booking.user, ErrorEmail(self._booking, UNEXPECTED_ERROR_MAIL_SUBJECT,
                                                                   UNEXPECTED_ERROR_MAIL_BODY))
@@ -336,7 +400,7 @@ class Booker(StoppableThread):
                     sleep_for = (errors + 1) * 60
                     logging.warning("Invalid WodBuster response: %s", e)
                     waiter = _TimeWaiter(self._booking, EventMessage.UNEXPECTED_WODBUSTER_RESPONSE % sleep_for,
-                                         datetime.now(_MADRID_TZ) + timedelta(seconds=sleep_for))
+                                         clock.now(_MADRID_TZ) + timedelta(seconds=sleep_for))
                     if errors == 0:
                         send_email(self._booking.user, ErrorEmail(self._booking, UNEXPECTED_ERROR_MAIL_SUBJECT,
                                                                   UNEXPECTED_ERROR_MAIL_BODY))
@@ -363,6 +427,7 @@ class Booker(StoppableThread):
                     _add_event(event)
                     send_email(self._booking.user, ErrorEmail(self._booking, "Box inválido", event.event))
                 finally:
+                    _save_session_state(self._booking.user)
                     db.session.commit()
 
             if errors >= _MAX_ERRORS:
@@ -375,6 +440,9 @@ class Booker(StoppableThread):
             logging.info("Thread %s has been stopped", self._name)
         except Exception:
             logging.exception("Unexpected error while booking. Aborting...")
+        finally:
+            if pinned_email:
+                unpin_scraper(pinned_email)
 
 
 class _Waiter(ABC):
@@ -412,15 +480,15 @@ class _TimeWaiter(_Waiter):
         """
         Wait until the provided date is reached
         """
-        if self._wait_datetime > datetime.now(_MADRID_TZ):
+        if self._wait_datetime > clock.now(_MADRID_TZ):
             high_level_logger.info("Waiting until %s", self._wait_datetime.strftime('%d/%m/%Y %H:%M:%S'))
             event = Event(booking_id=self.booking.id, event=self.log_message)
             _add_event(event)
             db.session.commit()
-            # Calculate seconds to wait and use time.sleep instead of pause.until
-            seconds_to_wait = (self._wait_datetime - datetime.now(_MADRID_TZ)).total_seconds()
+            # Calculate seconds to wait and sleep on the clock instead of pause.until
+            seconds_to_wait = (self._wait_datetime - clock.now(_MADRID_TZ)).total_seconds()
             if seconds_to_wait > 0:
-                time_module.sleep(seconds_to_wait)
+                clock.sleep(seconds_to_wait)
 
 
 class _EventWaiter(_Waiter):
@@ -455,6 +523,62 @@ class _EventWaiter(_Waiter):
                                        self._max_datetime)
 
 
+class _HostWaiter(_Waiter):
+
+    def __init__(self, booking: Booking, log_message: str, host: str, max_datetime: datetime):
+        """
+        Host Waiter construction
+        :param booking: The booking the waiter is related to
+        :param log_message: The message related to the waiter
+        :param host: The unavailable WodBuster host
+        :param max_datetime: The maximum datetime to wait for
+        """
+        super().__init__(booking, log_message)
+        self._host = host
+        self._max_datetime = max_datetime
+
+    def wait(self):
+        """
+        Wait until the host is available again (all the waiting Bookers are released at once) or
+        a probe request can be sent
+        """
+        event = Event(booking_id=self.booking.id, event=self.log_message)
+        _add_event(event)
+        db.session.commit()
+        wait_for_host(self._host, max((self._max_datetime - clock.now(_MADRID_TZ)).total_seconds(), 0))
+
+
+def _count_bookings_due(user_id: int, url: str, book_available_at: datetime) -> int:
+    """
+    Count the active bookings of a user whose booking window opens at the given datetime
+    :param user_id: The user owning the bookings
+    :param url: The WodBuster URL of the box
+    :param book_available_at: The datetime when the booking window opens
+    :return: The number of bookings that will be attempted at the same time (at least 1)
+    """
+    bookings = db.session.query(Booking).filter_by(user_id=user_id, url=url, is_active=True).all()
+    due = 0
+    for booking in bookings:
+        book_time = time(booking.time.hour, booking.time.minute, 0)
+        day_to_book = _get_datetime_to_book(booking.last_book_date, booking.dow, book_time).date()
+        available_at = _MADRID_TZ.localize(
+            datetime.combine(day_to_book - timedelta(days=booking.offset), booking.available_at))
+        if available_at == book_available_at:
+            due += 1
+    return max(due, 1)
+
+
+def _save_session_state(user: User) -> None:
+    """
+    Write back the session state of the user scraper (clearance cookies and box metadata) when it
+    has changed, so it survives restarts. The caller commits the session
+    :param user: The user owning the scraper
+    """
+    scraper = get_scraper(user.email, user.cookie, user.session_state)
+    if scraper.session_state_changed():
+        user.session_state = scraper.get_session_state()
+
+
 def _add_event(event: Event) -> None:
     """
     Add the evnet to the session only when the last event is different
@@ -515,12 +639,155 @@ def is_booking_running(booking: Booking) -> bool:
     return booking.id in __CURRENT_THREADS and __CURRENT_THREADS[booking.id].is_alive()
 
 
-def sync_training_descriptions_for_date(user: User, target_date: date, box_url: str = None) -> dict:
+def _apply_booked_classes(user: User, box_url: str, target_date: date, booked_classes: list) -> tuple:
     """
-    Sync training descriptions for a specific date.
-    :param user: The user to sync training descriptions for
+    Mirror the classes booked by a user on a given date into WodBusterBooking
+    :param user: The user the bookings belong to
+    :param box_url: The WodBuster URL of the box
+    :param target_date: The date of the classes
+    :param booked_classes: The booked classes as returned by the scraper
+    :return: A tuple with the number of new, updated and cancelled bookings
+    """
+    # Get existing bookings for this date
+    existing_bookings = {
+        wb.class_id: wb
+        for wb in db.session.query(WodBusterBooking).filter_by(
+            user_id=user.id,
+            class_date=target_date
+        ).all()
+    }
+
+    # Track which bookings we found in the API response
+    found_class_ids = set()
+    new_count = 0
+    updated_count = 0
+    cancelled_count = 0
+
+    for class_info in booked_classes:
+        class_id = class_info['class_id']
+        class_time = class_info['time']
+        found_class_ids.add(class_id)
+
+        # Check if booking already exists
+        if class_id in existing_bookings:
+            # Update existing booking
+            existing = existing_bookings[class_id]
+            existing.class_name = class_info.get('class_name')
+            existing.class_type = class_info.get('class_type')
+            existing.fetched_at = clock.now()
+            existing.is_cancelled = False
+            updated_count += 1
+        else:
+            # Create new booking
+            new_booking = WodBusterBooking(
+                user_id=user.id,
+                class_id=class_id,
+                class_date=target_date,
+                class_time=class_time,
+                class_name=class_info.get('class_name'),
+                class_type=class_info.get('class_type'),
+                box_url=box_url,
+                fetched_at=clock.now(),
+                is_cancelled=False
+            )
+            db.session.add(new_booking)
+            new_count += 1
+
+    # Mark bookings as cancelled if they're no longer in the API response
+    for class_id, existing_booking in existing_bookings.items():
+        if class_id not in found_class_ids:
+            existing_booking.is_cancelled = True
+            existing_booking.fetched_at = clock.now()
+            cancelled_count += 1
+
+    return new_count, updated_count, cancelled_count
+
+
+def _apply_training_descriptions(box_url: str, target_date: date, training_descriptions: list) -> tuple:
+    """
+    Mirror the training descriptions of a given date into BoxTrainingDescription
+    :param box_url: The WodBuster URL of the box the descriptions belong to
+    :param target_date: The date of the descriptions
+    :param training_descriptions: The training descriptions as returned by the scraper
+    :return: A tuple with the number of new, updated and deleted descriptions
+    """
+    # Get existing training descriptions for this date
+    # Use id_pizarra as the key since multiple pizarras can have the same name
+    existing_descriptions = {
+        td.id_pizarra: td
+        for td in db.session.query(BoxTrainingDescription).filter_by(
+            box_url=box_url,
+            class_date=target_date
+        ).all()
+        if td.id_pizarra is not None  # Only include records with id_pizarra
+    }
+    training_desc_logger.info("Found %d existing training descriptions in DB for date %s",
+                len(existing_descriptions), target_date)
+
+    # Track which training descriptions we found (by id_pizarra)
+    found_id_pizarras = set()
+    new_count = 0
+    updated_count = 0
+
+    for training_info in training_descriptions:
+        training_name = training_info['training_name']
+        id_pizarra = training_info.get('id_pizarra')
+
+        # Skip if no id_pizarra (shouldn't happen, but be safe)
+        if id_pizarra is None:
+            logging.warning("Skipping training description without id_pizarra: %s for date %s",
+                         training_name, target_date)
+            continue
+
+        found_id_pizarras.add(id_pizarra)
+
+        if id_pizarra in existing_descriptions:
+            # Update existing training description
+            existing = existing_descriptions[id_pizarra]
+            existing.training_name = training_name  # Update name in case it changed
+            existing.description = training_info.get('description')
+            existing.fetched_at = clock.now()
+            updated_count += 1
+            training_desc_logger.info("Updated training description: %s (id_pizarra: %s) for date %s",
+                       training_name, id_pizarra, target_date)
+        else:
+            # Create new training description
+            new_description = BoxTrainingDescription(
+                box_url=box_url,
+                class_date=target_date,
+                training_name=training_name,
+                description=training_info.get('description'),
+                id_pizarra=id_pizarra,
+                fetched_at=clock.now()
+            )
+            db.session.add(new_description)
+            new_count += 1
+            training_desc_logger.info("Created new training description: %s (id_pizarra: %s) for date %s",
+                       training_name, id_pizarra, target_date)
+
+    # Delete training descriptions that are no longer in the API response
+    deleted_count = 0
+    for id_pizarra, existing_desc in existing_descriptions.items():
+        if id_pizarra not in found_id_pizarras:
+            db.session.delete(existing_desc)
+            deleted_count += 1
+            training_desc_logger.info("Deleted training description: %s (id_pizarra: %s) for date %s (no longer in API)",
+                       existing_desc.training_name, id_pizarra, target_date)
+
+    training_desc_logger.info("Training descriptions sync for date %s: %d new, %d updated, %d deleted",
+               target_date, new_count, updated_count, deleted_count)
+    return new_count, updated_count, deleted_count
+
+
+def sync_training_descriptions_for_date(user: User, target_date: date, box_url: str = None, day: dict = None) -> dict:
+    """
+    Sync training descriptions for a specific date. They are stored for the box, so the users of
+    the same box share them.
+    :param user: The user whose session fetches the training descriptions
     :param target_date: The date to sync training descriptions for
     :param box_url: Optional box URL (if not provided, will be fetched)
+    :param day: Optional day already fetched with Scraper.get_day for the same date, to avoid
+    requesting it again
     :return: Dictionary with sync results: {'success': bool, 'new': int, 'updated': int, 'deleted': int, 'errors': list}
     """
     if not user.athlete_id:
@@ -534,7 +801,7 @@ def sync_training_descriptions_for_date(user: User, target_date: date, box_url:
             box_url = last_booking.url
         else:
             try:
-                scraper = get_scraper(user.email, user.cookie)
+                scraper = get_scraper(user.email, user.cookie, user.session_state)
                 box_url = scraper.get_box_url()
             except Exception as e:
                 logging.warning("Could not get box URL for user %s: %s", user.email, str(e))
@@ -544,77 +811,21 @@ def sync_training_descriptions_for_date(user: User, target_date: date, box_url:
         return {'success': False, 'new': 0, 'updated': 0, 'deleted': 0, 'errors': ['No box URL available']}
     
     try:
-        scraper = get_scraper(user.email, user.cookie)
-        training_desc_logger.info("Fetching training descriptions for user %s, date %s", user.email, target_date)
-        training_descriptions = scraper.get_training_descriptions(box_url, user.athlete_id, target_date)
+        if day is None:
+            scraper = get_scraper(user.email, user.cookie, user.session_state)
+            training_desc_logger.info("Fetching training descriptions for user %s, date %s", user.email, target_date)
+            day = scraper.get_day(box_url, user.athlete_id, target_date)
+        training_descriptions = day['training_descriptions']
+        if training_descriptions is None:
+            return {'success': False, 'new': 0, 'updated': 0, 'deleted': 0,
+                    'errors': [f'Could not parse the training descriptions of {target_date}']}
         training_desc_logger.info("Retrieved %d training descriptions from API for date %s", 
                     len(training_descriptions), target_date)
-        
-        # Get existing training descriptions for this date
-        existing_descriptions = {
-            td.id_pizarra: td
-            for td in db.session.query(ClassTrainingDescription).filter_by(
-                user_id=user.id,
-                class_date=target_date
-            ).all()
-            if td.id_pizarra is not None
-        }
-        training_desc_logger.info("Found %d existing training descriptions in DB for date %s", 
-                    len(existing_descriptions), target_date)
-        
-        # Track which training descriptions we found (by id_pizarra)
-        found_id_pizarras = set()
-        new_count = 0
-        updated_count = 0
-        
-        for training_info in training_descriptions:
-            training_name = training_info['training_name']
-            id_pizarra = training_info.get('id_pizarra')
-            
-            # Skip if no id_pizarra (shouldn't happen, but be safe)
-            if id_pizarra is None:
-                logging.warning("Skipping training description without id_pizarra: %s for date %s", 
-                             training_name, target_date)
-                continue
-            
-            found_id_pizarras.add(id_pizarra)
-            
-            if id_pizarra in existing_descriptions:
-                # Update existing training description
-                existing = existing_descriptions[id_pizarra]
-                existing.training_name = training_name  # Update name in case it changed
-                existing.description = training_info.get('description')
-                existing.fetched_at = datetime.now()
-                updated_count += 1
-                training_desc_logger.info("Updated training description: %s (id_pizarra: %s) for date %s", 
-                           training_name, id_pizarra, target_date)
-            else:
-                # Create new training description
-                new_description = ClassTrainingDescription(
-                    user_id=user.id,
-                    class_date=target_date,
-                    training_name=training_name,
-                    description=training_info.get('description'),
-                    id_pizarra=id_pizarra,
-                    fetched_at=datetime.now()
-                )
-                db.session.add(new_description)
-                new_count += 1
-                training_desc_logger.info("Created new training description: %s (id_pizarra: %s) for date %s", 
-                           training_name, id_pizarra, target_date)
-        
-        # Delete training descriptions that are no longer in the API response
-        deleted_count = 0
-        for id_pizarra, existing_desc in existing_descriptions.items():
-            if id_pizarra not in found_id_pizarras:
-                db.session.delete(existing_desc)
-                deleted_count += 1
-                training_desc_logger.info("Deleted training description: %s (id_pizarra: %s) for date %s (no longer in API)", 
-                           existing_desc.training_name, id_pizarra, target_date)
-        
+
+        new_count, updated_count, deleted_count = _apply_training_descriptions(box_url, target_date, training_descriptions)
+        # Written outside the syncs, so the next sync of the date doesn't skip it
+        db.session.query(SyncState).filter_by(scope=_get_box_sync_scope(box_url), class_date=target_date).delete()
         db.session.commit()
-        training_desc_logger.info("Training descriptions sync for date %s: %d new, %d updated, %d deleted", 
-                   target_date, new_count, updated_count, deleted_count)
         
         return {'success': True, 'new': new_count, 'updated': updated_count, 'deleted': deleted_count, 'errors': []}
     except Exception as e:
@@ -624,9 +835,236 @@ def sync_training_descriptions_for_date(user: User, target_date: date, box_url:
         return {'success': False, 'new': 0, 'updated': 0, 'deleted': 0, 'errors': [error_msg]}
 
 
+def _upsert_booked_classes(box_url: str, booked_classes: dict) -> tuple:
+    """
+    Mirror the classes booked by users on several dates into WodBusterBooking in bulk: one
+    INSERT ... ON CONFLICT on _user_class_date_uc and one UPDATE for the cancelled classes
+    :param box_url: The WodBuster URL of the box
+    :param booked_classes: The booked classes as returned by the scraper, by (user ID, date)
+    :return: A tuple with the number of new, updated and cancelled bookings
+    """
+    if not booked_classes:
+        return 0, 0, 0
+    now = clock.now()
+    table = WodBusterBooking.__table__
+    existing = set(db.session.execute(
+        select(table.c.user_id, table.c.class_date, table.c.class_id)
+        .where(tuple_(table.c.user_id, table.c.class_date).in_(list(booked_classes)))).all())
+
+    rows = [{
+        'user_id': user_id,
+        'class_id': class_info['class_id'],
+        'class_date': target_date,
+        'class_time': class_info['time'],
+        'class_name': class_info.get('class_name'),
+        'class_type': class_info.get('class_type'),
+        'box_url': box_url,
+        'fetched_at': now,
+        'is_cancelled': False
+    } for (user_id, target_date), classes in booked_classes.items() for class_info in classes]
+    upsert_rows(WodBusterBooking, rows, ('user_id', 'class_id', 'class_date'),
+                ('class_name', 'class_type', 'fetched_at', 'is_cancelled'))
+
+    # Mark bookings as cancelled if they're no longer in the API response
+    found = {(row['user_id'], row['class_date'], row['class_id']) for row in rows}
+    cancelled = existing - found
+    if cancelled:
+        db.session.execute(update(table)
+                           .where(tuple_(table.c.user_id, table.c.class_date, table.c.class_id).in_(list(cancelled)))
+                           .values(is_cancelled=True, fetched_at=now))
+    return len(found - existing), len(found & existing), len(cancelled)
+
+
+def _upsert_training_descriptions(training_descriptions: dict) -> tuple:
+    """
+    Mirror the training descriptions of boxes on several dates into BoxTrainingDescription in
+    bulk: one INSERT ... ON CONFLICT on _box_date_pizarra_uc and one DELETE for the pizarras
+    no longer published
+    :param training_descriptions: The training descriptions as returned by the scraper, by
+    (box URL, date)
+    :return: A tuple with the number of new, updated and deleted descriptions
+    """
+    if not training_descriptions:
+        return 0, 0, 0
+    now = clock.now()
+    table = BoxTrainingDescription.__table__
+    existing = set(db.session.execute(
+        select(table.c.box_url, table.c.class_date, table.c.id_pizarra)
+        .where(tuple_(table.c.box_url, table.c.class_date).in_(list(training_descriptions)),
+               table.c.id_pizarra.isnot(None))).all())
+
+    rows = []
+    for (box_url, target_date), descriptions in training_descriptions.items():
+        for training_info in descriptions:
+            if training_info.get('id_pizarra') is None:
+                logging.warning("Skipping training description without id_pizarra: %s for date %s",
+                                training_info['training_name'], target_date)
+                continue
+            rows.append({
+                'box_url': box_url,
+                'class_date': target_date,
+                'training_name': training_info['training_name'],
+                'description': training_info.get('description'),
+                'id_pizarra': training_info['id_pizarra'],
+                'fetched_at': now
+            })
+    upsert_rows(BoxTrainingDescription, rows, ('box_url', 'class_date', 'id_pizarra'),
+                ('training_name', 'description', 'fetched_at'))
+
+    # Delete training descriptions that are no longer in the API response
+    found = {(row['box_url'], row['class_date'], row['id_pizarra']) for row in rows}
+    deleted = existing - found
+    if deleted:
+        db.session.execute(delete(table)
+                           .where(tuple_(table.c.box_url, table.c.class_date, table.c.id_pizarra).in_(list(deleted))))
+    training_desc_logger.info("Training descriptions sync for %d dates: %d new, %d updated, %d deleted",
+                              len(training_descriptions), len(found - existing), len(found & existing), len(deleted))
+    return len(found - existing), len(found & existing), len(deleted)
+
+
+def _apply_bulk_sync(box_url: str, booked_days: dict, description_days: dict, pending_states: list) -> tuple:
+    """
+    Write the changed dates of a sync with the bulk upserts, in a savepoint, and store their
+    content hashes
+    :param box_url: The WodBuster URL of the box
+    :param booked_days: The booked classes by (user ID, date)
+    :param description_days: The training descriptions by (box URL, date)
+    :param pending_states: The (SyncStates by scope, written scopes, date, content hash) of the
+    changed dates
+    :return: A tuple with the number of new, updated and cancelled bookings
+    """
+    with db.session.begin_nested():
+        counts = _upsert_booked_classes(box_url, booked_days)
+        _upsert_training_descriptions(description_days)
+        for sync_states, scopes, target_date, content_hash in pending_states:
+            _set_sync_states(sync_states, scopes, target_date, content_hash)
+    return counts
+
+
+def _get_user_sync_scope(user: User) -> str:
+    """
+    Get the scope of the sync states of the booked classes of a user, written by the syncs of the
+    user and by the syncs of its box
+    """
+    return f"user:{user.id}"
+
+
+def _get_box_sync_scope(box_url: str) -> str:
+    """
+    Get the scope of the sync states of the training descriptions of a box, written by the syncs
+    of the box and by the syncs of its users
+    """
+    return f"box:{box_url}"
+
+
+def _get_sync_states(scopes: list, target_date: date) -> dict:
+    """
+    Get the states of the rows a sync of a date writes: a scope has the content hash of the
+    response its rows were last written from, whichever sync wrote them
+    :param scopes: The scopes written by the sync, see _get_user_sync_scope and _get_box_sync_scope
+    :param target_date: The synced date
+    :return: The SyncState of every scope that was written, by scope
+    """
+    if not scopes:
+        return {}
+    return {sync_state.scope: sync_state for sync_state in db.session.query(SyncState).filter(
+        SyncState.class_date == target_date, SyncState.scope.in_(scopes))}
+
+
+def _get_known_hash(sync_states: dict, scopes: list) -> str:
+    """
+    Get the content hash the rows of all the scopes were last written from
+    :return: The content hash, or None if a scope was never written or they were written from
+    different responses (the date has to be written again)
+    """
+    content_hashes = {sync_states[scope].content_hash if scope in sync_states else None for scope in scopes}
+    return content_hashes.pop() if len(content_hashes) == 1 else None
+
+
+def _set_sync_states(sync_states: dict, scopes: list, target_date: date, content_hash: str) -> None:
+    """
+    Store the content hash of the scopes written for a date. The caller commits the session
+    :param sync_states: The current states of the date, by scope
+    :param scopes: The written scopes
+    :param target_date: The synced date
+    :param content_hash: The content hash of the synced day
+    """
+    for scope in scopes:
+        sync_state = sync_states.get(scope)
+        if sync_state is None:
+            db.session.add(SyncState(scope=scope, class_date=target_date, content_hash=content_hash))
+        else:
+            sync_state.content_hash = content_hash
+            sync_state.synced_at = clock.now()
+
+
+def _try_apply_training_descriptions(box_url: str, target_date: date, training_descriptions: list) -> bool:
+    """
+    Apply the training descriptions of a date in a savepoint of their own, so an error doesn't
+    fail the bookings of the date
+    :return: Whether the descriptions were applied
+    """
+    try:
+        with db.session.begin_nested():
+            _apply_training_descriptions(box_url, target_date, training_descriptions)
+        return True
+    except Exception as e:
+        # Log but don't fail the entire sync if training descriptions fail
+        logging.exception("Error syncing training descriptions of box %s for date %s: %s", box_url, target_date, str(e))
+        return False
+
+
+def _get_sync_dates(user: User) -> tuple:
+    """
+    Get the dates synced for a user: the current week (Monday to Sunday), starting earlier if a
+    booking window opened before today and extended to the classes of next week whose booking
+    window is already open
+    :param user: The user to sync
+    :return: A tuple with the first and last dates whose bookings are synced, and the Monday and
+    Sunday of the current week, whose training descriptions are synced
+    """
+    today = clock.now().date()
+    
+    # Calculate current week: Monday to Sunday
+    # Get Monday of current week
+    days_since_monday = today.weekday()  # 0 = Monday, 6 = Sunday
+    monday = today - timedelta(days=days_since_monday)
+    # Get Sunday of current week
+    sunday = monday + timedelta(days=6)
+    
+    end_date = sunday
+
+    # Extend sync range to next week if booking windows are open
+    now = clock.now(_MADRID_TZ)
+    user_bookings = db.session.query(Booking).filter_by(user_id=user.id).all()
+    
+    next_monday = monday + timedelta(days=7)
+
+    earliest_opening_date = today
+
+    for booking in user_bookings:
+        # Date of the class next week
+        next_week_class_date = _get_next_date_for_weekday(next_monday, booking.dow)
+
+        # When the booking for that class opens
+        booking_opens_date = next_week_class_date - timedelta(days=booking.offset)
+        if booking.available_at:
+            booking_opens_datetime = _MADRID_TZ.localize(
+                datetime.combine(booking_opens_date, booking.available_at)
+            )
+            earliest_opening_date = min(earliest_opening_date, booking_opens_date)
+
+            # If the booking window is already open, extend the sync period to include this class
+            if now >= booking_opens_datetime:
+                end_date = max(end_date, next_week_class_date)
+    
+    return earliest_opening_date, end_date, monday, sunday
+
+
 def sync_wodbuster_bookings(user: User) -> dict:
     """
     Sync WodBuster bookings for a user for the current week (Monday to Sunday).
+    Every date is fetched once and feeds both the bookings and the training descriptions.
     :param user: The user to sync bookings for
     :return: Dictionary with sync results: {'success': bool, 'new': int, 'updated': int, 'cancelled': int, 'errors': list}
     """
@@ -642,7 +1080,7 @@ def sync_wodbuster_bookings(user: User) -> dict:
     else:
         # Try to get box URL directly
         try:
-            scraper = get_scraper(user.email, user.cookie)
+            scraper = get_scraper(user.email, user.cookie, user.session_state)
             box_url = scraper.get_box_url()
         except Exception as e:
             logging.warning("Could not get box URL for user %s: %s", user.email, str(e))
@@ -652,194 +1090,69 @@ def sync_wodbuster_bookings(user: User) -> dict:
         return {'success': False, 'new': 0, 'updated': 0, 'cancelled': 0, 'errors': ['No box URL available']}
     
     try:
-        scraper = get_scraper(user.email, user.cookie)
-        today = date.today()
-        
-        # Calculate current week: Monday to Sunday
-        # Get Monday of current week
-        days_since_monday = today.weekday()  # 0 = Monday, 6 = Sunday
-        monday = today - timedelta(days=days_since_monday)
-        # Get Sunday of current week
-        sunday = monday + timedelta(days=6)
-        
-        start_date = monday
-        end_date = sunday
-
-        # Extend sync range to next week if booking windows are open
-        now = datetime.now(_MADRID_TZ)
-        user_bookings = db.session.query(Booking).filter_by(user_id=user.id).all()
-        
-        next_monday = monday + timedelta(days=7)
-
-        earliest_opening_date = today
-
-        for booking in user_bookings:
-            # Date of the class next week
-            next_week_class_date = _get_next_date_for_weekday(next_monday, booking.dow)
-
-            # When the booking for that class opens
-            booking_opens_date = next_week_class_date - timedelta(days=booking.offset)
-            if booking.available_at:
-                booking_opens_datetime = _MADRID_TZ.localize(
-                    datetime.combine(booking_opens_date, booking.available_at)
-                )
-                earliest_opening_date = min(earliest_opening_date, booking_opens_date)
-
-                # If the booking window is already open, extend the sync period to include this class
-                if now >= booking_opens_datetime:
-                    end_date = max(end_date, next_week_class_date)
-        
-        start_date = earliest_opening_date
-        
-        # For training descriptions, always sync from Monday of current week
-        # (bookings might only sync from today if no bookings open earlier)
-        training_desc_start_date = monday
+        scraper = get_scraper(user.email, user.cookie, user.session_state)
+        start_date, end_date, monday, sunday = _get_sync_dates(user)
         
         new_count = 0
         updated_count = 0
         cancelled_count = 0
+        skipped_count = 0
+        changed_count = 0
         errors = []
+        user_scope = _get_user_sync_scope(user)
+        box_scope = _get_box_sync_scope(box_url)
+        # Changed dates waiting for the bulk write
+        booked_days = {}
+        description_days = {}
+        pending_states = []
         
-        current_date = start_date
+        # Training descriptions are always synced for the full current week (Monday to Sunday)
+        # while bookings might only sync from start_date if no bookings open earlier
+        current_date = min(start_date, monday)
         logging.info("Starting sync for dates from %s to %s", start_date, end_date)
         while current_date <= end_date:
             try:
-                logging.info("Processing date %s (day %d of sync range)", current_date, 
-                           (current_date - start_date).days + 1)
+                logging.info("Processing date %s", current_date)
                 with db.session.begin_nested():
-                    booked_classes = scraper.get_user_booked_classes(box_url, user.athlete_id, current_date)
-                    
-                    # Get existing bookings for this date
-                    existing_bookings = {
-                        wb.class_id: wb 
-                        for wb in db.session.query(WodBusterBooking).filter_by(
-                            user_id=user.id,
-                            class_date=current_date
-                        ).all()
-                    }
-                    
-                    # Track which bookings we found in the API response
-                    found_class_ids = set()
-                    
-                    for class_info in booked_classes:
-                        class_id = class_info['class_id']
-                        class_time = class_info['time']
-                        found_class_ids.add(class_id)
-                        
-                        # Check if booking already exists
-                        if class_id in existing_bookings:
-                            # Update existing booking
-                            existing = existing_bookings[class_id]
-                            existing.class_name = class_info.get('class_name')
-                            existing.class_type = class_info.get('class_type')
-                            existing.fetched_at = datetime.now()
-                            existing.is_cancelled = False
-                            updated_count += 1
-                        else:
-                            # Create new booking
-                            new_booking = WodBusterBooking(
-                                user_id=user.id,
-                                class_id=class_id,
-                                class_date=current_date,
-                                class_time=class_time,
-                                class_name=class_info.get('class_name'),
-                                class_type=class_info.get('class_type'),
-                                box_url=box_url,
-                                fetched_at=datetime.now(),
-                                is_cancelled=False
-                            )
-                            db.session.add(new_booking)
-                            new_count += 1
-                    
-                    # Mark bookings as cancelled if they're no longer in the API response
-                    for class_id, existing_booking in existing_bookings.items():
-                        if class_id not in found_class_ids:
-                            existing_booking.is_cancelled = True
-                            existing_booking.fetched_at = datetime.now()
-                            cancelled_count += 1
-                    
-                    # Fetch and store training descriptions for this date
-                    # Always sync training descriptions for the full current week (Monday to Sunday)
-                    # even if bookings sync starts later
-                    try:
-                        if current_date >= monday and current_date <= sunday:
-                            training_desc_logger.info("Fetching training descriptions for user %s, date %s", user.email, current_date)
-                            training_descriptions = scraper.get_training_descriptions(box_url, user.athlete_id, current_date)
+                    sync_bookings = current_date >= start_date
+                    sync_descriptions = monday <= current_date <= sunday
+                    scopes = ([user_scope] if sync_bookings else []) + ([box_scope] if sync_descriptions else [])
+                    sync_states = _get_sync_states(scopes, current_date)
+                    day = scraper.get_day(box_url, user.athlete_id, current_date,
+                                          known_hash=_get_known_hash(sync_states, scopes))
+
+                    if day['unchanged']:
+                        logging.info("Date %s unchanged since the last sync", current_date)
+                        skipped_count += 1
+                    elif day['content_hash'] is None:
+                        # Nothing is written for a day that couldn't be parsed
+                        raise InvalidWodBusterResponse(f"Could not parse the classes of {current_date}")
+                    elif _SYNC_BULK_UPSERT:
+                        # Written with the rest of the range after the loop
+                        changed_count += 1
+                        if sync_bookings:
+                            booked_days[(user.id, current_date)] = day['booked_classes']
+                        if sync_descriptions:
+                            description_days[(box_url, current_date)] = day['training_descriptions']
+                        pending_states.append((sync_states, scopes, current_date, day['content_hash']))
+                    else:
+                        changed_count += 1
+                        if sync_bookings:
+                            new, updated, cancelled = _apply_booked_classes(user, box_url, current_date, day['booked_classes'])
+                            new_count += new
+                            updated_count += updated
+                            cancelled_count += cancelled
+
+                        descriptions_synced = True
+                        if sync_descriptions:
+                            descriptions_synced = _try_apply_training_descriptions(box_url, current_date, day['training_descriptions'])
                         else:
-                            training_desc_logger.debug("Skipping training descriptions for date %s (outside current week %s to %s)", 
+                            training_desc_logger.debug("Skipping training descriptions for date %s (outside current week %s to %s)",
                                         current_date, monday, sunday)
-                            training_descriptions = []
-                        training_desc_logger.info("Retrieved %d training descriptions from API for date %s", 
-                                   len(training_descriptions), current_date)
-                        
-                        # Get existing training descriptions for this date
-                        # Use id_pizarra as the key since multiple pizarras can have the same name
-                        existing_descriptions = {
-                            td.id_pizarra: td
-                            for td in db.session.query(ClassTrainingDescription).filter_by(
-                                user_id=user.id,
-                                class_date=current_date
-                            ).all()
-                            if td.id_pizarra is not None  # Only include records with id_pizarra
-                        }
-                        training_desc_logger.info("Found %d existing training descriptions in DB for date %s", 
-                                   len(existing_descriptions), current_date)
-                        
-                        # Track which training descriptions we found (by id_pizarra)
-                        found_id_pizarras = set()
-                        new_count = 0
-                        updated_count = 0
-                        
-                        for training_info in training_descriptions:
-                            training_name = training_info['training_name']
-                            id_pizarra = training_info.get('id_pizarra')
-                            
-                            # Skip if no id_pizarra (shouldn't happen, but be safe)
-                            if id_pizarra is None:
-                                logging.warning("Skipping training description without id_pizarra: %s for date %s", 
-                                             training_name, current_date)
-                                continue
-                            
-                            found_id_pizarras.add(id_pizarra)
-                            
-                            if id_pizarra in existing_descriptions:
-                                # Update existing training description
-                                existing = existing_descriptions[id_pizarra]
-                                existing.training_name = training_name  # Update name in case it changed
-                                existing.description = training_info.get('description')
-                                existing.fetched_at = datetime.now()
-                                updated_count += 1
-                                training_desc_logger.info("Updated training description: %s (id_pizarra: %s) for date %s", 
-                                           training_name, id_pizarra, current_date)
-                            else:
-                                # Create new training description
-                                new_description = ClassTrainingDescription(
-                                    user_id=user.id,
-                                    class_date=current_date,
-                                    training_name=training_name,
-                                    description=training_info.get('description'),
-                                    id_pizarra=id_pizarra,
-                                    fetched_at=datetime.now()
-                                )
-                                db.session.add(new_description)
-                                new_count += 1
-                                training_desc_logger.info("Created new training description: %s (id_pizarra: %s) for date %s", 
-                                           training_name, id_pizarra, current_date)
-                        
-                        # Delete training descriptions that are no longer in the API response
-                        deleted_count = 0
-                        for id_pizarra, existing_desc in existing_descriptions.items():
-                            if id_pizarra not in found_id_pizarras:
-                                db.session.delete(existing_desc)
-                                deleted_count += 1
-                                training_desc_logger.info("Deleted training description: %s (id_pizarra: %s) for date %s (no longer in API)", 
-                                           existing_desc.training_name, id_pizarra, current_date)
-                        
-                        training_desc_logger.info("Training descriptions sync for date %s: %d new, %d updated, %d deleted", 
-                                   current_date, new_count, updated_count, deleted_count)
-                    except Exception as e:
-                        # Log but don't fail the entire sync if training descriptions fail
-                        logging.exception("Error syncing training descriptions for date %s: %s", current_date, str(e))
+
+                        # Failed descriptions are synced again next time
+                        written_scopes = scopes if descriptions_synced else [scope for scope in scopes if scope != box_scope]
+                        _set_sync_states(sync_states, written_scopes, current_date, day['content_hash'])
                 
             except Exception as e:
                 error_msg = f"Error syncing date {current_date}: {str(e)}"
@@ -847,82 +1160,28 @@ def sync_wodbuster_bookings(user: User) -> dict:
                 errors.append(error_msg)
             
             current_date += timedelta(days=1)
+
+        if pending_states:
+            try:
+                new_count, updated_count, cancelled_count = _apply_bulk_sync(
+                    box_url, booked_days, description_days, pending_states)
+            except Exception as e:
+                error_msg = f"Error writing the synced dates: {str(e)}"
+                logging.exception(error_msg)
+                errors.append(error_msg)
         
-        # Also sync training descriptions for days before start_date but within current week
-        # (in case start_date is after Monday due to booking opening dates)
-        if start_date > monday:
-            training_desc_logger.info("Syncing training descriptions for earlier days in current week (%s to %s)", 
-                        monday, start_date - timedelta(days=1))
-            current_date = monday
-            while current_date < start_date:
-                try:
-                    with db.session.begin_nested():
-                        training_desc_logger.info("Fetching training descriptions for user %s, date %s (earlier week day)", 
-                                    user.email, current_date)
-                        training_descriptions = scraper.get_training_descriptions(box_url, user.athlete_id, current_date)
-                        training_desc_logger.info("Retrieved %d training descriptions from API for date %s", 
-                                   len(training_descriptions), current_date)
-                        
-                        # Get existing training descriptions for this date
-                        existing_descriptions = {
-                            td.id_pizarra: td
-                            for td in db.session.query(ClassTrainingDescription).filter_by(
-                                user_id=user.id,
-                                class_date=current_date
-                            ).all()
-                            if td.id_pizarra is not None
-                        }
-                        
-                        # Track which training descriptions we found (by id_pizarra)
-                        found_id_pizarras = set()
-                        
-                        for training_info in training_descriptions:
-                            training_name = training_info['training_name']
-                            id_pizarra = training_info.get('id_pizarra')
-                            
-                            if id_pizarra is None:
-                                logging.warning("Skipping training description without id_pizarra: %s for date %s", 
-                                             training_name, current_date)
-                                continue
-                            
-                            found_id_pizarras.add(id_pizarra)
-                            
-                            if id_pizarra in existing_descriptions:
-                                # Update existing training description
-                                existing = existing_descriptions[id_pizarra]
-                                existing.training_name = training_name
-                                existing.description = training_info.get('description')
-                                existing.fetched_at = datetime.now()
-                            else:
-                                # Create new training description
-                                new_description = ClassTrainingDescription(
-                                    user_id=user.id,
-                                    class_date=current_date,
-                                    training_name=training_name,
-                                    description=training_info.get('description'),
-                                    id_pizarra=id_pizarra,
-                                    fetched_at=datetime.now()
-                                )
-                                db.session.add(new_description)
-                        
-                        # Delete training descriptions that are no longer in the API response
-                        for id_pizarra, existing_desc in existing_descriptions.items():
-                            if id_pizarra not in found_id_pizarras:
-                                db.session.delete(existing_desc)
-                except Exception as e:
-                    logging.warning("Error syncing training descriptions for date %s: %s", current_date, str(e))
-                
-                current_date += timedelta(days=1)
-        
+        _save_session_state(user)
         db.session.commit()
-        logging.info("Sync completed for user %s: %d new, %d updated, %d cancelled", 
-                    user.email, new_count, updated_count, cancelled_count)
+        logging.info("Sync completed for user %s: %d new, %d updated, %d cancelled, %d dates changed, %d unchanged", 
+                    user.email, new_count, updated_count, cancelled_count, changed_count, skipped_count)
         
         return {
             'success': True,
             'new': new_count,
             'updated': updated_count,
             'cancelled': cancelled_count,
+            'changed': changed_count,
+            'skipped': skipped_count,
             'errors': errors
         }
         
@@ -934,5 +1193,150 @@ def sync_wodbuster_bookings(user: User) -> dict:
             'new': 0,
             'updated': 0,
             'cancelled': 0,
+            'changed': 0,
+            'skipped': 0,
             'errors': [f'Sync failed: {str(e)}']
         }
+
+
+def get_box_users() -> dict:
+    """
+    Group the users that can be synced (with an athlete ID and a cookie) by the box of their most
+    recent booking
+    :return: A dictionary with the box URLs as keys and the lists of users as values
+    """
+    box_users = {}
+    users = db.session.query(User).filter(User.athlete_id.isnot(None), User.cookie.isnot(None)).all()
+    for user in users:
+        last_booking = db.session.query(Booking).filter_by(user_id=user.id).order_by(Booking.id.desc()).first()
+        if last_booking and last_booking.url:
+            box_users.setdefault(last_booking.url, []).append(user)
+    return box_users
+
+
+def sync_box_bookings(box_url: str, users: list, dates: list=None) -> dict:
+    """
+    Sync the WodBuster bookings of every user of a box. Every date is fetched once, with the
+    session of the first user able to log in, and the rosters of the classes are applied to all
+    the users in a single transaction. Each user gets the same dates as with sync_wodbuster_bookings
+    :param box_url: The WodBuster URL of the box
+    :param users: The users of the box, with athlete ID
+    :param dates: Only sync these dates (e.g. the date of a hub event), if provided
+    :return: Dictionary with sync results: {'success': bool, 'users': int, 'dates': int, 'new': int,
+    'updated': int, 'cancelled': int, 'changed': int, 'skipped': int, 'errors': list}
+    """
+    result = {'success': False, 'users': len(users), 'dates': 0, 'new': 0, 'updated': 0, 'cancelled': 0,
+              'changed': 0, 'skipped': 0, 'errors': []}
+    box_scope = _get_box_sync_scope(box_url)
+    try:
+        sync_dates = {user.id: _get_sync_dates(user) for user in users}
+        first_date = min(min(start_date, monday) for start_date, _, monday, _ in sync_dates.values())
+        last_date = max(end_date for _, end_date, _, _ in sync_dates.values())
+        athlete_ids = [user.athlete_id for user in users]
+        # Changed dates waiting for the bulk write
+        booked_days = {}
+        description_days = {}
+        pending_states = []
+
+        fetchers = list(users)
+        current_date = first_date
+        logging.info("Starting box sync of %s for %d users from %s to %s", box_url, len(users), first_date, last_date)
+        while current_date <= last_date and fetchers:
+            if dates is not None and current_date not in dates:
+                current_date += timedelta(days=1)
+                continue
+            fetcher = fetchers[0]
+            try:
+                with db.session.begin_nested():
+                    # The users the date is synced for, and what is synced for each of them
+                    targets = []
+                    for user in users:
+                        start_date, end_date, monday, sunday = sync_dates[user.id]
+                        targets.append((user, start_date <= current_date <= end_date, monday <= current_date <= sunday))
+                    # The descriptions are stored once for the box
+                    sync_descriptions = any(sync_descriptions for _, _, sync_descriptions in targets)
+                    booking_scopes = [_get_user_sync_scope(user) for user, sync_bookings, _ in targets if sync_bookings]
+                    scopes = booking_scopes + ([box_scope] if sync_descriptions else [])
+                    sync_states = _get_sync_states(scopes, current_date)
+
+                    scraper = get_scraper(fetcher.email, fetcher.cookie, fetcher.session_state)
+                    day = scraper.get_box_day(box_url, fetcher.athlete_id, current_date, athlete_ids,
+                                              known_hash=_get_known_hash(sync_states, scopes))
+                    result['dates'] += 1
+
+                    if day['unchanged']:
+                        logging.info("Date %s of box %s unchanged since the last sync", current_date, box_url)
+                        result['skipped'] += 1
+                    elif day['content_hash'] is None:
+                        # Nothing is written for a day that couldn't be parsed
+                        raise InvalidWodBusterResponse(f"Could not parse the classes of {current_date}")
+                    elif _SYNC_BULK_UPSERT:
+                        # Written with the rest of the range after the loop
+                        result['changed'] += 1
+                        for user, sync_bookings, _ in targets:
+                            if sync_bookings:
+                                booked_days[(user.id, current_date)] = day['booked_classes'][user.athlete_id]
+                        if sync_descriptions:
+                            description_days[(box_url, current_date)] = day['training_descriptions']
+                        pending_states.append((sync_states, scopes, current_date, day['content_hash']))
+                    else:
+                        result['changed'] += 1
+                        for user, sync_bookings, _ in targets:
+                            if sync_bookings:
+                                new, updated, cancelled = _apply_booked_classes(
+                                    user, box_url, current_date, day['booked_classes'][user.athlete_id])
+                                result['new'] += new
+                                result['updated'] += updated
+                                result['cancelled'] += cancelled
+
+                        descriptions_synced = True
+                        if sync_descriptions:
+                            descriptions_synced = _try_apply_training_descriptions(
+                                box_url, current_date, day['training_descriptions'])
+
+                        # Failed descriptions are synced again next time
+                        _set_sync_states(sync_states, scopes if descriptions_synced else booking_scopes,
+                                         current_date, day['content_hash'])
+            except (LoginError, PasswordRequired) as e:
+                # The same date is fetched again with the session of the next user
+                logging.warning("User %s can't fetch the classes of %s: %s", fetcher.email, box_url, str(e))
+                fetchers.pop(0)
+                continue
+            except Exception as e:
+                error_msg = f"Error syncing date {current_date} of box {box_url}: {str(e)}"
+                logging.exception(error_msg)
+                result['errors'].append(error_msg)
+
+            current_date += timedelta(days=1)
+
+        if pending_states:
+            try:
+                result['new'], result['updated'], result['cancelled'] = _apply_bulk_sync(
+                    box_url, booked_days, description_days, pending_states)
+            except Exception as e:
+                error_msg = f"Error writing the synced dates of box {box_url}: {str(e)}"
+                logging.exception(error_msg)
+                result['errors'].append(error_msg)
+
+        if fetchers:
+            _save_session_state(fetchers[0])
+        else:
+            result['errors'].append(f"No user of box {box_url} could log in")
+        db.session.commit()
+        result['success'] = bool(fetchers)
+        logging.info("Box sync of %s completed: %d dates (%d changed, %d unchanged), %d new, %d updated, %d cancelled",
+                     box_url, result['dates'], result['changed'], result['skipped'], result['new'], result['updated'],
+                     result['cancelled'])
+    except Exception as e:
+        logging.exception("Error syncing WodBuster bookings of box %s", box_url)
+        db.session.rollback()
+        result['errors'].append(f'Sync failed: {str(e)}')
+    return result
+
+
+def sync_all_boxes() -> dict:
+    """
+    Sync the WodBuster bookings of every registered user, fetching each date once per box
+    :return: Dictionary with the sync results of every box URL
+    """
+    return {box_url: sync_box_bookings(box_url, users) for box_url, users in get_box_users().items()}
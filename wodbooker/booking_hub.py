@@ -0,0 +1,424 @@
+"""
+Client of the WodBuster booking hub: the SignalR hub (JSON protocol) that notifies the changes
+of the classes of a box, like a cancelled booking (changedBooking) or a new board (changedPizarra)
+
+The hub is reached over WebSockets when websocket-client is installed and the server offers
+them, with Server-Sent Events as fallback
+"""
+import json
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+import requests
+import sseclient
+from .exceptions import InvalidWodBusterResponse, HostUnavailable
+from .json_backend import json_loads, json_dumps
+from . import recorder
+
+# websocket-client is used to reach the hub over WebSockets when it is installed.
+# WODBUSTER_HUB_TRANSPORT=sse forces Server-Sent Events
+try:
+    import websocket
+    HAS_WEBSOCKET = True
+except ImportError:
+    HAS_WEBSOCKET = False
+
+_RECORD_SEPARATOR = '\u001e'
+
+# SignalR hub message types
+_INVOCATION_MESSAGE = 1
+_COMPLETION_MESSAGE = 3
+_PING_MESSAGE = 6
+_CLOSE_MESSAGE = 7
+
+# Same defaults as the SignalR clients: a ping is sent when nothing has been sent for 15 seconds
+# and the server is considered gone when nothing has been received for 30 seconds (it pings
+# every 15 seconds)
+_KEEPALIVE_INTERVAL_SECONDS = 15
+_SERVER_TIMEOUT_SECONDS = 30
+# Reconnections wait a random time up to an exponentially growing delay. Failed attempts are
+# counted until a connection stays open for the server timeout
+_RECONNECT_BASE_DELAY_SECONDS = 0.5
+_RECONNECT_MAX_DELAY_SECONDS = 30
+_MAX_RECONNECT_ATTEMPTS = 6
+# A server whose WebSocket connection fails is reached with Server-Sent Events for this time
+_WEBSOCKET_RETRY_SECONDS = 3600
+
+_HUB_TRANSPORT = os.getenv('WODBUSTER_HUB_TRANSPORT', 'websockets' if HAS_WEBSOCKET else 'sse').lower()
+if _HUB_TRANSPORT == 'websockets' and not HAS_WEBSOCKET:
+    logging.warning("WODBUSTER_HUB_TRANSPORT is websockets but websocket-client is not installed. Using sse")
+    _HUB_TRANSPORT = 'sse'
+
+_websocket_unavailable_until = {}
+
+
+class HubMessageParser():
+    """
+    Split the text received from the hub into messages. Messages end with a record separator,
+    a frame may carry several of them and a message may be split across frames
+    """
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, data: str) -> list:
+        """
+        Add received text to the parser
+        :param data: The received text
+        :return: The list of complete messages, decoded
+        """
+        self._buffer += data
+        *records, self._buffer = self._buffer.split(_RECORD_SEPARATOR)
+        messages = []
+        for record in records:
+            if not record.strip():
+                continue
+            try:
+                messages.append(json_loads(record))
+            except json.JSONDecodeError:
+                logging.warning("Ignoring invalid booking hub message: %s", record[:200])
+        return messages
+
+
+class _Negotiation():
+    """
+    Result of a negotiate request. The connection token can only be used by one connection
+    """
+    __slots__ = ('connection_token', 'transports', 'used')
+
+    def __init__(self, response: dict):
+        self.connection_token = response['connectionToken']
+        self.transports = tuple(transport.get('transport') for transport in response.get('availableTransports') or ())
+        self.used = False
+
+
+class _HubConnection(ABC):
+    """
+    A connection to the hub. Messages are read by a background thread and queued (None once
+    the connection is lost), so the client can wait for them with a timeout
+    """
+    transport = None
+
+    def __init__(self, server: str, negotiation: _Negotiation):
+        self._server = server
+        self._negotiation = negotiation
+        self._closed = False
+        self.messages = queue.Queue()
+        self.last_sent = 0
+
+    def _start_reader(self) -> None:
+        threading.Thread(target=self._read, name=f"{threading.current_thread().name}-hub", daemon=True).start()
+
+    @abstractmethod
+    def _read(self) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def open(self) -> None:
+        """
+        Open the connection and start reading it
+        :raises RequestException: If the connection can't be opened
+        :raises InvalidWodBusterResponse: If the server rejects the connection
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def send(self, message: dict) -> None:
+        """
+        Send a message to the hub
+        :raises RequestException: If the message can't be sent
+        :raises InvalidWodBusterResponse: If the connection is closed
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Close the connection without waiting for the reader thread
+        """
+        raise NotImplementedError()
+
+
+class _SSEConnection(_HubConnection):
+    """
+    A hub connection over Server-Sent Events: messages are received in a stream and sent with
+    a POST request each
+    """
+    transport = 'ServerSentEvents'
+
+    def __init__(self, server: str, negotiation: _Negotiation, request, headers: dict):
+        super().__init__(server, negotiation)
+        self._request = request
+        self._headers = headers
+        self._response = None
+        self._client = None
+
+    def open(self) -> None:
+        self._response = self._request('GET', f"{self._server}/bookinghub?id={self._negotiation.connection_token}",
+                                       stream=True, headers={**self._headers, "Accept": "text/event-stream"},
+                                       timeout=(10, _SERVER_TIMEOUT_SECONDS))
+        # Once the stream has been requested the token belongs to this connection
+        self._negotiation.used = True
+        if self._response.status_code != 200:
+            self._response.close()
+            raise InvalidWodBusterResponse(f"Booking hub rejected the connection ({self._response.status_code})")
+        self._client = sseclient.SSEClient(self._response)
+        self._start_reader()
+
+    def _read(self) -> None:
+        try:
+            for event in self._client.events():
+                if self._closed:
+                    break
+                self.messages.put(event.data)
+        except (requests.exceptions.RequestException, AttributeError, ValueError, OSError) as e:
+            # A stream shut down by close() may end with any of these
+            logging.debug("Booking hub stream closed: %s", e)
+        finally:
+            # The response is closed by the reader: closing it while a read is in progress would
+            # block until the read finishes
+            self._client.close()
+        self.messages.put(None)
+
+    def send(self, message: dict) -> None:
+        self._request('POST', f"{self._server}/bookinghub?id={self._negotiation.connection_token}",
+                      data=json_dumps(message) + _RECORD_SEPARATOR,
+                      headers={**self._headers, "Content-Type": "text/plain"}, timeout=10)
+        self.last_sent = time.monotonic()
+
+    def close(self) -> None:
+        # The socket is shut down so a pending read returns at once
+        self._closed = True
+        if self._client is None:
+            if self._response is not None:
+                self._response.close()
+            return
+        sock = getattr(getattr(self._response.raw, '_connection', None), 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _WebSocketConnection(_HubConnection):
+    """
+    A hub connection over a WebSocket: messages are sent and received over the same socket
+    """
+    transport = 'WebSockets'
+
+    def __init__(self, server: str, negotiation: _Negotiation, headers: dict, cookies=None, origin: str=None):
+        super().__init__(server, negotiation)
+        self._headers = headers
+        self._cookies = cookies
+        self._origin = origin
+        self._ws = None
+
+    def open(self) -> None:
+        url = f"{self._server}/bookinghub?id={self._negotiation.connection_token}"
+        cookie = None
+        if self._cookies is not None:
+            cookie = requests.cookies.get_cookie_header(self._cookies, requests.Request('GET', url).prepare())
+        # The token belongs to this connection even if the upgrade fails
+        self._negotiation.used = True
+        try:
+            self._ws = websocket.create_connection('ws' + url[len('http'):] if url.startswith('http') else url,
+                                                   timeout=10, header=[f"{name}: {value}" for name, value in self._headers.items()],
+                                                   cookie=cookie, origin=self._origin)
+            self._ws.settimeout(_SERVER_TIMEOUT_SECONDS)
+        except (websocket.WebSocketException, OSError) as e:
+            raise InvalidWodBusterResponse(f"Booking hub WebSocket connection failed: {e}") from e
+        self._start_reader()
+
+    def _read(self) -> None:
+        try:
+            while not self._closed:
+                data = self._ws.recv()
+                if not data:
+                    break
+                self.messages.put(data if isinstance(data, str) else data.decode('utf-8'))
+        except (websocket.WebSocketException, OSError, UnicodeDecodeError) as e:
+            logging.debug("Booking hub WebSocket closed: %s", e)
+        finally:
+            self._ws.shutdown()
+        self.messages.put(None)
+
+    def send(self, message: dict) -> None:
+        try:
+            self._ws.send(json_dumps(message) + _RECORD_SEPARATOR)
+        except (websocket.WebSocketException, OSError) as e:
+            raise InvalidWodBusterResponse(f"Booking hub WebSocket closed: {e}") from e
+        self.last_sent = time.monotonic()
+
+    def close(self) -> None:
+        # abort wakes up the reader thread, which closes the socket
+        self._closed = True
+        if self._ws is not None:
+            self._ws.abort()
+
+
+class BookingHubClient():
+    """
+    Client of the booking hub of a WodBuster SSE server. It keeps the connection alive, reconnects
+    with a jittered backoff and wakes up on time when the deadline is reached
+    """
+
+    def __init__(self, server: str, request, headers: dict, cookies=None, origin: str=None):
+        """
+        Client construction
+        :param server: The SSE server of the box
+        :param request: Function performing HTTP requests, with the signature of
+        Scraper._request (method, url, **kwargs)
+        :param headers: Headers sent with every request
+        :param cookies: Cookie jar sent when opening a WebSocket (HTTP requests carry their own)
+        :param origin: Origin header sent when opening a WebSocket
+        """
+        self._server = server
+        self._request = request
+        self._headers = headers
+        self._cookies = cookies
+        self._origin = origin
+        self._negotiation = None
+        self._closed = threading.Event()
+
+    def negotiate(self) -> _Negotiation:
+        """
+        Get a connection token. A negotiation whose token has not been used by a connection
+        (the stream could not be requested) is reused
+        :raises RequestException: If a network error occurs
+        :raises InvalidWodBusterResponse: If the response is an error (e.g. a Cloudflare challenge)
+        or has no connection token
+        """
+        if self._negotiation is None or self._negotiation.used:
+            negotiate_request = self._request('POST', f"{self._server}/bookinghub/negotiate?negotiateVersion=1",
+                                              headers=self._headers, timeout=10)
+            if negotiate_request.status_code != 200:
+                raise InvalidWodBusterResponse(f"Booking hub negotiation failed with status {negotiate_request.status_code}")
+            try:
+                self._negotiation = _Negotiation(json_loads(negotiate_request.content))
+            except (json.JSONDecodeError, UnicodeDecodeError, TypeError, KeyError) as e:
+                raise InvalidWodBusterResponse("Booking hub negotiation returned no connection token") from e
+        return self._negotiation
+
+    def wait_for(self, join_room_arguments: list, expected_events: list, deadline: float) -> bool:
+        """
+        Join a room of the hub and wait until one of the expected events is received
+        :param join_room_arguments: The arguments of the JoinRoom invocation (box name and day)
+        :param expected_events: The targets of the invocations to wait for
+        :param deadline: Timestamp (as time.time()) when waiting is over
+        :return: True if an expected event is received. False if the deadline is reached or the
+        client is closed
+        :raises RequestException: If the hub can't be reached after several attempts
+        :raises InvalidWodBusterResponse: If the hub keeps rejecting the connection
+        :raises HostUnavailable: If the SSE server keeps failing (see Scraper._request)
+        """
+        deadline = time.monotonic() + (deadline - time.time())
+        failed_attempts = 0
+        while not self._closed.is_set() and time.monotonic() < deadline:
+            connection = None
+            connected_at = time.monotonic()
+            try:
+                connection = self._connect()
+                connection.send({"protocol": "json", "version": 1})
+                connection.send({"arguments": join_room_arguments, "invocationId": "0",
+                                 "target": "JoinRoom", "type": _INVOCATION_MESSAGE})
+                event_found = self._listen(connection, expected_events, deadline)
+                if event_found is not None:
+                    return event_found
+                error = None
+            except HostUnavailable:
+                raise
+            except (requests.exceptions.RequestException, InvalidWodBusterResponse) as e:
+                error = e
+            finally:
+                if connection:
+                    connection.close()
+
+            if time.monotonic() - connected_at >= _SERVER_TIMEOUT_SECONDS:
+                failed_attempts = 0
+            failed_attempts += 1
+            if failed_attempts > _MAX_RECONNECT_ATTEMPTS:
+                if error:
+                    raise error
+                raise InvalidWodBusterResponse("Booking hub connection keeps closing")
+            self._backoff(failed_attempts, deadline, error)
+        return False
+
+    def close(self) -> None:
+        """
+        Stop waiting. wait_for returns False on its next wakeup
+        """
+        self._closed.set()
+
+    def _connect(self) -> _HubConnection:
+        negotiation = self.negotiate()
+        # WebSockets are not recorded, so the hub is reached with Server-Sent Events while recording
+        if _HUB_TRANSPORT == 'websockets' and not recorder.is_active() and 'WebSockets' in negotiation.transports and \
+                _websocket_unavailable_until.get(self._server, 0) < time.monotonic():
+            connection = _WebSocketConnection(self._server, negotiation, self._headers, self._cookies, self._origin)
+            try:
+                connection.open()
+                return connection
+            except InvalidWodBusterResponse as e:
+                logging.warning("%s. Using Server-Sent Events for %s", e, self._server)
+                _websocket_unavailable_until[self._server] = time.monotonic() + _WEBSOCKET_RETRY_SECONDS
+                negotiation = self.negotiate()
+
+        connection = _SSEConnection(self._server, negotiation, self._request, self._headers)
+        connection.open()
+        return connection
+
+    def _listen(self, connection: _HubConnection, expected_events: list, deadline: float):
+        """
+        Read the messages of an open connection
+        :return: True if an expected event is received, False if the deadline is reached or the
+        client is closed and None if the connection is lost
+        """
+        parser = HubMessageParser()
+        last_received = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= deadline or self._closed.is_set():
+                return False
+            if now - last_received >= _SERVER_TIMEOUT_SECONDS:
+                logging.warning("No message received from the booking hub in %s seconds. Reseting connection",
+                                _SERVER_TIMEOUT_SECONDS)
+                return None
+            if now - connection.last_sent >= _KEEPALIVE_INTERVAL_SECONDS:
+                connection.send({"type": _PING_MESSAGE})
+
+            # Wake up for the deadline, the next ping or the server timeout, whatever comes first
+            wakeup = min(deadline, connection.last_sent + _KEEPALIVE_INTERVAL_SECONDS,
+                         last_received + _SERVER_TIMEOUT_SECONDS)
+            try:
+                data = connection.messages.get(timeout=max(wakeup - time.monotonic(), 0))
+            except queue.Empty:
+                continue
+            if data is None:
+                logging.warning("Booking hub %s connection closed. Reseting connection...", connection.transport)
+                return None
+
+            last_received = time.monotonic()
+            for message in parser.feed(data):
+                message_type = message.get('type')
+                if message_type == _INVOCATION_MESSAGE and message.get('target') in expected_events:
+                    return True
+                if message_type == _COMPLETION_MESSAGE and message.get('error'):
+                    logging.warning("Booking hub rejected JoinRoom: %s", message['error'])
+                elif message_type == _CLOSE_MESSAGE:
+                    logging.warning("Booking hub closed the connection: %s", message.get('error'))
+                    return None
+                elif message_type is None and message.get('error'):
+                    raise InvalidWodBusterResponse(f"Booking hub handshake failed: {message['error']}")
+
+    def _backoff(self, attempt: int, deadline: float, error: Exception) -> None:
+        delay = random.uniform(0, min(_RECONNECT_MAX_DELAY_SECONDS, _RECONNECT_BASE_DELAY_SECONDS * 2 ** attempt))
+        delay = max(min(delay, deadline - time.monotonic()), 0)
+        logging.warning("Reconnecting to the booking hub in %.1f seconds (attempt %s)%s", delay, attempt,
+                        f": {error}" if error else "")
+        self._closed.wait(delay)
@@ -0,0 +1,221 @@
+"""
+Event-driven sync of the boxes. A watcher per box and date (today and the following days, up to
+WODBUSTER_BOX_WATCH_DAYS) stays in the room of the date in the booking hub, with the session of
+one user of the box. A changedBooking (the rosters changed) or a changedPizarra (the board
+changed) schedules a sync of that date only, for every user of the box, after
+WODBUSTER_BOX_WATCH_DEBOUNCE_SECONDS, so a burst of events is synced once.
+
+The boxes and users are the ones of the boxsync thread (booker.get_box_users). Like the other
+waits on the network, the watchers and the debounce use real time.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, date
+import pytz
+from flask import current_app as app
+from . import clock
+from .booker import get_box_users, sync_box_bookings
+from .scraper import get_scraper, wait_for_host
+from .exceptions import LoginError, PasswordRequired, InvalidBox, HostUnavailable
+from .models import db
+
+WATCH_DAYS = int(os.getenv('WODBUSTER_BOX_WATCH_DAYS', '2'))
+_DEBOUNCE_SECONDS = float(os.getenv('WODBUSTER_BOX_WATCH_DEBOUNCE_SECONDS', '30'))
+_WATCHED_EVENTS = ['changedBooking', 'changedPizarra']
+# A watcher joins its room again after this time, with the first user of the box able to log in
+_WAIT_SECONDS = 15 * 60
+# Seconds between the checks of the boxes and dates to watch
+_REFRESH_SECONDS = 5 * 60
+# Seconds waited after an unexpected error of the hub
+_RETRY_SECONDS = 60
+
+_MADRID_TZ = pytz.timezone('Europe/Madrid')
+
+
+class _PendingDates():
+    """
+    Dates of the boxes waiting for their debounced sync
+    """
+
+    def __init__(self, debounce_seconds: float):
+        self._debounce_seconds = debounce_seconds
+        self._condition = threading.Condition()
+        self._due = {}
+
+    def mark(self, box_url: str, watch_date: date) -> None:
+        """
+        Schedule the sync of a date of a box. A date already scheduled keeps its time, so the
+        events received until then are synced together
+        """
+        with self._condition:
+            if (box_url, watch_date) not in self._due:
+                self._due[(box_url, watch_date)] = time.monotonic() + self._debounce_seconds
+                self._condition.notify_all()
+
+    def take_due(self, timeout: float) -> list:
+        """
+        Block until some dates are due or the timeout is reached
+        :param timeout: The maximum seconds to wait
+        :return: The (box URL, date) due. They are no longer pending
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [key for key, due_at in self._due.items() if due_at <= now]
+                if due or now >= deadline:
+                    for key in due:
+                        del self._due[key]
+                    return due
+                self._condition.wait(min([deadline, *self._due.values()]) - now)
+
+
+class _Watcher():
+    """
+    Watcher of the room of a box and date in the booking hub
+    """
+
+    def __init__(self, box_url: str, watch_date: date):
+        self.box_url = box_url
+        self.watch_date = watch_date
+        # Whether the date was synced since the watcher joined its room
+        self.synced = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(app.app_context(),),
+                                        daemon=True, name=f"boxwatch-{watch_date}")
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop watching. The thread exits when its current wait is over
+        """
+        self._stop.set()
+
+    def _get_fetcher(self, failed_emails: set) -> tuple:
+        """
+        Get the session of the first user of the box that hasn't failed to log in
+        :return: The email, cookie and session state of the user, or None if there is none
+        """
+        try:
+            for user in get_box_users().get(self.box_url, []):
+                if user.email not in failed_emails:
+                    return user.email, user.cookie, user.session_state
+            return None
+        finally:
+            db.session.remove()
+
+    def _run(self, app_context) -> None:
+        app_context.push()
+        with app_context:
+            end = _MADRID_TZ.localize(datetime.combine(self.watch_date, datetime.max.time()))
+            failed_emails = set()
+            while not self._stop.is_set() and datetime.now(_MADRID_TZ) < end:
+                fetcher = self._get_fetcher(failed_emails)
+                if fetcher is None:
+                    logging.warning("No user of box %s can watch the classes of %s", self.box_url, self.watch_date)
+                    break
+                email, cookie, session_state = fetcher
+                try:
+                    scraper = get_scraper(email, cookie, session_state)
+                    if not self.synced:
+                        # Sync the changes made while the date wasn't watched
+                        _PENDING_DATES.mark(self.box_url, self.watch_date)
+                    max_datetime = min(end, datetime.now(_MADRID_TZ) + timedelta(seconds=_WAIT_SECONDS))
+                    if scraper.wait_until_event(self.box_url, self.watch_date, _WATCHED_EVENTS, max_datetime):
+                        logging.info("Hub event on %s for box %s. Scheduling its sync", self.watch_date, self.box_url)
+                        _PENDING_DATES.mark(self.box_url, self.watch_date)
+                except (LoginError, PasswordRequired) as e:
+                    logging.warning("User %s can't watch the classes of %s: %s", email, self.box_url, str(e))
+                    failed_emails.add(email)
+                except InvalidBox as e:
+                    logging.warning("Can't watch the classes of %s: %s", self.box_url, str(e))
+                    break
+                except HostUnavailable as e:
+                    self.synced = False
+                    wait_for_host(e.host, _RETRY_SECONDS)
+                except Exception:
+                    logging.exception("Error watching the classes of %s on %s", self.box_url, self.watch_date)
+                    self.synced = False
+                    self._stop.wait(_RETRY_SECONDS)
+
+            with _WATCHERS_LOCK:
+                if _WATCHERS.get((self.box_url, self.watch_date)) is self:
+                    del _WATCHERS[(self.box_url, self.watch_date)]
+
+
+_PENDING_DATES = _PendingDates(_DEBOUNCE_SECONDS)
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def is_watched(box_url: str, watch_date: date) -> bool:
+    """
+    Tell whether the classes of a box on a date are kept in sync by the hub events: a watcher is
+    in the room of the date and the date was synced since it joined
+    :param box_url: The WodBuster URL of the box
+    :param watch_date: The date of the classes
+    """
+    with _WATCHERS_LOCK:
+        watcher = _WATCHERS.get((box_url, watch_date))
+        return bool(watcher and watcher.synced)
+
+
+def _refresh_watchers() -> None:
+    """
+    Start the watchers of the dates to watch of every box and stop the ones no longer needed
+    """
+    today = clock.now().date()
+    watch_dates = [today + timedelta(days=offset) for offset in range(WATCH_DAYS)]
+    wanted = {(box_url, watch_date) for box_url in get_box_users() for watch_date in watch_dates}
+    with _WATCHERS_LOCK:
+        for key in list(_WATCHERS):
+            if key not in wanted:
+                _WATCHERS.pop(key).stop()
+        for key in wanted - set(_WATCHERS):
+            watcher = _Watcher(*key)
+            _WATCHERS[key] = watcher
+            watcher.start()
+
+
+def _sync_date(box_url: str, watch_date: date) -> None:
+    """
+    Sync a date of a box for all its users
+    """
+    users = get_box_users().get(box_url)
+    if not users:
+        return
+    result = sync_box_bookings(box_url, users, dates=[watch_date])
+    logging.info("Event sync of %s for box %s: %d new, %d updated, %d cancelled, %d unchanged",
+                 watch_date, box_url, result['new'], result['updated'], result['cancelled'], result['skipped'])
+    if result['success'] and not result['errors']:
+        with _WATCHERS_LOCK:
+            watcher = _WATCHERS.get((box_url, watch_date))
+            if watcher:
+                watcher.synced = True
+
+
+def box_watch_loop(app_context):
+    """
+    Keep the watchers of the boxes running and sync the dates of their events
+    :param app_context: The application context
+    """
+    app_context.push()
+    with app_context:
+        next_refresh = 0
+        while True:
+            try:
+                if time.monotonic() >= next_refresh:
+                    _refresh_watchers()
+                    next_refresh = time.monotonic() + _REFRESH_SECONDS
+                for box_url, watch_date in _PENDING_DATES.take_due(max(next_refresh - time.monotonic(), 0)):
+                    _sync_date(box_url, watch_date)
+            except Exception:
+                logging.exception("Unexpected error in box watch loop")
+                db.session.rollback()
+            finally:
+                # Don't keep the objects of the users in the session of the loop
+                db.session.remove()
@@ -0,0 +1,181 @@
+"""
+Time source of the booking engine and the background loops. Bookers, waiters, the notification
+scheduler and the events cleaner read the time and sleep through this module instead of calling
+datetime.now and time.sleep, so a SimulatedClock can be installed with set_clock to run days of
+window openings, penalizations and reminders in a few seconds.
+
+Waits on the network (booking hub events, hosts with an open circuit) keep using real time.
+"""
+from contextlib import contextmanager
+from datetime import datetime, tzinfo
+import heapq
+import itertools
+import threading
+import time
+
+
+class Clock():
+    """
+    Wall clock, used by default
+    """
+
+    def now(self, tz: tzinfo=None) -> datetime:
+        """
+        Get the current datetime
+        :param tz: The timezone of the result. Naive local time if not provided
+        :return: The current datetime
+        """
+        return datetime.now(tz)
+
+    def time(self) -> float:
+        """
+        Get the current time as seconds since the epoch
+        """
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Block the calling thread
+        :param seconds: The seconds to sleep
+        """
+        if seconds > 0:
+            time.sleep(seconds)
+
+    @contextmanager
+    def participant(self):
+        """
+        Register the calling thread as a participant of the simulation. Nothing to do for the
+        wall clock
+        """
+        yield
+
+
+class SimulatedClock(Clock):
+    """
+    Virtual clock. The time only moves when every participant thread is sleeping: it then jumps
+    to the earliest wake-up time and wakes the threads due. A participant that is running (on
+    the database, on a stubbed scraper…) holds the time still, so the threads observe the same
+    sequence of events as with the wall clock, only without the waits. A thread that sleeps
+    without being a participant is a participant for the duration of its sleep
+    """
+
+    def __init__(self, start: datetime=None):
+        """
+        Simulated clock construction
+        :param start: The initial datetime. The current one if not provided
+        """
+        self._now = (start or datetime.now()).timestamp()
+        self._condition = threading.Condition()
+        self._participants = 0
+        # Heap of [wake_at, sequence] entries, one per sleeping thread
+        self._sleepers = []
+        self._sequence = itertools.count()
+        self._local = threading.local()
+
+    def now(self, tz: tzinfo=None) -> datetime:
+        with self._condition:
+            return datetime.fromtimestamp(self._now, tz)
+
+    def time(self) -> float:
+        with self._condition:
+            return self._now
+
+    def sleep(self, seconds: float) -> None:
+        with self._condition:
+            temporary = not getattr(self._local, 'participant', False)
+            if temporary:
+                self._participants += 1
+            entry = [self._now + max(seconds, 0), next(self._sequence)]
+            heapq.heappush(self._sleepers, entry)
+            try:
+                self._advance()
+                while self._now < entry[0]:
+                    self._condition.wait()
+            finally:
+                # The entry is still queued if the thread was stopped while sleeping
+                if entry in self._sleepers:
+                    self._sleepers.remove(entry)
+                    heapq.heapify(self._sleepers)
+                if temporary:
+                    self._participants -= 1
+                    self._advance()
+
+    @contextmanager
+    def participant(self):
+        with self._condition:
+            nested = getattr(self._local, 'participant', False)
+            if not nested:
+                self._local.participant = True
+                self._participants += 1
+        try:
+            yield
+        finally:
+            if not nested:
+                with self._condition:
+                    self._local.participant = False
+                    self._participants -= 1
+                    self._advance()
+
+    def advance(self, seconds: float) -> None:
+        """
+        Move the time forward, waking the threads due
+        :param seconds: The seconds to advance
+        """
+        with self._condition:
+            self._now += max(seconds, 0)
+            self._advance()
+
+    def _advance(self) -> None:
+        # Called with the condition held
+        if self._sleepers and self._sleepers[0][0] > self._now and len(self._sleepers) >= self._participants:
+            self._now = self._sleepers[0][0]
+        woken = False
+        while self._sleepers and self._sleepers[0][0] <= self._now:
+            heapq.heappop(self._sleepers)
+            woken = True
+        if woken:
+            self._condition.notify_all()
+
+
+_clock = Clock()
+
+
+def get_clock() -> Clock:
+    """
+    Get the clock in use
+    """
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """
+    Replace the clock in use, e.g. by a SimulatedClock
+    :param clock: The new clock
+    :return: The previous clock
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def now(tz: tzinfo=None) -> datetime:
+    """
+    Get the current datetime of the clock in use
+    :param tz: The timezone of the result. Naive local time if not provided
+    """
+    return _clock.now(tz)
+
+
+def sleep(seconds: float) -> None:
+    """
+    Sleep on the clock in use
+    :param seconds: The seconds to sleep
+    """
+    _clock.sleep(seconds)
+
+
+def participant():
+    """
+    Context manager registering the calling thread as a participant of the clock in use
+    """
+    return _clock.participant()
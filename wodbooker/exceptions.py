@@ -56,3 +56,12 @@ class BookingLockedException(Exception):
     """
     Raises when booking is locked because user is using booking reservation in another place
     """
+
+class HostUnavailable(InvalidWodBusterResponse):
+    """
+    Raises when requests to a WodBuster host are not sent because it keeps failing
+    """
+
+    def __init__(self, message, host: str) -> None:
+        super().__init__(message)
+        self.host = host
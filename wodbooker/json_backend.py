@@ -0,0 +1,43 @@
+"""
+JSON encoding of the data exchanged with WodBuster: the handler responses, the booking hub
+messages and the stored session state. orjson is used when it is installed;
+WODBUSTER_JSON_BACKEND=json forces the standard library implementation.
+"""
+import json
+import logging
+import os
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+JSON_BACKEND = os.getenv('WODBUSTER_JSON_BACKEND', 'orjson' if HAS_ORJSON else 'json').lower()
+if JSON_BACKEND == 'orjson' and not HAS_ORJSON:
+    logging.warning("WODBUSTER_JSON_BACKEND is orjson but orjson is not installed. Using json")
+    JSON_BACKEND = 'json'
+
+_UTF8_BOM = b'\xef\xbb\xbf'
+
+
+def json_loads(data):
+    """
+    Decode a JSON document with the configured backend
+    :param data: The document as str or bytes
+    :raises json.JSONDecodeError: If the document is not valid JSON (orjson errors subclass it)
+    """
+    if isinstance(data, bytes) and data.startswith(_UTF8_BOM):
+        data = data[len(_UTF8_BOM):]
+    if JSON_BACKEND == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj) -> str:
+    """
+    Encode an object as JSON with the configured backend
+    """
+    if JSON_BACKEND == 'orjson':
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
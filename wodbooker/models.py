@@ -1,8 +1,34 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date
+from . import clock
 
 db = SQLAlchemy()
 
+# Rows per INSERT statement, below the SQLite limit of bound parameters (999 in older versions)
+_UPSERT_CHUNK_ROWS = 90
+
+
+def upsert_rows(model, rows: list, conflict_columns: tuple, update_columns: tuple=()) -> None:
+    """
+    Insert rows in bulk with INSERT ... ON CONFLICT, bypassing the ORM session. The caller commits
+    :param model: The model whose table receives the rows
+    :param rows: The rows as dictionaries of column values, all with the same keys
+    :param conflict_columns: The columns of the unique constraint the rows may collide with
+    :param update_columns: The columns updated on a collision. Colliding rows are left untouched
+    if none is given
+    """
+    table = model.__table__
+    for start in range(0, len(rows), _UPSERT_CHUNK_ROWS):
+        statement = sqlite_insert(table).values(rows[start:start + _UPSERT_CHUNK_ROWS])
+        if update_columns:
+            statement = statement.on_conflict_do_update(
+                index_elements=list(conflict_columns),
+                set_={column: statement.excluded[column] for column in update_columns})
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=list(conflict_columns))
+        db.session.execute(statement)
+
 
 class Booking(db.Model):
 
@@ -24,7 +50,7 @@ class Booking(db.Model):
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'))
-    date = db.Column(db.DateTime, default=datetime.now)
+    date = db.Column(db.DateTime, default=lambda: clock.now())
     event = db.Column(db.String(256))
 
     def __str__(self):
@@ -35,6 +61,8 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True)
     cookie = db.Column(db.String(1024))
+    cookie_expires_at = db.Column(db.DateTime, nullable=True, index=True)  # Expiry of the .WBAuth cookie (local time)
+    session_state = db.Column(db.Text, nullable=True)  # Clearance cookies and box metadata (JSON)
     force_login = db.Column(db.Boolean, default=False)
     mail_permission_success = db.Column(db.Boolean, default=True)
     mail_permission_failure = db.Column(db.Boolean, default=True)
@@ -43,7 +71,6 @@ class User(db.Model):
     athlete_id = db.Column(db.String(128), nullable=True)
     profile_picture_url = db.Column(db.String(512), nullable=True)
     wodbuster_bookings = db.relationship('WodBusterBooking', backref='user', lazy=True, cascade="all, delete-orphan")
-    training_descriptions = db.relationship('ClassTrainingDescription', backref='user', lazy=True, cascade="all, delete-orphan")
     
     # Push notification settings
     push_notifications_enabled = db.Column(db.Boolean, default=False)
@@ -89,7 +116,7 @@ class WodBusterBooking(db.Model):
     class_name = db.Column(db.String(128), nullable=True)
     class_type = db.Column(db.String(32), nullable=True)  # 'wod', 'openbox', etc.
     box_url = db.Column(db.String(128), nullable=False)
-    fetched_at = db.Column(db.DateTime, default=datetime.now)
+    fetched_at = db.Column(db.DateTime, default=lambda: clock.now())
     is_cancelled = db.Column(db.Boolean, default=False)
 
     # Unique constraint to prevent duplicates
@@ -109,7 +136,7 @@ class PushSubscription(db.Model):
     endpoint = db.Column(db.String(512), nullable=False)
     p256dh = db.Column(db.String(256), nullable=False)
     auth = db.Column(db.String(128), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=lambda: clock.now())
     
     # Unique constraint to prevent duplicate subscriptions
     __table_args__ = (db.UniqueConstraint('user_id', 'endpoint', name='_user_endpoint_uc'),)
@@ -120,25 +147,37 @@ class NotificationSent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     wodbuster_booking_id = db.Column(db.Integer, db.ForeignKey('wodbuster_booking.id'), nullable=False, index=True)
     reminder_minutes = db.Column(db.Integer, nullable=False)  # 60, 30, or 15
-    sent_at = db.Column(db.DateTime, default=datetime.now)
+    sent_at = db.Column(db.DateTime, default=lambda: clock.now())
     
     # Unique constraint to prevent duplicate notifications
     __table_args__ = (db.UniqueConstraint('wodbuster_booking_id', 'reminder_minutes', name='_booking_reminder_uc'),)
 
 
-class ClassTrainingDescription(db.Model):
-    __tablename__ = 'class_training_description'
+class BoxTrainingDescription(db.Model):
+    __tablename__ = 'box_training_description'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    box_url = db.Column(db.String(128), nullable=False)  # The pizarras are the same for every athlete of a box
     class_date = db.Column(db.Date, nullable=False, index=True)
     training_name = db.Column(db.String(128), nullable=False)  # e.g., "WOD", "CROSSFIT", "OPEN BOX"
     description = db.Column(db.Text, nullable=True)  # Cleaned text description
     id_pizarra = db.Column(db.Integer, nullable=False)  # ID to link with class (required for uniqueness)
-    fetched_at = db.Column(db.DateTime, default=datetime.now)
+    fetched_at = db.Column(db.DateTime, default=lambda: clock.now())
     
-    # Unique constraint to prevent duplicates per user, date, and id_pizarra
+    # Unique constraint to prevent duplicates per box, date, and id_pizarra
     # Using id_pizarra instead of training_name because multiple pizarras can have the same name
-    __table_args__ = (db.UniqueConstraint('user_id', 'class_date', 'id_pizarra', name='_user_date_pizarra_uc'),)
+    __table_args__ = (db.UniqueConstraint('box_url', 'class_date', 'id_pizarra', name='_box_date_pizarra_uc'),)
     
     def __str__(self):
         return f"{self.class_date.strftime('%d/%m/%Y')} - {self.training_name}"
+
+
+class SyncState(db.Model):
+    __tablename__ = 'sync_state'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(160), nullable=False)  # 'user:<id>' (booked classes) or 'box:<url>' (training descriptions)
+    class_date = db.Column(db.Date, nullable=False, index=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the LoadClass.ashx content the rows were written from
+    synced_at = db.Column(db.DateTime, default=lambda: clock.now())
+
+    # One state per scope and date
+    __table_args__ = (db.UniqueConstraint('scope', 'class_date', name='_scope_date_uc'),)
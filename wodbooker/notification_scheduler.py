@@ -1,8 +1,8 @@
 import logging
 from datetime import datetime, timedelta
-import time
 import pytz
-from .models import db, User, WodBusterBooking, NotificationSent
+from . import clock
+from .models import db, upsert_rows, User, WodBusterBooking, NotificationSent
 from .push_notifications import send_class_reminder
 
 _MADRID_TZ = pytz.timezone('Europe/Madrid')
@@ -13,10 +13,10 @@ def _notification_scheduler_loop(app_context):
     Background thread to check for upcoming classes and send push notifications
     """
     app_context.push()
-    with app_context:
+    with app_context, clock.participant():
         while True:
             try:
-                now = datetime.now(_MADRID_TZ)
+                now = clock.now(_MADRID_TZ)
                 
                 # Only check classes in the next 24 hours to avoid processing too many
                 min_class_time = now
@@ -62,6 +62,7 @@ def _notification_scheduler_loop(app_context):
                         query = query.filter(User.push_reminder_15m == True)
                     
                     bookings = query.all()
+                    sent_reminders = []
                     
                     logging.debug("Found %d bookings to check for %d-minute reminders", len(bookings), reminder_minutes)
                     
@@ -104,21 +105,25 @@ def _notification_scheduler_loop(app_context):
                                     class_datetime.strftime('%Y-%m-%d %H:%M:%S')
                                 )
                                 
-                                # Send notification
-                                success_count = send_class_reminder(
-                                    booking.user,
-                                    booking,
-                                    reminder_minutes
-                                )
+                                # Send notification. An error doesn't stop the round, so the
+                                # reminders already sent in it are still recorded below
+                                try:
+                                    success_count = send_class_reminder(
+                                        booking.user,
+                                        booking,
+                                        reminder_minutes
+                                    )
+                                except Exception:
+                                    logging.exception("Error sending reminder for booking %d", booking.id)
+                                    success_count = 0
                                 
                                 if success_count > 0:
                                     # Record that notification was sent
-                                    notification_sent = NotificationSent(
-                                        wodbuster_booking_id=booking.id,
-                                        reminder_minutes=reminder_minutes
-                                    )
-                                    db.session.add(notification_sent)
-                                    db.session.commit()
+                                    sent_reminders.append({
+                                        'wodbuster_booking_id': booking.id,
+                                        'reminder_minutes': reminder_minutes,
+                                        'sent_at': clock.now()
+                                    })
                                     logging.info(
                                         "Sent %d reminder(s) for booking %d (%d minutes before class at %s)",
                                         success_count,
@@ -139,6 +144,11 @@ def _notification_scheduler_loop(app_context):
                                     booking.id,
                                     reminder_minutes
                                 )
+
+                    # One statement for the reminders sent in this round
+                    if sent_reminders:
+                        upsert_rows(NotificationSent, sent_reminders, ('wodbuster_booking_id', 'reminder_minutes'))
+                        db.session.commit()
                 
                 # Clean up old notification records (older than 7 days)
                 cutoff_date = now - timedelta(days=7)
@@ -159,5 +169,5 @@ def _notification_scheduler_loop(app_context):
                 logging.exception("Error in notification scheduler loop: %s", str(e))
             
             # Sleep for 1 minute before checking again
-            time.sleep(60)
+            clock.sleep(60)
 
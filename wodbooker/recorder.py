@@ -0,0 +1,375 @@
+"""
+Record and replay of the HTTP traffic with WodBuster. With WODBUSTER_RECORD_TRAFFIC set to a
+file, every request sent by the scrapers (login, handlers, hub negotiation, commands and event
+streams) is written, sanitized, to a gzipped JSON Lines archive. With WODBUSTER_REPLAY_TRAFFIC
+set to an archive, the scrapers are served the recorded responses instead, with their original
+latency and stream timing divided by WODBUSTER_REPLAY_SPEED (0 replays without delays).
+
+Sanitization replaces passwords and emails of login forms, the ASP.NET state of the login forms
+(__VIEWSTATE*, __EVENTVALIDATION and CSRFToken), email addresses, cookie values, the names of the
+athletes enrolled in classes, the paths of their profile pictures and every athlete UUID (like
+the idu parameter of the handlers), so archives can be shared. A UUID is replaced by a UUID
+derived from it, so the requests of an athlete still match on replay; a replayed user finds its
+own classes with the derived athlete ID.
+"""
+import atexit
+import gzip
+import http.client
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3._collections import HTTPHeaderDict
+
+_EMAIL_PATTERN = re.compile(r'[\w.+-]+(?:@|%40)[\w-]+(?:\.[\w-]+)+')
+_REDACTED_EMAIL = 'user@example.com'
+_REDACTED = 'redacted'
+# Login form fields holding credentials or the ASP.NET state of the form
+_SENSITIVE_FIELD_PATTERN = re.compile(r'Password|Email|Uid|__VIEWSTATE|__EVENTVALIDATION|CSRFToken', re.IGNORECASE)
+# ASP.NET state in the login page (hidden inputs, rendered with the value last) and in the
+# responses of its asynchronous postbacks (|hiddenField|<name>|<value>|)
+_FORM_STATE_NAMES = r'(?:__VIEWSTATE\w*|__EVENTVALIDATION|CSRFToken)'
+_FORM_STATE_INPUT_PATTERN = re.compile(
+    r'(<input\b[^>]*?\b(?:id|name)\s*=\s*["\']?' + _FORM_STATE_NAMES + r'["\']?[^>]*?\bvalue\s*=\s*)("[^"]*"|\'[^\']*\')',
+    re.IGNORECASE)
+_FORM_STATE_FIELD_PATTERN = re.compile(r'(\|hiddenField\|' + _FORM_STATE_NAMES + r'\|)[^|]*')
+# The three directories of a profile picture path, before the athlete UUID
+_PROFILE_PICTURE_PATH_PATTERN = re.compile(r'(/static/atletas/)[^/"\'\s\\]+/[^/"\'\s\\]+/[^/"\'\s\\]+/')
+# UUIDs with or without dashes, like the athlete IDs in the rosters and in the idu parameter
+_UUID_PATTERN = re.compile(r'(?<![0-9a-fA-F])[0-9a-fA-F]{8}(-?)[0-9a-fA-F]{4}\1[0-9a-fA-F]{4}\1[0-9a-fA-F]{4}\1'
+                           r'[0-9a-fA-F]{12}(?![0-9a-fA-F])')
+_UUID_NAMESPACE = uuid.UUID('5b0d8e4c-3f4a-4c1e-9f2b-7a6d1c0e8b93')
+# Headers that describe the encoding of the original body, which is stored decoded
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+# Query parameters that change on every request (cache busters), ignored when matching a replay
+_VOLATILE_PARAMETERS = ('_',)
+
+
+def _encode_body(data: bytes) -> str:
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def _decode_body(text: str) -> bytes:
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def _derived_uuid(match) -> str:
+    derived = uuid.uuid5(_UUID_NAMESPACE, match.group(0).replace('-', '').lower())
+    return str(derived) if match.group(1) else derived.hex
+
+
+def _sanitize_text(text: str) -> str:
+    text = _EMAIL_PATTERN.sub(_REDACTED_EMAIL, text)
+    text = _FORM_STATE_INPUT_PATTERN.sub(rf'\1"{_REDACTED}"', text)
+    text = _FORM_STATE_FIELD_PATTERN.sub(rf'\1{_REDACTED}', text)
+    text = _PROFILE_PICTURE_PATH_PATTERN.sub(rf'\1{_REDACTED}/{_REDACTED}/{_REDACTED}/', text)
+    return _UUID_PATTERN.sub(_derived_uuid, text)
+
+
+def _sanitize_request_body(body) -> str:
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = _encode_body(body)
+    if '=' in body and not body.lstrip().startswith('{'):
+        fields = parse_qsl(body, keep_blank_values=True)
+        if fields:
+            return urlencode([(name, _REDACTED if _SENSITIVE_FIELD_PATTERN.search(name) else value)
+                              for name, value in fields])
+    return _sanitize_text(body)
+
+
+def _sanitize_set_cookie(value: str) -> str:
+    name, _, attributes = value.partition(';')
+    return f"{name.split('=', 1)[0]}={_REDACTED};{attributes}" if attributes else f"{name.split('=', 1)[0]}={_REDACTED}"
+
+
+class _AthleteNames():
+    """
+    Replaces the names of the athletes of LoadClass.ashx responses. The same name is always
+    replaced by the same alias
+    """
+
+    def __init__(self):
+        self._aliases = {}
+        self._lock = threading.Lock()
+
+    def sanitize(self, body: str) -> str:
+        try:
+            response = json.loads(body)
+        except ValueError:
+            return body
+        if not isinstance(response, dict):
+            return body
+        with self._lock:
+            for class_data in response.get('Data') or ():
+                for valor_data in class_data.get('Valores') or ():
+                    for athlete in (valor_data.get('Valor') or {}).get('AtletasEntrenando') or ():
+                        if athlete.get('Nombre'):
+                            athlete['Nombre'] = self._aliases.setdefault(athlete['Nombre'],
+                                                                         f"Atleta {len(self._aliases) + 1}")
+        return json.dumps(response, ensure_ascii=False, separators=(',', ':'))
+
+
+def _sanitize_response_body(url: str, body: str, athlete_names: _AthleteNames) -> str:
+    if 'LoadClass.ashx' in url:
+        body = athlete_names.sanitize(body)
+    return _sanitize_text(body)
+
+
+def _replay_key(method: str, url: str) -> tuple:
+    parts = urlsplit(url)
+    query = urlencode([(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if name not in _VOLATILE_PARAMETERS])
+    return method.upper(), urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+
+class _RecordingStream():
+    """
+    Wraps the raw response of a stream to record the chunks read and when they were received
+    """
+
+    def __init__(self, raw, on_close):
+        self._raw = raw
+        self._on_close = on_close
+        self._start = time.monotonic()
+        self.chunks = []
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _record(self, data):
+        if data:
+            self.chunks.append([round(time.monotonic() - self._start, 4), _encode_body(data)])
+        return data
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        try:
+            for data in self._raw.stream(amt, decode_content=decode_content):
+                yield self._record(data)
+        finally:
+            self._finish()
+
+    def read(self, amt=None, *args, **kwargs):
+        return self._record(self._raw.read(amt, *args, **kwargs))
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+    def _finish(self):
+        if self._on_close:
+            on_close, self._on_close = self._on_close, None
+            on_close(self.chunks)
+
+
+class TrafficRecorder(HTTPAdapter):
+    """
+    Transport adapter that sends the requests to WodBuster and records them
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._athlete_names = _AthleteNames()
+        atexit.register(self.close_archive)
+        logging.warning("Recording WodBuster traffic to %s", path)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        sent_at = time.time()
+        start = time.monotonic()
+        try:
+            response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        except requests.exceptions.RequestException as e:
+            self._write(request, sent_at, time.monotonic() - start, error=type(e).__name__)
+            raise
+        elapsed = time.monotonic() - start
+
+        if stream and response.status_code == 200:
+            response.raw = _RecordingStream(response.raw,
+                                            lambda chunks: self._write(request, sent_at, elapsed, response, chunks=chunks))
+        else:
+            self._write(request, sent_at, elapsed, response, body=response.content)
+        return response
+
+    def _write(self, request, sent_at, elapsed, response=None, body=None, chunks=None, error=None) -> None:
+        entry = {
+            't': round(sent_at - self._start, 4),
+            'method': request.method,
+            'url': _sanitize_text(request.url),
+            'body': _sanitize_request_body(request.body),
+            'elapsed': round(elapsed, 4),
+        }
+        if error:
+            entry['error'] = error
+        if response is not None:
+            headers = []
+            for name, value in response.raw.headers.items():
+                if name.lower() in _DROPPED_HEADERS:
+                    continue
+                headers.append([name, _sanitize_set_cookie(value) if name.lower() == 'set-cookie' else value])
+            entry['status'] = response.status_code
+            entry['reason'] = response.reason
+            entry['headers'] = headers
+        if body is not None:
+            entry['response'] = _sanitize_response_body(request.url, _encode_body(body), self._athlete_names)
+        if chunks is not None:
+            entry['chunks'] = [[offset, _sanitize_text(data)] for offset, data in chunks]
+
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+                self._file.flush()
+
+    def close_archive(self) -> None:
+        """
+        Close the archive. Requests sent afterwards are not recorded
+        """
+        with self._lock:
+            self._file.close()
+
+
+class _ReplayedRaw():
+    """
+    Raw response served from a recording. Chunks are returned when their recorded time is due
+    """
+
+    def __init__(self, entry: dict, speed: float):
+        self.status = entry['status']
+        self.reason = entry.get('reason')
+        self.headers = HTTPHeaderDict()
+        message = http.client.HTTPMessage()
+        for name, value in entry.get('headers') or ():
+            self.headers.add(name, value)
+            message[name] = value
+        # Read by requests to extract the cookies
+        self._original_response = type('OriginalResponse', (), {'msg': message})()
+        self._speed = speed
+        self._start = time.monotonic()
+        if 'chunks' in entry:
+            self._chunks = [(offset, _decode_body(data)) for offset, data in entry['chunks']]
+        else:
+            self._chunks = [(0, _decode_body(entry.get('response') or ''))]
+        self._closed = False
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        while self._chunks and not self._closed:
+            offset, data = self._chunks.pop(0)
+            if self._speed:
+                delay = self._start + offset / self._speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield data
+
+    def read(self, amt=None, *args, **kwargs):
+        return b''.join(self.stream())
+
+    def close(self):
+        self._closed = True
+
+    def release_conn(self):
+        pass
+
+
+class TrafficReplayer(HTTPAdapter):
+    """
+    Transport adapter that serves the responses of a recorded archive. Requests are matched by
+    method and URL (ignoring cache busters) in the recorded order; once the recordings of a
+    request are exhausted the last one is served again
+    """
+
+    def __init__(self, path: str, speed: float=1.0):
+        super().__init__()
+        self._speed = speed
+        self._entries = {}
+        self._lock = threading.Lock()
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                entry = json.loads(line)
+                self._entries.setdefault(_replay_key(entry['method'], entry['url']), []).append(entry)
+        self._cursors = {key: 0 for key in self._entries}
+        logging.warning("Replaying WodBuster traffic from %s (%d requests, speed %s)", path,
+                        sum(map(len, self._entries.values())), speed or 'unlimited')
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = _replay_key(request.method, _sanitize_text(request.url))
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise requests.exceptions.ConnectionError(f"No recorded response for {request.method} {request.url}",
+                                                          request=request)
+            entry = entries[min(self._cursors[key], len(entries) - 1)]
+            self._cursors[key] += 1
+
+        if self._speed:
+            time.sleep(entry['elapsed'] / self._speed)
+        if 'error' in entry:
+            error = getattr(requests.exceptions, entry['error'], requests.exceptions.ConnectionError)
+            raise error(f"Recorded {entry['error']}", request=request)
+        return self.build_response(request, _ReplayedRaw(entry, self._speed))
+
+
+_RECORD_PATH = os.getenv('WODBUSTER_RECORD_TRAFFIC')
+_REPLAY_PATH = os.getenv('WODBUSTER_REPLAY_TRAFFIC')
+_REPLAY_SPEED = float(os.getenv('WODBUSTER_REPLAY_SPEED', '1'))
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def is_active() -> bool:
+    """
+    Tell whether the traffic is being recorded or replayed
+    """
+    return bool(_RECORD_PATH or _REPLAY_PATH)
+
+
+def _get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            if _REPLAY_PATH:
+                if _RECORD_PATH:
+                    logging.warning("WODBUSTER_RECORD_TRAFFIC is ignored while replaying traffic")
+                _transport = TrafficReplayer(_REPLAY_PATH, _REPLAY_SPEED)
+            else:
+                _transport = TrafficRecorder(_RECORD_PATH)
+        return _transport
+
+
+def mount(session: requests.Session) -> None:
+    """
+    Send the requests of a session through the recorder or the replayer, if any is configured
+    :param session: The session, usually a new one
+    """
+    if not is_active():
+        return
+    transport = _get_transport()
+    session.mount('https://', transport)
+    session.mount('http://', transport)
+
+
+def load_responses(path: str, handler: str) -> list:
+    """
+    Get the recorded responses of a WodBuster handler, e.g. to benchmark the parsers
+    :param path: The archive
+    :param handler: The handler file name, like LoadClass.ashx
+    :return: The response bodies as bytes, in recorded order
+    """
+    responses = []
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            entry = json.loads(line)
+            if entry.get('status') == 200 and 'response' in entry and \
+                    urlsplit(entry['url']).path.endswith(f'/{handler}'):
+                responses.append(_decode_body(entry['response']))
+    return responses
@@ -0,0 +1,222 @@
+"""
+Parsed representation of the WodBuster LoadClass.ashx response. The response is walked once
+and turned into compact records with precomputed lookups, so booking, sync and the weekly
+view don't have to scan the raw JSON on their own.
+"""
+import datetime
+import re
+import pytz
+
+_MADRID_TZ = pytz.timezone('Europe/Madrid')
+_ATHLETE_ID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}')
+
+
+def normalize_athlete_id(athlete_id: str) -> str:
+    """
+    Normalize an athlete ID so IDs with and without dashes can be compared
+    :param athlete_id: The athlete ID, with or without dashes
+    :return: The athlete ID in lower case and without dashes
+    """
+    return athlete_id.replace('-', '').lower()
+
+
+def _parse_time(hour: str):
+    try:
+        time_parts = hour.split(':')
+        return datetime.time(int(time_parts[0]), int(time_parts[1]), int(time_parts[2]) if len(time_parts) > 2 else 0)
+    except (ValueError, IndexError):
+        return None
+
+
+class Athlete():
+    """
+    An athlete enrolled in a class
+    """
+    __slots__ = ('id', 'name', 'url')
+
+    def __init__(self, athlete_id: str, name: str, url: str):
+        self.id = athlete_id
+        self.name = name
+        self.url = url
+
+
+class ClassSlot():
+    """
+    One of the class types (wod, openbox, etc.) offered at a given hour
+    """
+    __slots__ = ('index', 'id', 'name', 'full_name', 'status', 'training_type', 'seats', 'id_pizarra', 'athletes')
+
+    def __init__(self, index: int, valor_data: dict):
+        valor = valor_data.get('Valor') or {}
+        self.index = index
+        self.id = valor.get('Id')
+        self.name = valor_data.get('Nombre', '')
+        self.full_name = valor_data.get('NombreE')
+        self.status = valor_data.get('TipoEstado')
+        self.training_type = valor.get('IdTipoEntrenamiento', 1)
+        self.seats = valor.get('Plazas')
+        self.id_pizarra = valor.get('IdPizarra')
+        self.athletes = tuple(
+            Athlete(_extract_athlete_id(atleta.get('Url', '')), atleta.get('Nombre'), atleta.get('Url', ''))
+            for atleta in valor.get('AtletasEntrenando') or ())
+
+    @property
+    def class_type(self) -> str:
+        """
+        The class type as stored in WodBusterBooking. Common training types are 1=Wod,
+        2=OpenBox and 7=OpenBox*
+        """
+        if self.training_type == 1:
+            return 'wod'
+        if self.training_type in (2, 7):
+            return 'openbox'
+        return f'type_{self.training_type}'
+
+    @property
+    def is_full(self) -> bool:
+        """
+        Whether there are no seats left in the class
+        """
+        return self.seats is not None and len(self.athletes) >= self.seats
+
+
+class ScheduledClass():
+    """
+    The classes offered at a given hour
+    """
+    __slots__ = ('hour', 'time', 'slots')
+
+    def __init__(self, hour: str, slots: tuple):
+        self.hour = hour
+        self.time = _parse_time(hour)
+        self.slots = slots
+
+
+class ListedClass():
+    """
+    A class of the ListClases summary used by the weekly view
+    """
+    __slots__ = ('hour', 'name', 'type_id', 'id', 'removable')
+
+    def __init__(self, list_class: dict):
+        self.hour = list_class.get('Hora', '')
+        self.type_id = list_class.get('IdE')
+        self.name = list_class.get('NombreE', f'Type {self.type_id}')
+        self.id = list_class.get('Id')
+        self.removable = list_class.get('Borrable')
+
+
+def _extract_athlete_id(url: str):
+    match = _ATHLETE_ID_PATTERN.search(url)
+    return normalize_athlete_id(match.group(0)) if match else None
+
+
+class DaySchedule():
+    """
+    The schedule of a box for a given day, built once from a LoadClass.ashx response
+    """
+    __slots__ = ('date', 'classes', 'listed_classes', 'published_at', 'descriptions_raw',
+                 'pizarra_names', '_by_hour', '_by_training_type', '_by_athlete', '_unmatched_athletes')
+
+    def __init__(self, date: datetime.date, classes: tuple, listed_classes: tuple,
+                 published_at: datetime.datetime, descriptions_raw: str):
+        self.date = date
+        self.classes = classes
+        self.listed_classes = listed_classes
+        self.published_at = published_at
+        self.descriptions_raw = descriptions_raw
+        self.pizarra_names = {}
+        self._by_hour = {}
+        self._by_training_type = {}
+        self._by_athlete = {}
+        # Athletes whose URL has no ID, as (URL, class key)
+        self._unmatched_athletes = []
+
+        for class_index, scheduled_class in enumerate(classes):
+            # The first class of an hour is the one booked, as before the schedule was parsed
+            self._by_hour.setdefault(scheduled_class.hour, scheduled_class)
+            for slot in scheduled_class.slots:
+                self._by_training_type.setdefault(slot.training_type, []).append(slot)
+                for athlete in slot.athletes:
+                    if athlete.id:
+                        self._by_athlete.setdefault(athlete.id, {})[(class_index, slot.index)] = (scheduled_class, slot)
+                    elif athlete.url:
+                        self._unmatched_athletes.append((athlete.url, (class_index, slot.index)))
+
+                # Map of IdPizarra -> class type name, preferring NombreE (more specific) over Nombre
+                class_name = slot.full_name or slot.name
+                if slot.id_pizarra and class_name and (slot.id_pizarra not in self.pizarra_names or slot.full_name):
+                    self.pizarra_names[slot.id_pizarra] = class_name
+
+    @classmethod
+    def from_response(cls, response: dict, date: datetime.date) -> 'DaySchedule':
+        """
+        Build the schedule from a LoadClass.ashx response
+        :param response: The parsed JSON response
+        :param date: The day the response belongs to
+        """
+        response = response or {}
+        classes = tuple(
+            ScheduledClass(class_data.get('Hora', ''),
+                           tuple(ClassSlot(index, valor_data)
+                                 for index, valor_data in enumerate(class_data.get('Valores') or ())))
+            for class_data in response.get('Data') or ())
+        listed_classes = tuple(ListedClass(list_class) for list_class in response.get('ListClases') or ())
+
+        published_at = None
+        if "PrimeraHoraPublicacion" in response:
+            published_at = _MADRID_TZ.localize(datetime.datetime.strptime(response["PrimeraHoraPublicacion"],
+                                                                          '%m/%d/%Y %H:%M:%S'))
+
+        return cls(date, classes, listed_classes, published_at, response.get('ClasesDesc', '[]'))
+
+    def get_class(self, hour: str):
+        """
+        Get the classes offered at a given hour
+        :param hour: The hour in %H:%M:%S format
+        :return: The ScheduledClass or None if there is no class at that hour
+        """
+        return self._by_hour.get(hour)
+
+    def get_slot(self, hour: str, index: int):
+        """
+        Get a class type offered at a given hour
+        :param hour: The hour in %H:%M:%S format
+        :param index: The position of the class type (0 for wod, 1 for openbox in mixed hours)
+        :return: The ClassSlot or None if there is no such class
+        """
+        scheduled_class = self._by_hour.get(hour)
+        if scheduled_class and 0 <= index < len(scheduled_class.slots):
+            return scheduled_class.slots[index]
+        return None
+
+    def get_slots_by_training_type(self, training_type: int) -> list:
+        """
+        Get every class of a given training type (IdTipoEntrenamiento)
+        """
+        return self._by_training_type.get(training_type, [])
+
+    def get_athlete_classes(self, athlete_id: str) -> list:
+        """
+        Get the classes an athlete is enrolled in
+        :param athlete_id: The athlete ID, with or without dashes
+        :return: A list of (ScheduledClass, ClassSlot) tuples in schedule order
+        """
+        normalized_id = normalize_athlete_id(athlete_id)
+        classes = self._by_athlete.get(normalized_id, {})
+        # Athletes whose URL has no ID in the expected format are matched by substring
+        fallback_keys = {key for url, key in self._unmatched_athletes
+                         if athlete_id in url or normalized_id in normalize_athlete_id(url)}
+        if not fallback_keys:
+            return list(classes.values())
+        keys = fallback_keys | set(classes)
+        return [(scheduled_class, slot) for class_index, scheduled_class in enumerate(self.classes)
+                for slot in scheduled_class.slots if (class_index, slot.index) in keys]
+
+    def is_athlete_in(self, athlete_id: str, hour: str) -> bool:
+        """
+        Tell whether an athlete is enrolled in any class at the given hour
+        :param athlete_id: The athlete ID, with or without dashes
+        :param hour: The hour in %H:%M:%S format
+        """
+        return any(scheduled_class.hour == hour for scheduled_class, _ in self.get_athlete_classes(athlete_id))
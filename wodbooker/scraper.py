@@ -1,16 +1,31 @@
 import datetime
+import hashlib
+import html
+import os
 import re
 import pickle
 import logging
 import json
+import socket
+import sys
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
 import requests
-import sseclient
+from requests.cookies import RequestsCookieJar, create_cookie
 import cloudscraper
 import pytz
 from bs4 import BeautifulSoup
 from .exceptions import LoginError, InvalidWodBusterResponse, \
     BookingNotAvailable, ClassIsFull, PasswordRequired, InvalidBox, \
-    ClassNotFound, BookingFailed, BookingPenalization, BookingLockedException
+    ClassNotFound, BookingFailed, BookingPenalization, BookingLockedException, HostUnavailable
+from .schedule import DaySchedule
+from .booking_hub import BookingHubClient
+from . import recorder
+from .json_backend import json_loads as _json_loads, json_dumps as _json_dumps
 
 # Training description logger (file-only, no console)
 training_desc_logger = logging.getLogger('training_descriptions')
@@ -22,8 +37,166 @@ _HEADERS = {
 _UTC_TZ = pytz.timezone('UTC')
 _MADRID_TZ = pytz.timezone('Europe/Madrid')
 _WODBUSTER_NOT_ACCEPTING_REQUESTS_MESSAGE = "WodBuster is not accepting more requests at this time. Try again in a minute"
+# Text of the login page, served when the redirect of a request with a rejected cookie is followed
+_LOGIN_PAGE_MARKER = "Pon tu usuario y contraseña para acceder a reservar tus clases"
 _MORE_THAN_ONE_BOX_MESSAGE = "User can access more than to boxes"
 
+# Connections idle for longer than this are assumed to be closed by WodBuster
+_KEEPALIVE_IDLE_SECONDS = 30
+# Upper bound for pre-warmed connections (requests keeps at most 10 per host in its pool)
+_MAX_PREWARM_CONNECTIONS = 10
+# Maximum number of days of a week fetched at the same time. The 7 days take three rounds
+# instead of opening one connection per day to the host of the box
+_WEEK_FETCH_WORKERS = 3
+
+# <br> and </p> become line breaks and any other tag is dropped. A tag is allowed to contain
+# <br> and </p> so the result is the same as replacing those first and stripping tags afterwards
+_HTML_TOKEN_PATTERN = re.compile(r'((?i:<br\s*/?>)|</p>)|<(?:[^<]|(?i:<br\s*/?>)|</p>)+?>')
+_BLANK_LINES_PATTERN = re.compile(r'\n\s*\n+')
+# Input tags (attribute values may contain '>') and their attributes, used to read the ASP.NET
+# form fields without parsing the whole page
+_INPUT_TAG_PATTERN = re.compile(r'<input\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.IGNORECASE)
+_TAG_ATTRIBUTE_PATTERN = re.compile(r'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+_LOGIN_FIELDS = ('__VIEWSTATEC', '__EVENTVALIDATION', 'CSRFToken')
+_PROFILE_PICTURE_PATTERN = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']?([^"\'\s>]*cdn\.wodbuster\.com/static/atletas/[^"\'\s>]*)',
+                                      re.IGNORECASE)
+# Box names found in training description headers like "WodMayanti Box" (order matters)
+_BOX_NAME_PATTERNS = ('Mayanti Box', 'Box', 'CrossFit')
+# Training type at the start of a header: immediately followed by a letter (like "WodMayanti"),
+# followed by spaces or alone
+_TRAINING_TYPE_PATTERN = re.compile(r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)(?:(?=[A-Z])|\s+|$)',
+                                    re.IGNORECASE)
+
+
+# With "expiry" a stored cookie is trusted until its .WBAuth cookie expires (or WodBuster
+# redirects to the login page) instead of being checked against roadtobox.aspx on every login
+_COOKIE_VALIDATION = os.getenv('WODBUSTER_COOKIE_VALIDATION', 'expiry').lower()
+# Cookies expiring sooner than this are probed even in "expiry" mode
+_COOKIE_EXPIRY_MARGIN_SECONDS = 60
+
+# Size of the scraper registry. Least recently used scrapers are evicted above this size and
+# after being idle for the given seconds, unless a running Booker pins them
+_SCRAPER_REGISTRY_MAX_SIZE = int(os.getenv('WODBUSTER_SCRAPER_CACHE_SIZE', '200'))
+_SCRAPER_REGISTRY_MAX_IDLE_SECONDS = float(os.getenv('WODBUSTER_SCRAPER_IDLE_SECONDS', '7200'))
+# Rough memory held by a cloudscraper session and by each per-host connection pool
+_SESSION_APPROXIMATE_BYTES = 64 * 1024
+_POOL_APPROXIMATE_BYTES = 32 * 1024
+
+# Idle HTTP sessions kept per user. Concurrent requests of the same user beyond this number
+# use extra sessions that are closed afterwards
+_MAX_IDLE_SESSIONS = 10
+
+# Box name and SSE server discovered from the box homepage are persisted and trusted for this time
+_BOX_METADATA_TTL_SECONDS = 7 * 24 * 60 * 60
+# Cloudflare cookies (cf_clearance, __cf_bm, _cfuvid...) persisted with the session state
+_CLEARANCE_COOKIE_PREFIXES = ('cf_', '__cf', '_cf')
+
+# First byte of pickles (protocol 2+), used to read cookies stored before the JSON format
+_PICKLE_PROTOCOL_MARKER = b'\x80'
+
+
+def _day_content_hash(response) -> str:
+    """
+    Hash the parts of a LoadClass.ashx response the syncs depend on: the classes with their
+    rosters and the training descriptions. The fields that depend on the user who fetched the day
+    (like the status of the classes for them) are left out, so the day fetched by any user of a
+    box has the same hash
+    """
+    if not isinstance(response, dict):
+        return hashlib.sha256(b'').hexdigest()
+    try:
+        classes = []
+        for class_data in response.get('Data') or ():
+            for valor_data in class_data.get('Valores') or ():
+                valor = valor_data.get('Valor') or {}
+                classes.append([class_data.get('Hora'), valor_data.get('Nombre'), valor_data.get('NombreE'),
+                                valor.get('Id'), valor.get('IdTipoEntrenamiento'), valor.get('IdPizarra'),
+                                [atleta.get('Url') for atleta in valor.get('AtletasEntrenando') or ()]])
+    except (AttributeError, TypeError):
+        # An unexpected response is not parsed either, so its hash is never stored
+        classes = response.get('Data')
+    return hashlib.sha256(_json_dumps([classes, response.get('ClasesDesc')]).encode('utf-8')).hexdigest()
+
+
+def serialize_cookies(cookies) -> str:
+    """
+    Serialize cookies in the compact form stored on User.cookie
+    :param cookies: An iterable of cookies, like a RequestsCookieJar
+    :return: A JSON list of [name, value, domain, path, expires, secure] entries
+    """
+    return _json_dumps([[cookie.name, cookie.value, cookie.domain, cookie.path, cookie.expires, cookie.secure]
+                        for cookie in cookies])
+
+
+def deserialize_cookies(cookie) -> RequestsCookieJar:
+    """
+    Load cookies stored with serialize_cookies. Cookies stored by previous versions as a pickled
+    RequestsCookieJar are also accepted
+    :param cookie: The stored cookies as str or bytes
+    :raises ValueError: If the cookies can't be decoded
+    """
+    if isinstance(cookie, bytes) and cookie.startswith(_PICKLE_PROTOCOL_MARKER):
+        try:
+            return pickle.loads(cookie)
+        except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+            raise ValueError("Invalid pickled cookies") from e
+
+    jar = RequestsCookieJar()
+    try:
+        for name, value, domain, path, expires, secure in _json_loads(cookie):
+            jar.set_cookie(create_cookie(name, value, domain=domain, path=path, expires=expires, secure=secure))
+    except (json.JSONDecodeError, UnicodeDecodeError, TypeError) as e:
+        raise ValueError("Invalid cookies") from e
+    return jar
+
+
+def get_cookie_expiration_date(cookie):
+    """
+    Get the expiration date of the WodBuster auth cookie (.WBAuth) of the stored cookies
+    :param cookie: The cookies stored with serialize_cookies (or pickled by previous versions)
+    :return: The naive local expiration datetime or None if there is no auth cookie or it can't
+    be decoded
+    """
+    try:
+        jar = deserialize_cookies(cookie)
+    except ValueError:
+        logging.warning("Unable to decode stored cookies")
+        return None
+    expires = next((x.expires for x in jar if x.name == '.WBAuth'), None)
+    return datetime.datetime.fromtimestamp(expires) if expires else None
+
+
+def _extract_input_values(text: str, ids: tuple) -> dict:
+    """
+    Get the value of the input fields with the given ids. Input tags are scanned in order and the
+    scan stops as soon as all the fields are found
+    :param text: The HTML page
+    :param ids: The ids of the input fields
+    :return: A dictionary with the (unescaped) value of each field found
+    """
+    values = {}
+    for tag in _INPUT_TAG_PATTERN.finditer(text):
+        attributes = {}
+        for attribute in _TAG_ATTRIBUTE_PATTERN.finditer(tag.group(1)):
+            value = attribute.group(2)
+            if value is None:
+                value = attribute.group(3) if attribute.group(3) is not None else attribute.group(4)
+            attributes[attribute.group(1).lower()] = value
+        if attributes.get('id') in ids and attributes.get('value') is not None:
+            values[attributes['id']] = html.unescape(attributes['value'])
+            if len(values) == len(ids):
+                break
+    return values
+
+
+def _is_login_redirect(response: requests.Response) -> bool:
+    """
+    Tell whether WodBuster redirected a request to the login page, whether the redirect was
+    followed or not
+    """
+    return any(r.is_redirect and "login" in r.headers.get("Location", "").lower()
+               for r in (*response.history, response))
+
 
 def _safe_log_response_content(response_text, max_length=2000):
     """
@@ -42,25 +215,579 @@ def _safe_log_response_content(response_text, max_length=2000):
         return f"[Error encoding response content: {str(e)}]"
 
 
+class _SynchronizedCookieJar(RequestsCookieJar):
+    """
+    Cookie jar shared by the sessions of a user. CookieJar already locks writes; iteration (used
+    when requests merges and looks up cookies) is done over a snapshot taken with the lock held
+    """
+
+    def __iter__(self):
+        with self._cookies_lock:
+            return iter(list(super().__iter__()))
+
+    def __len__(self):
+        with self._cookies_lock:
+            return super().__len__()
+
+
+class _SessionPool():
+    """
+    HTTP sessions of a user. A requests session is not safe to be used by several threads at the
+    same time, so every request takes a session for itself and gives it back afterwards. All the
+    sessions share one cookie jar, so a login (or a cookie set by WodBuster) is seen by all of them
+    """
+
+    def __init__(self):
+        self.cookies = _SynchronizedCookieJar()
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @contextmanager
+    def session(self):
+        """
+        Take a session from the pool (the most recently used one, whose connections are more
+        likely to be alive) or create a new one
+        """
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+        if session is None:
+            session = cloudscraper.create_scraper()
+            session.cookies = self.cookies
+            recorder.mount(session)
+
+        try:
+            yield session
+        finally:
+            with self._lock:
+                if len(self._idle) < _MAX_IDLE_SESSIONS:
+                    self._idle.append(session)
+                    session = None
+            if session is not None:
+                session.close()
+
+    def idle_sessions(self) -> list:
+        """
+        Get the sessions currently in the pool
+        """
+        with self._lock:
+            return list(self._idle)
+
+    def close(self) -> None:
+        """
+        Close the pooled connections of the idle sessions
+        """
+        with self._lock:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            session.close()
+
+
+class _HedgingPolicy():
+    """
+    Decides when a duplicate (hedged) request is sent for a slow WodBuster call. A hedge is sent
+    when the first request has not answered within the configured percentile of the latencies
+    observed for the same handler, and only while the per-host hedge budget is not exhausted
+    """
+
+    _MIN_SAMPLES = 20
+    _DEFAULT_DELAY = 1.0
+
+    def __init__(self, enabled: bool, percentile: float, budget: int, budget_window: float):
+        """
+        :param enabled: Whether hedged requests are sent at all
+        :param percentile: The latency percentile (0-100) after which a hedge is sent
+        :param budget: The maximum number of hedges per host within the budget window
+        :param budget_window: The length in seconds of the budget window
+        """
+        self.enabled = enabled
+        self._percentile = percentile
+        self._budget = budget
+        self._budget_window = budget_window
+        self._latencies_by_handler = {}
+        self._hedges_by_host = {}
+        self._lock = threading.Lock()
+
+    def record(self, handler: str, latency: float) -> None:
+        """
+        Record the latency of a completed request
+        :param handler: The WodBuster handler that was called (e.g. LoadClass.ashx)
+        :param latency: The time in seconds the request took
+        """
+        with self._lock:
+            self._latencies_by_handler.setdefault(handler, deque(maxlen=200)).append(latency)
+
+    def delay(self, handler: str) -> float:
+        """
+        Get the time to wait for the first request before sending a hedge
+        :param handler: The WodBuster handler that will be called
+        """
+        with self._lock:
+            latencies = sorted(self._latencies_by_handler.get(handler, ()))
+        if len(latencies) < self._MIN_SAMPLES:
+            return self._DEFAULT_DELAY
+        index = min(len(latencies) - 1, int(len(latencies) * self._percentile / 100))
+        return latencies[index]
+
+    def try_acquire(self, host: str) -> bool:
+        """
+        Consume one hedge from the budget of the given host
+        :return: True if a hedge can be sent, False if the budget is exhausted
+        """
+        now = time.monotonic()
+        with self._lock:
+            hedges = self._hedges_by_host.setdefault(host, deque())
+            while hedges and now - hedges[0] > self._budget_window:
+                hedges.popleft()
+            if len(hedges) >= self._budget:
+                return False
+            hedges.append(now)
+            return True
+
+
+_HEDGING = _HedgingPolicy(
+    enabled=os.getenv('WODBUSTER_HEDGING_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+    percentile=float(os.getenv('WODBUSTER_HEDGE_PERCENTILE', '95')),
+    budget=int(os.getenv('WODBUSTER_HEDGE_BUDGET', '10')),
+    budget_window=float(os.getenv('WODBUSTER_HEDGE_BUDGET_WINDOW', '60')))
+
+_BOOKING_LANE = 'booking'
+_BACKGROUND_LANE = 'background'
+
+
+class _HostBucket():
+    """
+    Token bucket of a host
+    """
+    __slots__ = ('rate', 'tokens', 'updated_at', 'decreased_at')
+
+    def __init__(self, rate: float, tokens: float):
+        self.rate = rate
+        self.tokens = tokens
+        self.updated_at = time.monotonic()
+        self.decreased_at = 0
+
+
+class _RateGovernor():
+    """
+    Paces the requests sent to each WodBuster host with a token bucket. Its rate adapts to the
+    answers of the host: it grows by a fixed step after every fast, successful response and is
+    cut by a factor after slow responses, network errors, error codes and Cloudflare challenges
+    (at most once per second, so a burst of failures in flight counts once).
+    Requests of the booking lane are never delayed: the bookers of a box fire together when the
+    booking window opens, so they take their token on credit (down to minus the burst) and the
+    background requests, which always leave some tokens in the bucket, wait until it is repaid
+    """
+
+    _INCREASE_STEP = 0.1
+    _SLOW_FACTOR = 0.8
+    _ERROR_FACTOR = 0.5
+    _DECREASE_INTERVAL = 1.0
+
+    def __init__(self, enabled: bool, initial_rate: float, min_rate: float, max_rate: float,
+                 burst: float, booking_reserve: float, slow_latency: float):
+        """
+        :param enabled: Whether requests are paced at all
+        :param initial_rate: The requests per second allowed to a host not seen before
+        :param min_rate: The lowest rate a host is slowed down to
+        :param max_rate: The highest rate a host is allowed to reach
+        :param burst: The maximum number of tokens in a bucket
+        :param booking_reserve: The tokens background requests leave for booking requests
+        :param slow_latency: The response time in seconds above which a host is considered slow
+        """
+        self.enabled = enabled
+        self._initial_rate = initial_rate
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._burst = burst
+        self._booking_reserve = min(booking_reserve, burst - 1)
+        self._slow_latency = slow_latency
+        self._buckets = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, host: str, lane: str=_BACKGROUND_LANE) -> float:
+        """
+        Wait until a request can be sent to the given host
+        :param host: The host the request is sent to
+        :param lane: _BOOKING_LANE or _BACKGROUND_LANE
+        :return: The time waited in seconds
+        """
+        if not self.enabled:
+            return 0
+        start = time.monotonic()
+        with self._condition:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = _HostBucket(self._initial_rate, self._burst)
+            while True:
+                now = time.monotonic()
+                bucket.tokens = min(self._burst, bucket.tokens + (now - bucket.updated_at) * bucket.rate)
+                bucket.updated_at = now
+                if lane == _BOOKING_LANE:
+                    bucket.tokens = max(-self._burst, bucket.tokens - 1)
+                    return 0
+                required = 1 + self._booking_reserve
+                if bucket.tokens >= required:
+                    bucket.tokens -= 1
+                    return now - start
+                self._condition.wait((required - bucket.tokens) / bucket.rate)
+
+    def record(self, host: str, latency: float, status_code: int=None, challenged: bool=False) -> None:
+        """
+        Adapt the rate of a host to the outcome of a request
+        :param host: The host the request was sent to
+        :param latency: The time in seconds the request took
+        :param status_code: The response status or None if the request failed with a network error
+        :param challenged: Whether the response is a Cloudflare challenge
+        """
+        if not self.enabled:
+            return
+        if challenged or status_code is None or status_code == 429 or status_code >= 500:
+            factor = self._ERROR_FACTOR
+        elif latency > self._slow_latency:
+            factor = self._SLOW_FACTOR
+        else:
+            factor = None
+
+        with self._condition:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                return
+            now = time.monotonic()
+            if factor is None:
+                bucket.rate = min(self._max_rate, bucket.rate + self._INCREASE_STEP)
+            elif now - bucket.decreased_at >= self._DECREASE_INTERVAL:
+                bucket.rate = max(self._min_rate, bucket.rate * factor)
+                bucket.decreased_at = now
+                if factor == self._ERROR_FACTOR:
+                    # Stop the burst in progress as well
+                    bucket.tokens = min(bucket.tokens, 0)
+                logging.info("Request rate to %s reduced to %.2f/s (status %s, %.2f seconds%s)", host, bucket.rate,
+                             status_code, latency, ", Cloudflare challenge" if challenged else "")
+
+    def stats(self) -> dict:
+        """
+        Get the current rate of every host, in requests per second
+        """
+        with self._condition:
+            return {host: round(bucket.rate, 2) for host, bucket in self._buckets.items()}
+
+
+def _is_cloudflare_challenge(response: requests.Response) -> bool:
+    if response.headers.get('cf-mitigated') == 'challenge':
+        return True
+    return response.status_code in (403, 503) and 'cloudflare' in response.headers.get('Server', '').lower()
+
+
+class _HostCircuit():
+    """
+    Circuit breaker state of a host
+    """
+    __slots__ = ('failures', 'open', 'retry_at', 'cooldown', 'probing')
+
+    def __init__(self):
+        self.failures = 0
+        self.open = False
+        self.retry_at = 0
+        self.cooldown = 0
+        self.probing = False
+
+
+class _CircuitBreaker():
+    """
+    Per-host circuit breaker shared by all scrapers. After a number of consecutive failures
+    (network errors and 5xx codes) the circuit of the host opens and requests fail at once with
+    HostUnavailable. Once the cooldown is over a single request is let through as a probe: if it
+    succeeds the circuit closes and every caller waiting for the host is released, otherwise it
+    opens again with twice the cooldown
+    """
+
+    def __init__(self, enabled: bool, failure_threshold: int, cooldown: float, max_cooldown: float):
+        """
+        :param enabled: Whether circuits are opened at all
+        :param failure_threshold: The consecutive failures that open the circuit of a host
+        :param cooldown: The seconds requests fail fast before the first probe
+        :param max_cooldown: The maximum seconds between probes
+        """
+        self.enabled = enabled
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._circuits = {}
+        self._condition = threading.Condition()
+
+    def before_request(self, host: str) -> bool:
+        """
+        Check whether a request can be sent to the given host
+        :param host: The host the request is sent to
+        :return: True if the request is the probe of an open circuit. It must be followed by a
+        call to record
+        :raises HostUnavailable: If the circuit of the host is open
+        """
+        if not self.enabled:
+            return False
+        with self._condition:
+            circuit = self._circuits.get(host)
+            if circuit is None or not circuit.open:
+                return False
+            if not circuit.probing and time.monotonic() >= circuit.retry_at:
+                circuit.probing = True
+                logging.info("Probing whether %s is available again", host)
+                return True
+            raise HostUnavailable(f"{host} is unavailable", host)
+
+    def record(self, host: str, success: bool, probe: bool=False) -> None:
+        """
+        Record the outcome of a request
+        :param host: The host the request was sent to
+        :param success: False if the request failed with a network error or a 5xx code
+        :param probe: Whether the request was the probe returned by before_request
+        """
+        if not self.enabled:
+            return
+        with self._condition:
+            circuit = self._circuits.get(host)
+            if success:
+                if circuit is None:
+                    return
+                if circuit.open:
+                    logging.warning("%s is available again. Closing its circuit", host)
+                    self._condition.notify_all()
+                del self._circuits[host]
+                return
+
+            if circuit is None:
+                circuit = self._circuits[host] = _HostCircuit()
+            circuit.failures += 1
+            if probe:
+                circuit.probing = False
+                circuit.cooldown = min(self._max_cooldown, circuit.cooldown * 2)
+            elif circuit.open or circuit.failures < self._failure_threshold:
+                return
+            else:
+                circuit.open = True
+                circuit.cooldown = self._cooldown
+            circuit.retry_at = time.monotonic() + circuit.cooldown
+            # Waiting callers may try to be the probe at retry_at
+            self._condition.notify_all()
+            logging.warning("%s failed %s times in a row. Requests to it will fail for %.0f seconds",
+                            host, circuit.failures, circuit.cooldown)
+
+    def release_probe(self, host: str) -> None:
+        """
+        Let another request probe the host when a probe ends without an outcome
+        """
+        with self._condition:
+            circuit = self._circuits.get(host)
+            if circuit is not None:
+                circuit.probing = False
+                self._condition.notify_all()
+
+    def wait_until_available(self, host: str, timeout: float=None) -> bool:
+        """
+        Block until the circuit of the host is closed or a probe can be sent
+        :param host: The host to wait for
+        :param timeout: The maximum seconds to wait. None waits as long as needed
+        :return: True if a request can be sent. False if the timeout is reached
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                circuit = self._circuits.get(host)
+                now = time.monotonic()
+                if circuit is None or not circuit.open or (not circuit.probing and now >= circuit.retry_at):
+                    return True
+                if deadline is not None and now >= deadline:
+                    return False
+                # A probe in flight notifies its outcome. Otherwise wake up when a probe can be sent
+                wait_for = self._max_cooldown if circuit.probing else circuit.retry_at - now
+                self._condition.wait(wait_for if deadline is None else min(wait_for, deadline - now))
+
+    def stats(self) -> dict:
+        """
+        Get the hosts whose circuit is open and the seconds until the next probe
+        """
+        now = time.monotonic()
+        with self._condition:
+            return {host: max(0, round(circuit.retry_at - now)) for host, circuit in self._circuits.items() if circuit.open}
+
+
+_BREAKER = _CircuitBreaker(
+    enabled=os.getenv('WODBUSTER_CIRCUIT_BREAKER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    failure_threshold=int(os.getenv('WODBUSTER_CIRCUIT_BREAKER_FAILURES', '5')),
+    cooldown=float(os.getenv('WODBUSTER_CIRCUIT_BREAKER_COOLDOWN', '30')),
+    max_cooldown=300)
+
+_GOVERNOR = _RateGovernor(
+    enabled=os.getenv('WODBUSTER_RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    initial_rate=float(os.getenv('WODBUSTER_RATE_LIMIT_INITIAL', '5')),
+    min_rate=float(os.getenv('WODBUSTER_RATE_LIMIT_MIN', '0.5')),
+    max_rate=float(os.getenv('WODBUSTER_RATE_LIMIT_MAX', '20')),
+    burst=float(os.getenv('WODBUSTER_RATE_LIMIT_BURST', '10')),
+    booking_reserve=3,
+    slow_latency=2.0)
+
+
 class Scraper():
     """
     WodBuster scraper
     """
 
-    def __init__(self, user: str, password: str=None, cookie: bytes=None):
+    def __init__(self, user: str, password: str=None, cookie: str=None, session_state: str=None):
         self._user = user
         self._password = password
         self.logged = False
-        self._session = cloudscraper.create_scraper()
+        self._sessions = _SessionPool()
         self._cookie = cookie
         self._box_name_by_url = {}
         self._sse_server_by_url = {}
+        self._box_metadata_expires_at = {}
+        self._clearance_cookies = []
+        self._saved_session_state = None
+        self._prewarmed_by_host = {}
+        self._prewarm_lock = threading.Lock()
+        self._login_lock = threading.RLock()
+        self._trust_cookie = _COOKIE_VALIDATION == 'expiry'
+        self._cookie_trusted = False
+        # Incremented every time the cookie is revalidated, so requests sent before can be retried
+        self._login_generation = 0
+        self._last_activity_by_host = {}
+        if session_state:
+            self.load_session_state(session_state)
+            self._saved_session_state = self._build_session_state()
+
+    def approximate_size(self) -> int:
+        """
+        Approximate memory held by the scraper in bytes: its session, connection pools, cookies
+        and cached box metadata
+        """
+        size = len(self.get_cookies())
+        size += sum(sys.getsizeof(key) + sys.getsizeof(value)
+                    for cache in (self._box_name_by_url, self._sse_server_by_url)
+                    for key, value in cache.items())
+        for session in self._sessions.idle_sessions():
+            size += _SESSION_APPROXIMATE_BYTES
+            for adapter in session.adapters.values():
+                pool_manager = getattr(adapter, 'poolmanager', None)
+                if pool_manager is not None:
+                    size += len(pool_manager.pools) * _POOL_APPROXIMATE_BYTES
+        return size
+
+    def close(self) -> None:
+        """
+        Close the pooled connections of the scraper sessions
+        """
+        self._sessions.close()
+
+    def get_cookies(self) -> str:
+        """
+        Returns the cookies for the current session, serialized with serialize_cookies
+        """
+        return serialize_cookies(self._sessions.cookies)
+
+    def get_cookie_expiration_date(self):
+        """
+        Returns the naive local expiration datetime of the WodBuster auth cookie (.WBAuth) of the
+        current session or None if there is no auth cookie
+        """
+        expires = self._get_cookie_expiration_timestamp()
+        return datetime.datetime.fromtimestamp(expires) if expires else None
+
+    def load_session_state(self, session_state: str) -> None:
+        """
+        Restore the state persisted with get_session_state: Cloudflare clearance cookies and the
+        box metadata used by wait_until_event. Expired entries are ignored and the state already
+        known by the scraper is kept
+        :param session_state: The JSON document returned by get_session_state
+        """
+        try:
+            state = _json_loads(session_state)
+        except (json.JSONDecodeError, TypeError):
+            logging.warning("Ignoring invalid session state for user %s", self._user)
+            return
+
+        now = time.time()
+        for url, box in (state.get('boxes') or {}).items():
+            if url not in self._box_name_by_url and box.get('expires_at', 0) > now:
+                self._box_name_by_url[url] = box['box_name']
+                self._sse_server_by_url[url] = box['sse_server']
+                self._box_metadata_expires_at[url] = box['expires_at']
+
+        known_cookies = {(cookie.name, cookie.domain, cookie.path) for cookie in self._sessions.cookies}
+        self._clearance_cookies = [cookie for cookie in state.get('clearance') or []
+                                   if (cookie.get('expires') or 0) > now
+                                   and (cookie['name'], cookie['domain'], cookie['path']) not in known_cookies]
+        self._apply_clearance_cookies()
 
-    def get_cookies(self) -> bytes:
+    def get_session_state(self) -> str:
         """
-        Returns the cookies for the current session
+        Get the state that allows a new scraper to avoid Cloudflare challenges and box homepage
+        scrapes: unexpired clearance cookies and box metadata. The returned state is considered
+        saved by session_state_changed
+        :return: A JSON document
         """
-        return pickle.dumps(self._session.cookies)
+        state = self._build_session_state()
+        self._saved_session_state = state
+        return _json_dumps(state)
+
+    def session_state_changed(self) -> bool:
+        """
+        Tell whether the state returned by get_session_state has changed since it was last
+        obtained (or loaded)
+        """
+        return self._build_session_state() != self._saved_session_state
+
+    def _build_session_state(self) -> dict:
+        now = time.time()
+        boxes = {url: {'box_name': self._box_name_by_url[url],
+                       'sse_server': self._sse_server_by_url[url],
+                       'expires_at': expires_at}
+                 for url, expires_at in self._box_metadata_expires_at.items()
+                 if expires_at > now and url in self._box_name_by_url}
+        clearance = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                      'path': cookie.path, 'expires': cookie.expires, 'secure': cookie.secure}
+                     for cookie in self._sessions.cookies
+                     if cookie.name.startswith(_CLEARANCE_COOKIE_PREFIXES) and cookie.expires and cookie.expires > now]
+        return {'boxes': boxes, 'clearance': sorted(clearance, key=lambda cookie: (cookie['domain'], cookie['name']))}
+
+    def _apply_clearance_cookies(self) -> None:
+        # Persisted clearance cookies are newer than the ones in the stored login cookie
+        for cookie in self._clearance_cookies:
+            self._sessions.cookies.set_cookie(create_cookie(cookie['name'], cookie['value'], domain=cookie['domain'],
+                                                            path=cookie['path'], expires=cookie['expires'],
+                                                            secure=cookie['secure']))
+
+    def _request(self, method: str, url: str, lane: str=_BACKGROUND_LANE, **kwargs) -> requests.Response:
+        """
+        Perform an HTTP request with a session of the pool, so requests of the same user from
+        different threads run in parallel without sharing a session. Requests are paced per host
+        by the rate governor and not sent while the circuit of the host is open
+        :param method: The HTTP method
+        :param url: The URL to request
+        :param lane: _BOOKING_LANE for the requests of a booking, which are served first
+        :param kwargs: Any other argument accepted by requests.Session.request
+        :raises HostUnavailable: If the host keeps failing and the request has not been sent
+        """
+        host = urlsplit(url).netloc
+        probe = _BREAKER.before_request(host)
+        waited = _GOVERNOR.acquire(host, lane)
+        if waited > 1:
+            logging.info("Request to %s delayed %.2f seconds by the rate governor", host, waited)
+        start = time.monotonic()
+        try:
+            with self._sessions.session() as session:
+                response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            _GOVERNOR.record(host, time.monotonic() - start)
+            _BREAKER.record(host, False, probe)
+            raise
+        except BaseException:
+            if probe:
+                # The request was interrupted (e.g. the thread was stopped): another caller has to probe
+                _BREAKER.release_probe(host)
+            raise
+        _GOVERNOR.record(host, time.monotonic() - start, response.status_code, _is_cloudflare_challenge(response))
+        _BREAKER.record(host, response.status_code < 500, probe)
+        return response
 
     def login(self) -> None:
         """
@@ -71,13 +798,30 @@ class Scraper():
         protection, etc.)
         :raises RequestException: If a network error occurs or an HTTP error code is received
         """
+        with self._login_lock:
+            self._login()
+
+    def _login(self) -> None:
         if self.logged:
             return
 
         if self._cookie:
-            self._session.cookies.update(pickle.loads(self._cookie))
-            road_to_box_request = self._session.get("https://wodbuster.com/account/roadtobox.aspx",
-                                                    headers=_HEADERS, allow_redirects=True, timeout=10)
+            try:
+                self._sessions.cookies.update(deserialize_cookies(self._cookie))
+            except ValueError:
+                logging.warning("Stored cookie for user %s can't be decoded. Ignoring it", self._user)
+            self._apply_clearance_cookies()
+            cookie_expires_at = self._get_cookie_expiration_timestamp()
+            if self._trust_cookie and cookie_expires_at and \
+                    cookie_expires_at > time.time() + _COOKIE_EXPIRY_MARGIN_SECONDS:
+                logging.info("User %s logged with cookie valid until %s", self._user,
+                             datetime.datetime.fromtimestamp(cookie_expires_at, _MADRID_TZ).strftime('%d/%m/%Y %H:%M:%S'))
+                self._cookie_trusted = True
+                self.logged = True
+                return
+
+            road_to_box_request = self._request('GET', "https://wodbuster.com/account/roadtobox.aspx",
+                                                       headers=_HEADERS, allow_redirects=True, timeout=10)
 
             if "Location" in road_to_box_request.headers and "login" in road_to_box_request.headers["Location"]:
                 logging.warning("Cookie for user %s is outdated. Attempting logging with password...", self._user)
@@ -88,23 +832,58 @@ class Scraper():
         else:
             self._login_with_username_and_password()
 
+    def _get_cookie_expiration_timestamp(self):
+        try:
+            return next(x for x in self._sessions.cookies if x.name == '.WBAuth').expires
+        except StopIteration:
+            return None
+
+    def _revalidate_cookie(self, login_generation: int) -> bool:
+        """
+        Called when WodBuster redirects to the login page. If the user was logged in by trusting the
+        cookie expiry, the cookie is checked against roadtobox.aspx (and the password login is used
+        if it is outdated)
+        :param login_generation: The value of _login_generation when the rejected request was sent
+        :return: True if the user has been logged in again, by this call or by another thread after
+        the request was sent, and the request can be retried
+        """
+        with self._login_lock:
+            if self._login_generation != login_generation:
+                return True
+            if not self._cookie_trusted:
+                return False
+            logging.warning("Trusted cookie for user %s was rejected by WodBuster. Checking it...", self._user)
+            self._trust_cookie = False
+            self._cookie_trusted = False
+            self.logged = False
+            self._login()
+            self._login_generation += 1
+            return True
+
     def _login_with_username_and_password(self):
 
         if not self._password:
             raise PasswordRequired("Password is required")
 
-        self._session = cloudscraper.create_scraper()
+        # Start from a clean session
+        self._sessions.cookies.clear()
+        self._apply_clearance_cookies()
         login_url = "https://wodbuster.com/account/login.aspx"
-        initial_request = self._session.get(login_url, headers=_HEADERS, timeout=10)
+        initial_request = self._request('GET', login_url, headers=_HEADERS, timeout=10)
 
-        try:
-            soup = BeautifulSoup(initial_request.content, 'lxml')
-            viewstatec = soup.find(id='__VIEWSTATEC')['value']
-            eventvalidation = soup.find(id='__EVENTVALIDATION')['value']
-            csrftoken = soup.find(id='CSRFToken')['value']
-        except TypeError as e:
-            logging.exception("WodBuster response cannot be parsed")
-            raise InvalidWodBusterResponse(_WODBUSTER_NOT_ACCEPTING_REQUESTS_MESSAGE) from e
+        fields = _extract_input_values(initial_request.text, _LOGIN_FIELDS)
+        if len(fields) < len(_LOGIN_FIELDS):
+            # Fallback to a full parse in case the page markup is not the expected one
+            try:
+                soup = BeautifulSoup(initial_request.content, 'lxml')
+                fields = {field: soup.find(id=field)['value'] for field in _LOGIN_FIELDS}
+            except (TypeError, KeyError) as e:
+                logging.exception("WodBuster response cannot be parsed")
+                raise InvalidWodBusterResponse(_WODBUSTER_NOT_ACCEPTING_REQUESTS_MESSAGE) from e
+
+        viewstatec = fields['__VIEWSTATEC']
+        eventvalidation = fields['__EVENTVALIDATION']
+        csrftoken = fields['CSRFToken']
 
         data_login = {
             'ctl00$ctl00$body$ctl00': 'ctl00$ctl00$body$ctl00|ctl00$ctl00$body$body$CtlLogin$CtlAceptar',
@@ -157,7 +936,7 @@ class Scraper():
 
         data = {**data, **extra_fields}
 
-        request = self._session.post(url, data=data, headers=_HEADERS, timeout=10)
+        request = self._request('POST', url, data=data, headers=_HEADERS, timeout=10)
         request.raise_for_status()
         return request
 
@@ -184,53 +963,45 @@ class Scraper():
         """
         self.login()
 
-        classes, epoch = self.get_classes(url, booking_datetime.date())
+        schedule, epoch = self.get_schedule(url, booking_datetime.date(), hedge=True)
         hour = booking_datetime.strftime('%H:%M:%S')
 
-        if not classes['Data']:
-            avaiable_at = None
-            if "PrimeraHoraPublicacion" in classes:
-                avaiable_at = _MADRID_TZ.localize(datetime.datetime.strptime(classes["PrimeraHoraPublicacion"],
-                                                                             '%m/%d/%Y %H:%M:%S'))
-            raise BookingNotAvailable('No classes available', avaiable_at)
-
-        for _class in classes['Data']:
-            logging.debug("Checking class %s", _class['Hora'])
-            logging.debug(json.dumps(_class))
-
-            ## Class type tells whether we need to book Wod or OpenBox class
-            ## For those bookings classes where there is a mix of both
-            # logging.info(f'Type class is {type_class}')
-
-            if _class['Hora'] == hour:
-                class_status = _class['Valores'][type_class]['TipoEstado']
-
-                if class_status == "Borrable":
-                    return True
-
-                class_details = _class['Valores'][type_class]['Valor']
-                _id = class_details['Id']
-                if len(class_details['AtletasEntrenando']) >= class_details['Plazas']:
-                    raise ClassIsFull("Class is full")
-
-                api_path = "Calendario_Mover.ashx" if class_status == "Cambiable" else "Calendario_Inscribir.ashx"
-                logging.info("Using API path %s to join user to class", api_path)
-                book_result = self._book_request(f'{url}/athlete/handlers/{api_path}?id={_id}&ticks={epoch}')
-                if book_result['Res']['EsCorrecto']:
-                    return True
-                else:
-                    logging.info("Booking failed.")
-                    error_message = book_result.get("Res", {}).get("ErrorMsg")
-                    if "penalización" in error_message.lower() or "penalizaciones" in error_message.lower() or "demasiado pronto" in error_message.lower():
-                        logging.info('Booking penalization.')
-                        raise BookingPenalization(error_message)
-                    elif "another place" in error_message.lower() or "otro lugar" in error_message.lower():
-                        logging.info('Booking locked - user using reservation in another place.')
-                        raise BookingLockedException(error_message)
-                    else:
-                        raise BookingFailed(error_message)
-
-        raise ClassNotFound(f"Class for {hour} not found on {booking_datetime.date().strftime('%d/%m/%Y')}")
+        if not schedule.classes:
+            raise BookingNotAvailable('No classes available', schedule.published_at)
+
+        ## Class type tells whether we need to book Wod or OpenBox class
+        ## For those bookings classes where there is a mix of both
+        slot = schedule.get_slot(hour, type_class)
+        if not slot:
+            raise ClassNotFound(f"Class for {hour} not found on {booking_datetime.date().strftime('%d/%m/%Y')}")
+
+        if slot.status == "Borrable":
+            return True
+
+        if slot.is_full:
+            raise ClassIsFull("Class is full")
+
+        api_path = "Calendario_Mover.ashx" if slot.status == "Cambiable" else "Calendario_Inscribir.ashx"
+        logging.info("Using API path %s to join user to class", api_path)
+        book_result, hedged = self._hedged_book_request(f'{url}/athlete/handlers/{api_path}?id={slot.id}&ticks={epoch}',
+                                                        lambda result: result.get('Res', {}).get('EsCorrecto'))
+        if book_result['Res']['EsCorrecto']:
+            return True
+        elif hedged and self._is_class_booked(url, booking_datetime, type_class):
+            # The enroll request that is still in flight (or timed out) got the seat
+            logging.info("Hedged booking request failed but the class is already booked")
+            return True
+        else:
+            logging.info("Booking failed.")
+            error_message = book_result.get("Res", {}).get("ErrorMsg")
+            if "penalización" in error_message.lower() or "penalizaciones" in error_message.lower() or "demasiado pronto" in error_message.lower():
+                logging.info('Booking penalization.')
+                raise BookingPenalization(error_message)
+            elif "another place" in error_message.lower() or "otro lugar" in error_message.lower():
+                logging.info('Booking locked - user using reservation in another place.')
+                raise BookingLockedException(error_message)
+            else:
+                raise BookingFailed(error_message)
 
     def cancel_booking(self, box_url: str, class_id: int, class_datetime: datetime.datetime, athlete_id: str) -> bool:
         """
@@ -267,15 +1038,21 @@ class Scraper():
                 error_message = response.get("Res", {}).get("ErrorMsg", "Unknown error")
                 logging.error("Failed to cancel booking for class %d: %s", class_id, error_message)
                 return False
-        except Exception as e:
+        except Exception:
             logging.exception("An error occurred while cancelling booking for class %d", class_id)
             return False
 
-    def get_classes(self, url: str, date: datetime.date) -> tuple:
+    def _is_class_booked(self, url: str, booking_datetime: datetime, type_class: str) -> bool:
+        schedule, _ = self.get_schedule(url, booking_datetime.date())
+        slot = schedule.get_slot(booking_datetime.strftime('%H:%M:%S'), type_class)
+        return bool(slot) and slot.status == "Borrable"
+
+    def get_classes(self, url: str, date: datetime.date, hedge: bool=False) -> tuple:
         """ 
         Get the classes for a given epoch
         :param url: The WodBuster URL associated to the box where classes has to be obtained
         :param date: The day for which the classes have to be obtained
+        :param hedge: Whether a hedged request can be sent if WodBuster is slow to answer
         :return: A tuple. The first element is the response from WodBuster API for the specified date. 
         The second element is the date in epoch format in case is useful for other operations
         :raises BookingNotAvailable: If the class is not available for booking
@@ -288,7 +1065,21 @@ class Scraper():
         """
         midnight = _UTC_TZ.localize(datetime.datetime.combine(date, datetime.datetime.min.time()))
         epoch = int(midnight.timestamp())
-        return self._book_request(f'{url}/athlete/handlers/LoadClass.ashx?ticks={epoch}'), epoch
+        api_url = f'{url}/athlete/handlers/LoadClass.ashx?ticks={epoch}'
+        if hedge:
+            return self._hedged_book_request(api_url)[0], epoch
+        return self._book_request(api_url), epoch
+
+    def get_schedule(self, url: str, date: datetime.date, hedge: bool=False) -> tuple:
+        """
+        Get the parsed schedule for a given date. See get_classes for the raised exceptions
+        :param url: The WodBuster URL associated to the box where classes has to be obtained
+        :param date: The day for which the classes have to be obtained
+        :param hedge: Whether a hedged request can be sent if WodBuster is slow to answer
+        :return: A tuple with the DaySchedule and the date in epoch format
+        """
+        classes, epoch = self.get_classes(url, date, hedge=hedge)
+        return DaySchedule.from_response(classes, date), epoch
 
     def get_week_classes(self, url: str, start_date: datetime.date, athlete_id: str = None) -> dict:
         """
@@ -296,43 +1087,143 @@ class Scraper():
         :param url: The WodBuster URL associated to the box where classes have to be obtained
         :param start_date: The first day of the week (datetime.date)
         :param athlete_id: Optional athlete ID to include in the API request (without dashes)
-        :return: A dictionary where keys are dates (datetime.date) and values are lists of class dictionaries.
-                 Each class dictionary contains: Hora, NombreE, IdE, Id, Borrable
+        :return: A dictionary where keys are dates (datetime.date) and values are tuples of ListedClass
+                 (hour, name, type_id, id, removable)
         :raises LoginError: If user/password combination fails.
         :raises InvalidWodBusterResponse: If the response from WodBuster is not valid
         :raises PasswordRequired: If the provided cookie is outdated and a password is not provided
         :raises RequestException: If a network error occurs or an HTTP error code is received
         """
         self.login()
-        week_classes = {}
-        
-        for day_offset in range(7):
-            current_date = start_date + datetime.timedelta(days=day_offset)
+
+        def fetch_day(current_date):
             midnight = _UTC_TZ.localize(datetime.datetime.combine(current_date, datetime.datetime.min.time()))
             epoch = int(midnight.timestamp())
-            
+
             # Build API URL with optional athlete_id
             api_url = f'{url}/athlete/handlers/LoadClass.ashx?ticks={epoch}'
             if athlete_id:
                 # Remove dashes from athlete_id if present
                 athlete_id_no_dashes = athlete_id.replace('-', '')
                 api_url += f'&idu={athlete_id_no_dashes}'
-            
+
             try:
                 response = self._book_request(api_url)
-                # Extract ListClases from response
-                list_clases = response.get('ListClases', [])
-                week_classes[current_date] = list_clases
+                return DaySchedule.from_response(response, current_date).listed_classes
             except Exception as e:
                 logging.warning("Error fetching classes for date %s: %s", current_date, str(e))
-                week_classes[current_date] = []
-        
-        return week_classes
+                return ()
+
+        dates = [start_date + datetime.timedelta(days=day_offset) for day_offset in range(7)]
+        with ThreadPoolExecutor(max_workers=_WEEK_FETCH_WORKERS,
+                                thread_name_prefix=f"Week {self._user}") as executor:
+            return dict(zip(dates, executor.map(fetch_day, dates)))
 
-    def _book_request(self, url):
+    def connection_state(self, url: str) -> str:
+        """
+        Tell whether the connections to the host of the given URL are expected to be alive
+        :param url: Any URL of the host to check
+        :return: "warm" if the host was reached recently, "cold" otherwise
+        """
+        last_activity = self._last_activity_by_host.get(urlsplit(url).netloc)
+        if last_activity and time.monotonic() - last_activity < _KEEPALIVE_IDLE_SECONDS:
+            return "warm"
+        return "cold"
+
+    def prewarm(self, url: str, date: datetime.date, connections: int=1) -> bool:
+        """
+        Prepare the session for a booking window that is about to open. The box host is resolved,
+        the given number of connections are opened and kept in the pool and the session is
+        confirmed with a cheap authenticated request (the schedule of the day to book).
+        Pre-warming is best effort: errors are logged and reported as a False result.
+        :param url: The WodBuster URL associated to the box where the booking will be done
+        :param date: The day of the class that will be booked
+        :param connections: The number of connections that will be needed at the same time
+        :return: True if the session is warm and authenticated, False otherwise
+        """
+        host = urlsplit(url).netloc
+        connections = max(1, min(connections, _MAX_PREWARM_CONNECTIONS))
+        with self._prewarm_lock:
+            already_prewarmed = self._prewarmed_by_host.get(host, 0)
+            if already_prewarmed >= connections and self.connection_state(url) == "warm":
+                logging.info("Connections to %s already warm for user %s", host, self._user)
+                return True
+
+            try:
+                self.login()
+                start = time.monotonic()
+                socket.getaddrinfo(urlsplit(url).hostname, 443, proto=socket.IPPROTO_TCP)
+                # Concurrent requests force the pool to open one connection per request
+                with ThreadPoolExecutor(max_workers=connections,
+                                        thread_name_prefix=f"Prewarm {self._user}") as executor:
+                    results = list(executor.map(lambda _: self.get_classes(url, date),
+                                                range(connections)))
+                self._prewarmed_by_host[host] = connections
+                logging.info("Pre-warmed %d connection(s) to %s for user %s in %.3f seconds",
+                             len(results), host, self._user, time.monotonic() - start)
+                return True
+            except Exception as e:
+                logging.warning("Could not pre-warm connections to %s for user %s: %s", host, self._user, e)
+                self._prewarmed_by_host.pop(host, None)
+                return False
+
+    def _hedged_book_request(self, url, is_success=None) -> tuple:
+        """
+        Perform a request that is safe to repeat. If hedging is enabled and the request does not
+        answer in time, a second identical request is sent over another pooled connection and the
+        first successful response wins. These are the requests of book(), sent in the booking lane
+        :param url: The URL to request
+        :param is_success: Optional callable telling whether a parsed response is successful. By
+        default every parsed response is considered successful
+        :return: A tuple with the parsed response and whether a hedge was sent
+        """
+        if not _HEDGING.enabled:
+            return self._book_request(url, lane=_BOOKING_LANE), False
+
+        is_success = is_success or (lambda _: True)
+        url_parts = urlsplit(url)
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"Hedge {self._user}")
         try:
-            request = self._session.get(url, headers=_HEADERS, allow_redirects=True, timeout=10)
-            if request.status_code == 302 and "login" in request.headers["Location"]:
+            pending = {executor.submit(self._book_request, url, lane=_BOOKING_LANE)}
+            done, _ = wait(pending, timeout=_HEDGING.delay(url_parts.path.rsplit('/', 1)[-1]))
+            hedged = False
+            if not done and _HEDGING.try_acquire(url_parts.netloc):
+                logging.info("WodBuster is slow to answer %s. Sending hedged request", url_parts.path)
+                pending.add(executor.submit(self._book_request, url, lane=_BOOKING_LANE))
+                hedged = True
+
+            first_result = None
+            first_error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        first_error = first_error or e
+                        continue
+                    if is_success(result):
+                        return result, hedged
+                    if first_result is None:
+                        first_result = result
+
+            if first_result is not None:
+                return first_result, hedged
+            raise first_error
+        finally:
+            executor.shutdown(wait=False)
+
+    def _book_request(self, url, retry=True, lane=_BACKGROUND_LANE):
+        login_generation = self._login_generation
+        try:
+            request = self._request('GET', url, lane=lane, headers=_HEADERS, allow_redirects=True, timeout=10)
+            self._last_activity_by_host[urlsplit(url).netloc] = time.monotonic()
+            # The time WodBuster took to answer, without the waits for the governor and the pool
+            _HEDGING.record(urlsplit(url).path.rsplit('/', 1)[-1],
+                            sum(response.elapsed.total_seconds() for response in (*request.history, request)))
+            if _is_login_redirect(request):
+                if retry and self._revalidate_cookie(login_generation):
+                    return self._book_request(url, retry=False, lane=lane)
                 raise InvalidBox("Provided URL is not accesible for the given user")
             if request.status_code != 200:
                 # Log detailed information for non-200 status codes
@@ -344,8 +1235,8 @@ class Scraper():
                     url, request.status_code, content_type, dict(request.headers), response_text
                 )
                 raise InvalidWodBusterResponse('Invalid response status from WodBuster')
-            return request.json()
-        except requests.exceptions.JSONDecodeError as e:
+            return _json_loads(request.content)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             # Log detailed information for JSON decode errors
             content_type = request.headers.get('Content-Type', 'unknown')
             response_text = _safe_log_response_content(request.text)
@@ -354,7 +1245,10 @@ class Scraper():
                 "Response headers: %s, Response text (first 2000 chars): %s, JSONDecodeError: %s",
                 url, request.status_code, content_type, dict(request.headers), response_text, str(e)
             )
-            if "Pon tu usuario y contraseña para acceder a reservar tus clases" in request.text:
+            if _LOGIN_PAGE_MARKER in request.text:
+                # The cookie was rejected and the redirect to the login page was followed
+                if retry and self._revalidate_cookie(login_generation):
+                    return self._book_request(url, retry=False, lane=lane)
                 logging.error('There was an error trying to log the user in. The user should try to access wodbooker from a private browser window in order to force the cookie to update.')
             raise InvalidWodBusterResponse('WodBuster returned a non JSON response') from e
         except requests.exceptions.RequestException as e:
@@ -397,64 +1291,32 @@ class Scraper():
         self.login()
         max_datetime = max_datetime or _MADRID_TZ.localize(datetime.datetime.combine(date, datetime.datetime.max.time()))
 
-        if url not in self._box_name_by_url:
-            homepage_request = self._session.get(f"{url}/user/", headers=_HEADERS,
-                                                 allow_redirects=True, timeout=10)
-            look_up = re.search(r"InitAjax\('([^']*)',\s?'([^']*)'", homepage_request.text)
-            if not look_up:
-                raise InvalidBox("Couldn't determine box name from URL")
-            self._box_name_by_url[url] = look_up.group(1)
-            self._sse_server_by_url[url] = look_up.group(2)
-
-        box_name = self._box_name_by_url[url]
-        sse_server = self._sse_server_by_url[url]
-        event_found = False
-        timeout = False
-
-        while not event_found and not timeout:
-            negotiate_request = self._session.post(f"{sse_server}/bookinghub/negotiate?negotiateVersion=1",
-                                        headers=_HEADERS, timeout=10)
-            connection_token = negotiate_request.json()["connectionToken"]
-            headers = {**_HEADERS, **{"Accept": "text/event-stream"}}
-            booking_hub_request = self._session.get(f"{sse_server}/bookinghub?id={connection_token}",
-                                                    stream=True, headers=headers, timeout=60)
-
-            self._send_sse_command(sse_server, connection_token, {"protocol":"json","version":1})
-            midnight = _UTC_TZ.localize(datetime.datetime.combine(date, datetime.datetime.min.time()))
-            epoch = int(midnight.timestamp())
-            self._send_sse_command(sse_server, connection_token, {"arguments": [box_name, str(epoch)],
-                                                                  "invocationId":"0",
-                                                                  "target":"JoinRoom",
-                                                                  "type":1})
-
-            client = sseclient.SSEClient(booking_hub_request)
-            client_iterator = client.events()
-
-            connection_active = True
-            while connection_active and not event_found and not timeout:
-                if max_datetime and datetime.datetime.now(_MADRID_TZ) > max_datetime:
-                    timeout = True
-                else:
-                    try:
-                        event = next(client_iterator)
-                        data = json.loads(event.data[:-1])
-                        event_found = "target" in data and data["target"] in expected_events
-                    except StopIteration:
-                        logging.warning("Iterator without events. Reseting connection...")
-                        connection_active = False
-                    except requests.exceptions.ConnectionError:
-                        connection_active = False
-                        logging.warning("No event received after 60 seconds. Reseting connection")
-
-            client.close()
-
-        return event_found
-
-    def _send_sse_command(self, sse_server, connection_token, command):
-        headers = {**_HEADERS, **{"Content-Type": "text/plain"}}
-        command_str = json.dumps(command) + "\u001e"
-        self._session.post(f"{sse_server}/bookinghub?id={connection_token}",
-                           data=command_str, headers=headers, timeout=10)
+        if url not in self._box_name_by_url or self._box_metadata_expires_at.get(url, 0) < time.time():
+            self._load_box_hub(url)
+
+        midnight = _UTC_TZ.localize(datetime.datetime.combine(date, datetime.datetime.min.time()))
+        hub_client = BookingHubClient(self._sse_server_by_url[url], self._request, _HEADERS,
+                                      cookies=self._sessions.cookies, origin=url)
+        try:
+            return hub_client.wait_for([self._box_name_by_url[url], str(int(midnight.timestamp()))],
+                                       expected_events, max_datetime.timestamp())
+        except (requests.exceptions.RequestException, InvalidWodBusterResponse):
+            # The box metadata may be outdated. It will be scraped again on the next call
+            self._box_metadata_expires_at.pop(url, None)
+            raise
+
+    def _load_box_hub(self, url: str, retry: bool=True) -> None:
+        login_generation = self._login_generation
+        homepage_request = self._request('GET', f"{url}/user/", headers=_HEADERS,
+                                                allow_redirects=True, timeout=10)
+        look_up = re.search(r"InitAjax\('([^']*)',\s?'([^']*)'", homepage_request.text)
+        if not look_up:
+            if retry and self._revalidate_cookie(login_generation):
+                return self._load_box_hub(url, retry=False)
+            raise InvalidBox("Couldn't determine box name from URL")
+        self._box_name_by_url[url] = look_up.group(1)
+        self._sse_server_by_url[url] = look_up.group(2)
+        self._box_metadata_expires_at[url] = time.time() + _BOX_METADATA_TTL_SECONDS
 
     def get_box_url(self) -> str:
         """
@@ -465,8 +1327,8 @@ class Scraper():
         :return: The WodBuster URL associated with the user
         """
         self.login()
-        road_to_box_request = self._session.get("https://wodbuster.com/account/roadtobox.aspx",
-                                                headers=_HEADERS, allow_redirects=True, timeout=10)
+        road_to_box_request = self._request('GET', "https://wodbuster.com/account/roadtobox.aspx",
+                                                   headers=_HEADERS, allow_redirects=True, timeout=10)
         if "Location" in road_to_box_request.headers:
             if "login" in road_to_box_request.headers["Location"]:
                 raise LoginError("Invalid credentials")
@@ -489,138 +1351,204 @@ class Scraper():
         self.login()
         preferences_url = f"{box_url}/user/preferences.aspx"
         try:
-            preferences_request = self._session.get(preferences_url, headers=_HEADERS, allow_redirects=True, timeout=10)
+            preferences_request = self._request('GET', preferences_url, headers=_HEADERS, allow_redirects=True, timeout=10)
             preferences_request.raise_for_status()
             
-            soup = BeautifulSoup(preferences_request.content, 'lxml')
-            
             # Look for profile picture in img tags
             # Pattern: https://cdn.wodbuster.com/static/atletas/{a}/{b}/{c}/{athlete-id}.jpg
-            img_tags = soup.find_all('img', src=re.compile(r'cdn\.wodbuster\.com/static/atletas/'))
-            
-            for img in img_tags:
-                src = img.get('src', '')
-                if 'cdn.wodbuster.com/static/atletas/' in src:
-                    # Extract athlete ID from URL
-                    # Pattern: /static/atletas/{a}/{b}/{c}/{athlete-id}.jpg
-                    match = re.search(r'/static/atletas/[^/]+/[^/]+/[^/]+/([^/]+)\.jpg', src)
-                    if match:
-                        athlete_id = match.group(1)
-                        # Ensure full URL
-                        if src.startswith('http'):
-                            profile_picture_url = src
-                        elif src.startswith('//'):
-                            profile_picture_url = 'https:' + src
-                        elif src.startswith('/'):
-                            profile_picture_url = 'https://cdn.wodbuster.com' + src
-                        else:
-                            profile_picture_url = 'https://cdn.wodbuster.com/' + src
-                        
-                        logging.info("Extracted athlete ID: %s for user %s", athlete_id, self._user)
-                        return (athlete_id, profile_picture_url)
-            
+            athlete_id, profile_picture_url = self._find_profile_picture(
+                html.unescape(match.group(1)) for match in _PROFILE_PICTURE_PATTERN.finditer(preferences_request.text))
+
+            if not athlete_id:
+                # Fallback to a full parse in case the page markup is not the expected one
+                soup = BeautifulSoup(preferences_request.content, 'lxml')
+                img_tags = soup.find_all('img', src=re.compile(r'cdn\.wodbuster\.com/static/atletas/'))
+                athlete_id, profile_picture_url = self._find_profile_picture(img.get('src', '') for img in img_tags)
+
+            if athlete_id:
+                logging.info("Extracted athlete ID: %s for user %s", athlete_id, self._user)
+                return (athlete_id, profile_picture_url)
+
             logging.warning("Could not find profile picture URL for user %s", self._user)
             return (None, None)
             
         except requests.exceptions.RequestException as e:
             logging.exception("Error fetching preferences page for user %s", self._user)
             raise InvalidWodBusterResponse('Error fetching user preferences') from e
-        except Exception as e:
+        except Exception:
             logging.exception("Unexpected error extracting athlete ID for user %s", self._user)
             return (None, None)
 
-    def get_user_booked_classes(self, box_url: str, athlete_id: str, date: datetime.date) -> list:
+    @staticmethod
+    def _find_profile_picture(srcs) -> tuple:
+        for src in srcs:
+            if 'cdn.wodbuster.com/static/atletas/' in src:
+                # Extract athlete ID from URL
+                # Pattern: /static/atletas/{a}/{b}/{c}/{athlete-id}.jpg
+                match = re.search(r'/static/atletas/[^/]+/[^/]+/[^/]+/([^/]+)\.jpg', src)
+                if match:
+                    # Ensure full URL
+                    if src.startswith('http'):
+                        profile_picture_url = src
+                    elif src.startswith('//'):
+                        profile_picture_url = 'https:' + src
+                    elif src.startswith('/'):
+                        profile_picture_url = 'https://cdn.wodbuster.com' + src
+                    else:
+                        profile_picture_url = 'https://cdn.wodbuster.com/' + src
+                    return (match.group(1), profile_picture_url)
+        return (None, None)
+
+    def get_day(self, box_url: str, athlete_id: str, date: datetime.date, known_hash: str=None) -> dict:
         """
-        Get classes booked by the user for a specific date.
+        Get the classes booked by the user and the training descriptions for a specific date
+        with a single request to WodBuster.
         :param box_url: The WodBuster box URL (e.g., https://mayantibox.wodbuster.com)
         :param athlete_id: The athlete ID with dashes (e.g., 4bbb52ac-6228-4194-a7e5-eb258c846adf)
-        :param date: The date to fetch bookings for
-        :return: List of dictionaries with booked class information:
-                 [{'class_id': int, 'date': date, 'time': time, 'class_name': str, 'class_type': str}, ...]
+        :param date: The date to fetch
+        :param known_hash: The content hash of the day when it was last synced. If the day still
+                 has the same hash, it is not parsed
+        :return: Dictionary with the booked classes (as returned by get_user_booked_classes), the
+                 training descriptions (as returned by get_training_descriptions), the content
+                 hash and whether the content hash is known_hash: {'booked_classes': list,
+                 'training_descriptions': list, 'content_hash': str, 'unchanged': bool}.
+                 Classes and descriptions are None if the day is unchanged (it is not parsed) or
+                 if they can't be parsed. The content hash is None in the latter case, so the day
+                 is not taken as synced
         :raises LoginError: If user/password combination fails.
         :raises InvalidWodBusterResponse: If the response from WodBuster is not valid
-        :raises RequestException: If a network error occurs
+        :raises PasswordRequired: If the provided cookie is outdated and a password is not provided
+        """
+        day = self.get_box_day(box_url, athlete_id, date, [athlete_id], known_hash)
+        if day['booked_classes'] is not None:
+            day['booked_classes'] = day['booked_classes'][athlete_id]
+        return day
+
+    def get_box_day(self, box_url: str, athlete_id: str, date: datetime.date, athlete_ids: list,
+                    known_hash: str=None) -> dict:
+        """
+        Get the classes booked by several athletes of a box and the training descriptions for a
+        specific date with a single request. The roster of every class lists all the athletes
+        enrolled, so the day fetched by any user of the box tells the bookings of all of them.
+        :param box_url: The WodBuster box URL (e.g., https://mayantibox.wodbuster.com)
+        :param athlete_id: The athlete ID of the user of this scraper, with dashes
+        :param date: The date to fetch
+        :param athlete_ids: The athlete IDs whose booked classes are wanted, with dashes
+        :param known_hash: The content hash of the day when it was last synced. If the day still
+                 has the same hash, it is not parsed
+        :return: Dictionary with the booked classes of every athlete ID (as returned by
+                 get_user_booked_classes), the training descriptions (as returned by
+                 get_training_descriptions), the content hash and whether the content hash is
+                 known_hash: {'booked_classes': {athlete_id: list}, 'training_descriptions': list,
+                 'content_hash': str, 'unchanged': bool}. Classes and descriptions are None if the
+                 day is unchanged (it is not parsed) or if they can't be parsed. The content hash
+                 is None in the latter case, so the day is not taken as synced
+        :raises LoginError: If user/password combination fails.
+        :raises InvalidWodBusterResponse: If the response from WodBuster is not valid
+        :raises PasswordRequired: If the provided cookie is outdated and a password is not provided
         """
+        response = self._load_day(box_url, athlete_id, date)
+        content_hash = _day_content_hash(response)
+        if content_hash == known_hash:
+            return {'booked_classes': None, 'training_descriptions': None, 'content_hash': content_hash,
+                    'unchanged': True}
+
+        booked_classes = training_descriptions = None
+        try:
+            schedule = DaySchedule.from_response(response, date)
+        except Exception:
+            logging.exception("Unexpected error parsing classes for user %s on date %s", self._user, date)
+        else:
+            try:
+                booked_classes = {box_athlete_id: self._parse_booked_classes(schedule, box_athlete_id, date)
+                                  for box_athlete_id in athlete_ids}
+            except Exception:
+                logging.exception("Unexpected error parsing booked classes for user %s on date %s", self._user, date)
+            try:
+                training_descriptions = self._parse_training_descriptions(schedule, date)
+            except Exception:
+                logging.exception("Unexpected error parsing training descriptions for user %s on date %s",
+                                  self._user, date)
+        return {
+            'booked_classes': booked_classes,
+            'training_descriptions': training_descriptions,
+            # A day parsed partly is synced again next time
+            'content_hash': content_hash if booked_classes is not None and training_descriptions is not None else None,
+            'unchanged': False
+        }
+
+    def _load_day(self, box_url: str, athlete_id: str, date: datetime.date) -> dict:
         self.login()
-        
+
         # Convert athlete_id from format with dashes to format without dashes
         athlete_id_no_dashes = athlete_id.replace('-', '')
-        
+
         # Calculate epoch timestamp for midnight UTC of the date
         midnight = _UTC_TZ.localize(datetime.datetime.combine(date, datetime.datetime.min.time()))
         epoch = int(midnight.timestamp())
-        
+
         # Build the API URL
         api_url = f'{box_url}/athlete/handlers/LoadClass.ashx?ticks={epoch}&idu={athlete_id_no_dashes}'
-        
+        training_desc_logger.info("Fetching day %s for user %s, URL: %s", date, self._user, api_url)
+        return self._book_request(api_url)
+
+    def _to_schedule(self, response: dict, date: datetime.date) -> DaySchedule:
         try:
-            response = self._book_request(api_url)
-            
-            if not response or 'Data' not in response:
-                logging.warning("No data in response for user %s on date %s", self._user, date)
-                return []
-            
-            booked_classes = []
-            
-            # Iterate through all classes in the response
-            for class_data in response.get('Data', []):
-                hour = class_data.get('Hora', '')
-                valores = class_data.get('Valores', [])
-                
-                # Check each class type (wod, openbox, etc.)
-                for valor_data in valores:
-                    valor = valor_data.get('Valor', {})
-                    atletas_entrenando = valor.get('AtletasEntrenando', [])
-                    
-                    # Check if user appears in AtletasEntrenando
-                    user_found = False
-                    for atleta in atletas_entrenando:
-                        atleta_url = atleta.get('Url', '')
-                        # Check if the URL contains the athlete_id
-                        if athlete_id in atleta_url or athlete_id_no_dashes in atleta_url:
-                            user_found = True
-                            break
-                    
-                    if user_found:
-                        # Extract class information
-                        class_id = valor.get('Id')
-                        class_name = valor_data.get('Nombre', '')
-                        tipo_entrenamiento = valor.get('IdTipoEntrenamiento', 1)
-                        
-                        # Determine class type based on IdTipoEntrenamiento
-                        # Common types: 1=Wod, 2=OpenBox, 7=OpenBox*, etc.
-                        if tipo_entrenamiento == 1:
-                            class_type = 'wod'
-                        elif tipo_entrenamiento in [2, 7]:
-                            class_type = 'openbox'
-                        else:
-                            class_type = f'type_{tipo_entrenamiento}'
-                        
-                        # Parse time
-                        try:
-                            time_parts = hour.split(':')
-                            class_time = datetime.time(int(time_parts[0]), int(time_parts[1]), int(time_parts[2]) if len(time_parts) > 2 else 0)
-                        except (ValueError, IndexError):
-                            logging.warning("Could not parse time %s for class %s", hour, class_id)
-                            continue
-                        
-                        booked_classes.append({
-                            'class_id': class_id,
-                            'date': date,
-                            'time': class_time,
-                            'class_name': class_name,
-                            'class_type': class_type
-                        })
-            
-            logging.info("Found %d booked classes for user %s on date %s", len(booked_classes), self._user, date)
-            return booked_classes
-            
+            return DaySchedule.from_response(response, date)
+        except Exception:
+            logging.exception("Unexpected error parsing classes for user %s on date %s", self._user, date)
+            return DaySchedule.from_response({}, date)
+
+    def get_user_booked_classes(self, box_url: str, athlete_id: str, date: datetime.date) -> list:
+        """
+        Get classes booked by the user for a specific date.
+        :param box_url: The WodBuster box URL (e.g., https://mayantibox.wodbuster.com)
+        :param athlete_id: The athlete ID with dashes (e.g., 4bbb52ac-6228-4194-a7e5-eb258c846adf)
+        :param date: The date to fetch bookings for
+        :return: List of dictionaries with booked class information:
+                 [{'class_id': int, 'date': date, 'time': time, 'class_name': str, 'class_type': str}, ...]
+        :raises LoginError: If user/password combination fails.
+        :raises InvalidWodBusterResponse: If the response from WodBuster is not valid
+        :raises RequestException: If a network error occurs
+        """
+        try:
+            response = self._load_day(box_url, athlete_id, date)
         except requests.exceptions.RequestException as e:
             logging.exception("Error fetching booked classes for user %s on date %s", self._user, date)
             raise InvalidWodBusterResponse('Error fetching booked classes') from e
-        except Exception as e:
+        except Exception:
             logging.exception("Unexpected error fetching booked classes for user %s on date %s", self._user, date)
             return []
+        return self._parse_booked_classes_safely(self._to_schedule(response, date), athlete_id, date)
+
+    def _parse_booked_classes_safely(self, schedule: DaySchedule, athlete_id: str, date: datetime.date) -> list:
+        try:
+            return self._parse_booked_classes(schedule, athlete_id, date)
+        except Exception:
+            logging.exception("Unexpected error parsing booked classes for user %s on date %s", self._user, date)
+            return []
+
+    def _parse_booked_classes(self, schedule: DaySchedule, athlete_id: str, date: datetime.date) -> list:
+        if not schedule.classes:
+            logging.warning("No data in response for user %s on date %s", self._user, date)
+            return []
+
+        booked_classes = []
+        for scheduled_class, slot in schedule.get_athlete_classes(athlete_id):
+            if not scheduled_class.time:
+                logging.warning("Could not parse time %s for class %s", scheduled_class.hour, slot.id)
+                continue
+
+            booked_classes.append({
+                'class_id': slot.id,
+                'date': date,
+                'time': scheduled_class.time,
+                'class_name': slot.name,
+                'class_type': slot.class_type
+            })
+
+        logging.info("Found %d booked classes for user %s on date %s", len(booked_classes), self._user, date)
+        return booked_classes
 
     @staticmethod
     def _clean_html(text: str) -> str:
@@ -631,21 +1559,38 @@ class Scraper():
         """
         if not text:
             return ""
-        
-        # Replace <br> and <br/> with newlines
-        text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
-        
-        # Replace </p> with newline
-        text = text.replace('</p>', '\n')
-        
-        # Remove all remaining HTML tags
-        text = re.sub(r'<[^<]+?>', '', text)
-        
-        # Clean up multiple newlines
-        text = re.sub(r'\n\s*\n+', '\n\n', text)
-        
-        # Strip leading/trailing whitespace
-        return text.strip()
+
+        text = _HTML_TOKEN_PATTERN.sub(lambda match: '\n' if match.group(1) else '', text)
+        return _BLANK_LINES_PATTERN.sub('\n\n', text).strip()
+
+    @staticmethod
+    def _split_training_header(description: str) -> tuple:
+        """
+        Extract the training name from the header of a cleaned training description (first line
+        usually contains "WodMayanti Box", "MinimalMayanti Box", etc.)
+        :param description: The cleaned description
+        :return: A tuple with the training name (None if no header is found), the description
+        without the header and whether the header was removed
+        """
+        first_line, _, rest = description.partition('\n')
+        first_line = first_line.strip()
+
+        for box_pattern in _BOX_NAME_PATTERNS:
+            if box_pattern in first_line:
+                # Everything before the box name
+                training_name = first_line.partition(box_pattern)[0].strip()
+                break
+        else:
+            match = _TRAINING_TYPE_PATTERN.match(first_line)
+            if not match:
+                return None, description, False
+            training_name = match.group(1)
+
+        # Also remove empty line after header if present
+        second_line, _, remainder = rest.partition('\n')
+        if not second_line.strip():
+            rest = remainder
+        return training_name, rest.strip(), True
 
     def get_training_descriptions(self, box_url: str, athlete_id: str, date: datetime.date) -> list:
         """
@@ -659,179 +1604,252 @@ class Scraper():
         :raises InvalidWodBusterResponse: If the response from WodBuster is not valid
         :raises RequestException: If a network error occurs
         """
-        self.login()
-        
-        # Convert athlete_id from format with dashes to format without dashes
-        athlete_id_no_dashes = athlete_id.replace('-', '')
+        try:
+            response = self._load_day(box_url, athlete_id, date)
+        except requests.exceptions.RequestException as e:
+            logging.exception("Error fetching training descriptions for user %s on date %s", self._user, date)
+            raise InvalidWodBusterResponse('Error fetching training descriptions') from e
+        except Exception:
+            logging.exception("Unexpected error fetching training descriptions for user %s on date %s", self._user, date)
+            return []
+        return self._parse_training_descriptions_safely(self._to_schedule(response, date), date)
+
+    def _parse_training_descriptions_safely(self, schedule: DaySchedule, date: datetime.date) -> list:
+        try:
+            return self._parse_training_descriptions(schedule, date)
+        except Exception:
+            logging.exception("Unexpected error parsing training descriptions for user %s on date %s", self._user, date)
+            return []
+
+    def _parse_training_descriptions(self, schedule: DaySchedule, date: datetime.date) -> list:
+        # Extract ClasesDesc from response (it's a JSON string)
+        clases_desc_raw = schedule.descriptions_raw
         
-        # Calculate epoch timestamp for midnight UTC of the date
-        midnight = _UTC_TZ.localize(datetime.datetime.combine(date, datetime.datetime.min.time()))
-        epoch = int(midnight.timestamp())
+        training_desc_logger.debug("ClasesDesc raw value (first 200 chars) for date %s: %s", 
+                    date, str(clases_desc_raw)[:200] if clases_desc_raw else "None/Empty")
         
-        # Build the API URL
-        api_url = f'{box_url}/athlete/handlers/LoadClass.ashx?ticks={epoch}&idu={athlete_id_no_dashes}'
+        if not clases_desc_raw or clases_desc_raw == '[]':
+            training_desc_logger.warning("No ClasesDesc in response for user %s on date %s", self._user, date)
+            return []
         
+        # Parse the JSON string
         try:
-            training_desc_logger.info("Fetching training descriptions for user %s, date %s, URL: %s", 
-                        self._user, date, api_url)
-            response = self._book_request(api_url)
-            
-            # Log response keys to see what we're getting
-            training_desc_logger.info("API response keys for date %s: %s", date, list(response.keys()))
-            
-            # Extract ClasesDesc from response (it's a JSON string)
-            clases_desc_raw = response.get('ClasesDesc', '[]')
-            
-            training_desc_logger.info("ClasesDesc raw value (first 200 chars) for date %s: %s", 
-                        date, str(clases_desc_raw)[:200] if clases_desc_raw else "None/Empty")
+            pizarras = _json_loads(clases_desc_raw)
+            training_desc_logger.debug("Parsed %d pizarras from ClasesDesc for date %s", len(pizarras), date)
+        except json.JSONDecodeError as e:
+            training_desc_logger.error("Failed to parse ClasesDesc JSON for user %s on date %s: %s. Raw value: %s", 
+                         self._user, date, str(e), str(clases_desc_raw)[:500])
+            return []
+        
+        # Map of IdPizarra -> class type name (NombreE or Nombre from Valores)
+        pizarra_to_class_name = schedule.pizarra_names
+        
+        training_desc_logger.debug("Mapped %d pizarras to class names: %s", 
+                    len(pizarra_to_class_name), pizarra_to_class_name)
+        
+        training_descriptions = []
+        
+        # Process each pizarra (training description)
+        for idx, pizarra in enumerate(pizarras):
+            id_pizarra = pizarra.get('IdPizarra')
+            training_name, description_clean, header_line_removed = \
+                self._split_training_header(self._clean_html(pizarra.get('Descripcion', '')))
+
+            # Fallback to Data mapping, then Nombre from pizarra
+            if not training_name:
+                training_name = pizarra_to_class_name.get(id_pizarra) or pizarra.get('Nombre', '')
+                training_desc_logger.debug("Using fallback training name '%s' (from Data mapping: %s, from pizarra Nombre: %s)", 
+                            training_name, 
+                            pizarra_to_class_name.get(id_pizarra),
+                            pizarra.get('Nombre', ''))
             
-            if not clases_desc_raw or clases_desc_raw == '[]':
-                training_desc_logger.warning("No ClasesDesc in response for user %s on date %s. Response keys: %s", 
-                              self._user, date, list(response.keys()))
-                return []
+            training_desc_logger.debug("Final training_name for pizarra %d (IdPizarra: %s): '%s' (extracted from description: %s)", 
+                        idx, id_pizarra, training_name, 'yes' if header_line_removed else 'no')
             
-            # Parse the JSON string
+            if training_name:  # Only add if we have a training name
+                training_descriptions.append({
+                    'training_name': training_name,
+                    'description': description_clean,
+                    'id_pizarra': id_pizarra
+                })
+                training_desc_logger.debug("Added training description: %s (id_pizarra: %s, description length: %d)", 
+                            training_name, id_pizarra, len(description_clean))
+            else:
+                training_desc_logger.warning("Skipping pizarra %d for date %s: no training name (IdPizarra: %s)", 
+                              idx, date, id_pizarra)
+        
+        training_desc_logger.info("Found %d training descriptions for user %s on date %s: %s", 
+                    len(training_descriptions), self._user, date, 
+                    [td['training_name'] for td in training_descriptions])
+        return training_descriptions
+
+
+class _ScraperRegistry():
+    """
+    Scrapers by user email, shared by web requests and Booker threads. Least recently used
+    scrapers are evicted when the registry grows over max_size and when they have been idle for
+    more than max_idle seconds. Scrapers pinned by running Bookers are never evicted
+    """
+
+    def __init__(self, max_size: int, max_idle: float):
+        self._max_size = max_size
+        self._max_idle = max_idle
+        self._lock = threading.Lock()
+        self._scrapers = OrderedDict()
+        self._last_used = {}
+        self._pins = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, email: str, cookie: str, session_state: str=None) -> Scraper:
+        """
+        Get the scraper of a user, creating it with the given cookie and session state if there
+        is none
+        """
+        with self._lock:
+            scraper = self._scrapers.get(email)
+            if scraper:
+                self._hits += 1
+                self._scrapers.move_to_end(email)
+            else:
+                self._misses += 1
+                scraper = Scraper(email, cookie=cookie, session_state=session_state)
+                self._scrapers[email] = scraper
+            self._last_used[email] = time.monotonic()
+            evicted = self._evict(email)
+
+        self._close(evicted)
+        return scraper
+
+    def put(self, email: str, scraper: Scraper) -> None:
+        """
+        Replace the scraper of a user. The former scraper is not closed as running Bookers may
+        still be using it
+        """
+        with self._lock:
+            self._scrapers[email] = scraper
+            self._scrapers.move_to_end(email)
+            self._last_used[email] = time.monotonic()
+            evicted = self._evict(email)
+
+        self._close(evicted)
+
+    def pin(self, email: str) -> None:
+        """
+        Prevent the scraper of a user from being evicted until it is unpinned as many times
+        """
+        with self._lock:
+            self._pins[email] = self._pins.get(email, 0) + 1
+
+    def unpin(self, email: str) -> None:
+        """
+        Release a pin set with pin
+        """
+        with self._lock:
+            pins = self._pins.get(email, 0) - 1
+            if pins > 0:
+                self._pins[email] = pins
+            else:
+                self._pins.pop(email, None)
+
+    def stats(self) -> dict:
+        """
+        Get the registry counters: size, pinned users, hits, misses, evictions and the
+        approximate bytes held by the scrapers
+        """
+        with self._lock:
+            scrapers = list(self._scrapers.values())
+            stats = {
+                'size': len(scrapers),
+                'pinned': len(self._pins),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+        stats['approximate_bytes'] = sum(scraper.approximate_size() for scraper in scrapers)
+        return stats
+
+    def _evict(self, keep: str) -> list:
+        # Must be called with the lock held. The scraper of the keep user is the one being
+        # returned and is not evicted. Returns the evicted scrapers so they are closed once the
+        # lock is released
+        now = time.monotonic()
+        evicted = []
+        for email in list(self._scrapers):
+            over_size = len(self._scrapers) > self._max_size
+            idle = now - self._last_used.get(email, now) > self._max_idle
+            if not over_size and not idle:
+                # Entries are in least recently used order, the rest are more recent
+                break
+            if email in self._pins or email == keep:
+                continue
+            evicted.append(self._scrapers.pop(email))
+            self._last_used.pop(email, None)
+
+        if evicted:
+            self._evictions += len(evicted)
+            logging.info("Evicted %d scrapers. %d scrapers remain (%d pinned)", len(evicted),
+                         len(self._scrapers), len(self._pins))
+        return evicted
+
+    @staticmethod
+    def _close(scrapers: list) -> None:
+        for scraper in scrapers:
             try:
-                pizarras = json.loads(clases_desc_raw)
-                training_desc_logger.info("Parsed %d pizarras from ClasesDesc for date %s", len(pizarras), date)
-            except json.JSONDecodeError as e:
-                training_desc_logger.error("Failed to parse ClasesDesc JSON for user %s on date %s: %s. Raw value: %s", 
-                             self._user, date, str(e), str(clases_desc_raw)[:500])
-                return []
-            
-            # Extract class data to match pizarras with actual class types
-            class_data = response.get('Data', [])
-            # Build a map of IdPizarra -> class type name (NombreE or Nombre from Valores)
-            pizarra_to_class_name = {}
-            for class_entry in class_data:
-                valores = class_entry.get('Valores', [])
-                for valor_data in valores:
-                    valor = valor_data.get('Valor', {})
-                    id_pizarra = valor.get('IdPizarra')
-                    if id_pizarra:
-                        # Try NombreE first (more specific), then Nombre
-                        class_name = valor_data.get('NombreE') or valor_data.get('Nombre', '')
-                        if class_name:
-                            # Store the first (or most specific) name we find for this pizarra
-                            if id_pizarra not in pizarra_to_class_name:
-                                pizarra_to_class_name[id_pizarra] = class_name
-                            elif valor_data.get('NombreE'):  # Prefer NombreE if available
-                                pizarra_to_class_name[id_pizarra] = class_name
-            
-            training_desc_logger.info("Mapped %d pizarras to class names: %s", 
-                        len(pizarra_to_class_name), pizarra_to_class_name)
-            
-            training_descriptions = []
-            
-            # Process each pizarra (training description)
-            for idx, pizarra in enumerate(pizarras):
-                id_pizarra = pizarra.get('IdPizarra')
-                description_html = pizarra.get('Descripcion', '')
-                
-                # Clean HTML from description first to extract training name
-                description_clean = self._clean_html(description_html)
-                
-                # Extract training name from description header (first line usually contains "WodMayanti Box", "MinimalMayanti Box", etc.)
-                training_name = None
-                header_line_removed = False
-                if description_clean:
-                    lines = description_clean.split('\n')
-                    first_line = lines[0].strip() if lines else ''
-                    
-                    training_desc_logger.info("Pizarra %d for date %s: First line of description: '%s'", idx, date, first_line[:100])
-                    
-                    # Look for pattern like "WodMayanti Box", "MinimalMayanti Box", "EnduranceMayanti Box"
-                    # Extract the training type (everything before "Mayanti Box" or similar box name)
-                    box_name_patterns = ['Mayanti Box', 'Box', 'CrossFit']
-                    for box_pattern in box_name_patterns:
-                        if box_pattern in first_line:
-                            # Extract everything before the box name
-                            training_name = first_line.split(box_pattern)[0].strip()
-                            training_desc_logger.info("Extracted training name '%s' from pattern '%s' in first line", training_name, box_pattern)
-                            # Remove the header line from description
-                            lines.pop(0)
-                            # Also remove empty line after header if present
-                            if lines and not lines[0].strip():
-                                lines.pop(0)
-                            description_clean = '\n'.join(lines).strip()
-                            header_line_removed = True
-                            break
-                    
-                    # If no box name pattern found, try to extract from first line
-                    # Common patterns: "Wod", "Minimal", "Endurance" at the start
-                    if not training_name and first_line and not header_line_removed:
-                        # Try to match common training types at the start (more comprehensive patterns)
-                        # Pattern order matters - try most specific first
-                        training_type_patterns = [
-                            r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)(?=[A-Z])',  # Training type immediately followed by capital letter (like "WodMayanti" - no space)
-                            r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)\s+',  # Training type followed by space
-                            r'^(Wod|WOD|Minimal|Endurance|Gymnastics|GAP|Open\s*Box|OpenBox)$',  # Just the training type
-                        ]
-                        for pattern in training_type_patterns:
-                            match = re.match(pattern, first_line, re.IGNORECASE)
-                            if match:
-                                training_name = match.group(1)
-                                training_desc_logger.info("Extracted training name '%s' using regex pattern '%s' from first line '%s'", 
-                                           training_name, pattern, first_line[:100])
-                                # Remove the header line from description
-                                lines.pop(0)
-                                # Also remove empty line after header if present
-                                if lines and not lines[0].strip():
-                                    lines.pop(0)
-                                description_clean = '\n'.join(lines).strip()
-                                header_line_removed = True
-                                break
-                
-                # Fallback to Data mapping, then Nombre from pizarra
-                if not training_name:
-                    training_name = pizarra_to_class_name.get(id_pizarra) or pizarra.get('Nombre', '')
-                    training_desc_logger.info("Using fallback training name '%s' (from Data mapping: %s, from pizarra Nombre: %s)", 
-                                training_name, 
-                                pizarra_to_class_name.get(id_pizarra),
-                                pizarra.get('Nombre', ''))
-                
-                training_desc_logger.info("Final training_name for pizarra %d (IdPizarra: %s): '%s' (extracted from description: %s)", 
-                            idx, id_pizarra, training_name, 'yes' if header_line_removed else 'no')
-                
-                if training_name:  # Only add if we have a training name
-                    training_descriptions.append({
-                        'training_name': training_name,
-                        'description': description_clean,
-                        'id_pizarra': id_pizarra
-                    })
-                    training_desc_logger.info("Added training description: %s (id_pizarra: %s, description length: %d)", 
-                                training_name, id_pizarra, len(description_clean))
-                else:
-                    training_desc_logger.warning("Skipping pizarra %d for date %s: no training name (IdPizarra: %s)", 
-                                  idx, date, id_pizarra)
-            
-            training_desc_logger.info("Found %d training descriptions for user %s on date %s: %s", 
-                        len(training_descriptions), self._user, date, 
-                        [td['training_name'] for td in training_descriptions])
-            return training_descriptions
-            
-        except requests.exceptions.RequestException as e:
-            logging.exception("Error fetching training descriptions for user %s on date %s", self._user, date)
-            raise InvalidWodBusterResponse('Error fetching training descriptions') from e
-        except Exception as e:
-            logging.exception("Unexpected error fetching training descriptions for user %s on date %s", self._user, date)
-            return []
+                scraper.close()
+            except Exception:
+                logging.exception("Error closing scraper for user %s", scraper._user)
 
 
-__SCRAPERS = {}
+__SCRAPERS = _ScraperRegistry(_SCRAPER_REGISTRY_MAX_SIZE, _SCRAPER_REGISTRY_MAX_IDLE_SECONDS)
 
 
-def get_scraper(email: str, cookie: bytes) -> Scraper:
+def get_scraper(email: str, cookie: str, session_state: str=None) -> Scraper:
     """
     Returns a scrapper for a given user. If a scraper for the given user already exists, the
     existing one will be returned. Otherwise, a new one will be created.
     :param: The user to get the scraper for
     :param: The cookie associated with the user
+    :param: The session state persisted for the user (see Scraper.get_session_state)
+    """
+    return __SCRAPERS.get(email, cookie, session_state)
+
+
+def pin_scraper(email: str) -> None:
+    """
+    Keep the scraper of the given user in memory (used by running Bookers)
+    :param email: The email of the user
+    """
+    __SCRAPERS.pin(email)
+
+
+def unpin_scraper(email: str) -> None:
+    """
+    Allow the scraper of the given user to be evicted again
+    :param email: The email of the user
     """
-    if email not in __SCRAPERS:
-        __SCRAPERS[email] = Scraper(email, cookie=cookie)
+    __SCRAPERS.unpin(email)
+
 
-    return __SCRAPERS[email]
+def get_scraper_stats() -> dict:
+    """
+    Get the counters of the scraper registry (size, pinned, hits, misses, evictions and
+    approximate_bytes), the request rate allowed to each host (host_rates) and the hosts whose
+    circuit is open (unavailable_hosts)
+    """
+    return {**__SCRAPERS.stats(), 'host_rates': _GOVERNOR.stats(), 'unavailable_hosts': _BREAKER.stats()}
+
+
+def wait_for_host(host: str, timeout: float=None) -> bool:
+    """
+    Block while a WodBuster host is unavailable (its circuit is open). Callers are released when
+    the host is back, or when a probe request can be sent
+    :param host: The host, as reported by HostUnavailable
+    :param timeout: The maximum seconds to wait. None waits as long as needed
+    :return: True if requests can be sent to the host. False if the timeout is reached
+    """
+    return _BREAKER.wait_until_available(host, timeout)
 
 
 def refresh_scraper(email: str, password: str) -> Scraper:
@@ -848,5 +1866,5 @@ def refresh_scraper(email: str, password: str) -> Scraper:
     """
     scraper = Scraper(email, password)
     scraper.login()
-    __SCRAPERS[email] = scraper
+    __SCRAPERS.put(email, scraper)
     return scraper
\ No newline at end of file
@@ -4,6 +4,10 @@
     
     let isSyncing = false;
     
+    // Polling of the background sync job
+    const POLL_INTERVAL_MS = 2000;
+    const MAX_POLLS = 60;
+    
     // Check if we're on the booking list page
     function isBookingListPage() {
         return window.location.pathname.includes('/booking/') || 
@@ -50,7 +54,18 @@
                 body: Object.keys(body).length > 0 ? JSON.stringify(body) : undefined
             });
             
-            const data = await response.json();
+            let data = await response.json();
+            // 200: the user was synced recently, nothing new to show
+            const recentlySynced = response.status === 200 && data.success;
+            
+            // 202: the sync runs in the background, wait for its result
+            let polls = 0;
+            while (data.success && (data.status === 'queued' || data.status === 'running') && polls < MAX_POLLS) {
+                await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+                const statusResponse = await fetch('/api/wodbuster/sync/' + encodeURIComponent(data.job_id));
+                data = await statusResponse.json();
+                polls++;
+            }
             
             // Hide loading indicator
             if (loadingIndicator) {
@@ -58,9 +73,12 @@
             }
             
             // Show result message
-            if (data.success) {
+            if (recentlySynced) {
+                return;
+            }
+            if (data.success && data.status === 'done') {
                 showSyncMessage(data.message, 'success');
-            } else {
+            } else if (!data.success) {
                 showSyncMessage('Error: ' + (data.error || 'Error desconocido'), 'error');
             }
         } catch (error) {
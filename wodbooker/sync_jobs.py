@@ -0,0 +1,177 @@
+"""
+Background jobs for the WodBuster bookings sync of the users. The sync requested from the web
+(page loads, the sync button, cancellations) is queued instead of run inside the request. There
+is at most one job queued and one running per user: concurrent requests share the queued job,
+and a user synced successfully less than WODBUSTER_SYNC_FRESHNESS_SECONDS ago (or whose sync
+failed less than WODBUSTER_SYNC_FAILURE_BACKOFF_SECONDS ago, e.g. with an outdated cookie) gets
+the last result instead of a new job unless the sync is forced.
+"""
+import logging
+import os
+import threading
+import uuid
+from queue import Queue
+from . import clock
+from .booker import sync_wodbuster_bookings
+from .models import db, User
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+FRESHNESS_SECONDS = float(os.getenv('WODBUSTER_SYNC_FRESHNESS_SECONDS', '300'))
+FAILURE_BACKOFF_SECONDS = float(os.getenv('WODBUSTER_SYNC_FAILURE_BACKOFF_SECONDS', '60'))
+SYNC_WORKERS = int(os.getenv('WODBUSTER_SYNC_WORKERS', '2'))
+
+
+class SyncJob():
+    """
+    A sync of the WodBuster bookings of a user
+    """
+
+    def __init__(self, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = QUEUED
+        self.result = None
+        self.created_at = clock.get_clock().time()
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def wait(self, timeout: float=None) -> bool:
+        """
+        Wait until the job is finished
+        :param timeout: The maximum seconds to wait
+        :return: Whether the job is finished
+        """
+        return self._finished.wait(timeout)
+
+
+class _SyncQueue():
+    """
+    Queue of sync jobs, coalesced per user
+    """
+
+    def __init__(self, freshness_seconds: float, failure_backoff_seconds: float):
+        self._freshness_seconds = freshness_seconds
+        self._failure_backoff_seconds = failure_backoff_seconds
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._queued = {}
+        self._running = {}
+        self._last = {}
+
+    def submit(self, user_id: int, force: bool=False) -> SyncJob:
+        """
+        Request a sync of a user
+        :param user_id: The user to sync
+        :param force: Sync even if the last sync is fresh or failed recently, e.g. after a change
+        made by the user. A sync running already is followed by a new one
+        :return: The job queued or running for the user, or the last finished one if it is fresh
+        or failed recently
+        """
+        with self._lock:
+            queued = self._queued.get(user_id)
+            if queued:
+                return queued
+            running = self._running.get(user_id)
+            if running and not force:
+                return running
+            last = self._last.get(user_id)
+            if not running and not force and last:
+                reuse_seconds = self._freshness_seconds if last.status == DONE else self._failure_backoff_seconds
+                if clock.get_clock().time() - last.finished_at < reuse_seconds:
+                    return last
+
+            job = SyncJob(user_id)
+            self._jobs[job.id] = job
+            self._queued[user_id] = job
+            # A job following a running one is queued when the running one finishes
+            if not running:
+                self._queue.put(job)
+            return job
+
+    def get(self, job_id: str) -> SyncJob:
+        """
+        Get a job queued, running or the last one finished for its user
+        :return: The job or None if it is unknown
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def take(self) -> SyncJob:
+        """
+        Block until a job is queued and mark it as running
+        """
+        job = self._queue.get()
+        with self._lock:
+            del self._queued[job.user_id]
+            self._running[job.user_id] = job
+            job.status = RUNNING
+        return job
+
+    def finish(self, job: SyncJob, result: dict) -> None:
+        """
+        Store the result of a job and queue the job that follows it, if any
+        """
+        with self._lock:
+            job.result = result
+            job.status = DONE if result.get('success') else FAILED
+            job.finished_at = clock.get_clock().time()
+            del self._running[job.user_id]
+            previous = self._last.get(job.user_id)
+            if previous:
+                self._jobs.pop(previous.id, None)
+            self._last[job.user_id] = job
+            following = self._queued.get(job.user_id)
+            if following:
+                self._queue.put(following)
+        job._finished.set()
+
+
+_SYNC_QUEUE = _SyncQueue(FRESHNESS_SECONDS, FAILURE_BACKOFF_SECONDS)
+
+
+def submit_sync(user_id: int, force: bool=False) -> SyncJob:
+    """
+    Request a sync of the WodBuster bookings of a user. See _SyncQueue.submit
+    """
+    return _SYNC_QUEUE.submit(user_id, force)
+
+
+def get_sync_job(job_id: str) -> SyncJob:
+    """
+    Get a sync job by its ID
+    :return: The job or None if it is unknown or was superseded by a newer job of its user
+    """
+    return _SYNC_QUEUE.get(job_id)
+
+
+def sync_worker_loop(app_context):
+    """
+    Run the queued sync jobs
+    :param app_context: The application context
+    """
+    app_context.push()
+    with app_context:
+        while True:
+            job = _SYNC_QUEUE.take()
+            try:
+                user = db.session.query(User).filter_by(id=job.user_id).first()
+                if user:
+                    result = sync_wodbuster_bookings(user)
+                else:
+                    result = {'success': False, 'errors': ['User not found']}
+            except Exception as e:
+                logging.exception("Unexpected error in sync job %s of user %s", job.id, job.user_id)
+                result = {'success': False, 'errors': [str(e)]}
+            finally:
+                # Don't keep the objects of this user in the session of the worker
+                db.session.remove()
+            _SYNC_QUEUE.finish(job, result)
@@ -2,9 +2,7 @@ import logging
 import re
 from datetime import datetime
 from collections import defaultdict
-import pickle
 import requests
-import cloudscraper
 from flask import redirect, url_for, request, flash
 from wtforms import form, fields, validators
 from flask_admin.form.fields import TimeField
@@ -17,8 +15,11 @@ from sqlalchemy import and_
 from flask_wtf import FlaskForm
 from flask_wtf import Recaptcha
 from flask_wtf.recaptcha import RecaptchaField
-from .models import User, db, Booking, WodBusterBooking, ClassTrainingDescription
-from .booker import start_booking_loop, stop_booking_loop, is_booking_running, sync_wodbuster_bookings, sync_training_descriptions_for_date
+from . import clock
+from .models import User, db, Booking, WodBusterBooking, BoxTrainingDescription
+from .booker import start_booking_loop, stop_booking_loop, is_booking_running, sync_training_descriptions_for_date
+from .sync_jobs import submit_sync, FRESHNESS_SECONDS
+from .box_watcher import is_watched
 from .scraper import refresh_scraper, get_scraper
 from .exceptions import LoginError, InvalidWodBusterResponse, PasswordRequired
 from .constants import EventMessage, DAYS_OF_WEEK, DEFAULT_OFFSETS_BY_DAY
@@ -27,6 +28,8 @@ from .constants import EventMessage, DAYS_OF_WEEK, DEFAULT_OFFSETS_BY_DAY
 training_desc_logger = logging.getLogger('training_descriptions')
 
 _MAX_BOOKINGS_BY_USER = 30
+# Seconds the sync button waits for its sync before redirecting
+_MANUAL_SYNC_TIMEOUT = 60
 
 
 class LoginForm(FlaskForm):
@@ -63,7 +66,12 @@ class LoginForm(FlaskForm):
     def get_user(self):
         existing_user = db.session.query(User).filter_by(email=self.email.data).first()
         if existing_user:
+            # Keep the box metadata and clearance cookies known before the login
+            if existing_user.session_state:
+                self._scraper.load_session_state(existing_user.session_state)
             existing_user.cookie = self._scraper.get_cookies()
+            existing_user.cookie_expires_at = self._scraper.get_cookie_expiration_date()
+            existing_user.session_state = self._scraper.get_session_state()
             existing_user.force_login = False
             db.session.commit()
             user = existing_user
@@ -71,6 +79,8 @@ class LoginForm(FlaskForm):
             user = User()
             user.email = self.email.data
             user.cookie = self._scraper.get_cookies()
+            user.cookie_expires_at = self._scraper.get_cookie_expiration_date()
+            user.session_state = self._scraper.get_session_state()
             db.session.add(user)
             db.session.commit()
         
@@ -232,7 +242,11 @@ class BookingAdmin(sqla.ModelView):
             return redirect(url_for('admin.login_view'))
         
         try:
-            result = sync_wodbuster_bookings(login.current_user)
+            job = submit_sync(login.current_user.id, force=True)
+            if not job.wait(_MANUAL_SYNC_TIMEOUT):
+                flash("La sincronización sigue en curso, los cambios aparecerán en unos instantes", "info")
+                return redirect(url_for('booking.index_view'))
+            result = job.result
             if result['success']:
                 flash(f"Sincronización completada: {result['new']} nuevas, {result['updated']} actualizadas, {result['cancelled']} canceladas", "success")
             else:
@@ -287,7 +301,7 @@ class BookingAdmin(sqla.ModelView):
             return redirect(url_for('booking.index_view'))
 
         try:
-            scraper = get_scraper(login.current_user.email, login.current_user.cookie)
+            scraper = get_scraper(login.current_user.email, login.current_user.cookie, login.current_user.session_state)
             
             # Combine date and time for the cancellation call
             class_datetime = datetime.combine(wb_booking.class_date, wb_booking.class_time)
@@ -305,7 +319,7 @@ class BookingAdmin(sqla.ModelView):
                 db.session.commit()
                 flash("Reserva cancelada con éxito.", "success")
                 # Trigger a sync to refresh the state from WodBuster
-                sync_wodbuster_bookings(login.current_user)
+                submit_sync(login.current_user.id, force=True)
             else:
                 flash("Error al cancelar la reserva en WodBuster.", "error")
 
@@ -466,14 +480,28 @@ class BookingAdmin(sqla.ModelView):
             training_desc_logger.info("Fetching training descriptions for user %s (ID: %d) for today (%s) and tomorrow (%s)", 
                         login.current_user.email, login.current_user.id, today, tomorrow)
             
-            # Get training descriptions from DB for today and tomorrow
-            descriptions = db.session.query(ClassTrainingDescription).filter(
-                ClassTrainingDescription.user_id == login.current_user.id,
-                ClassTrainingDescription.class_date.in_([today, tomorrow])
-            ).order_by(ClassTrainingDescription.class_date, ClassTrainingDescription.training_name).all()
+            # Training descriptions are stored per box: get box URL from user's most recent booking
+            box_url = None
+            last_booking = db.session.query(Booking).filter_by(user_id=login.current_user.id).order_by(Booking.id.desc()).first()
+            if last_booking and last_booking.url:
+                box_url = last_booking.url
+            elif login.current_user.athlete_id:
+                try:
+                    scraper = get_scraper(login.current_user.email, login.current_user.cookie, login.current_user.session_state)
+                    box_url = scraper.get_box_url()
+                except Exception as e:
+                    logging.error("Error getting the box URL of user %s: %s", login.current_user.email, str(e), exc_info=True)
+            
+            # Get training descriptions of the box from DB for today and tomorrow
+            descriptions = []
+            if box_url:
+                descriptions = db.session.query(BoxTrainingDescription).filter(
+                    BoxTrainingDescription.box_url == box_url,
+                    BoxTrainingDescription.class_date.in_([today, tomorrow])
+                ).order_by(BoxTrainingDescription.class_date, BoxTrainingDescription.training_name).all()
             
-            training_desc_logger.info("Found %d training descriptions in DB for user %s (today and tomorrow)", 
-                        len(descriptions), login.current_user.email)
+            training_desc_logger.info("Found %d training descriptions in DB for box %s (today and tomorrow)", 
+                        len(descriptions), box_url)
             
             # Group by date - create a dict mapping id_pizarra -> description for easy lookup
             db_descriptions_by_date = {}
@@ -489,135 +517,141 @@ class BookingAdmin(sqla.ModelView):
             if today in db_descriptions_by_date:
                 training_descriptions_by_date[today] = db_descriptions_by_date[today]
             
-            # For tomorrow, fetch available training types from API and merge with DB descriptions
-            if login.current_user.athlete_id:
+            # The box watcher syncs the bookings of watched dates on every change, so the browser
+            # doesn't need to request a sync on page load
+            kwargs['box_watched'] = bool(box_url) and is_watched(box_url, today)
+            
+            # Descriptions of tomorrow synced recently for the box, by any of its users, or kept in
+            # sync by the box watcher (only the current week is synced) are used as they are.
+            # Otherwise fetch available training types from API and merge with DB descriptions
+            fresh_since = clock.now() - timedelta(seconds=FRESHNESS_SECONDS)
+            tomorrow_is_fresh = tomorrow in db_descriptions_by_date and \
+                all(desc.fetched_at >= fresh_since for desc in db_descriptions_by_date[tomorrow])
+            tomorrow_is_watched = bool(box_url) and tomorrow.weekday() != 0 and is_watched(box_url, tomorrow)
+            if tomorrow_is_fresh or tomorrow_is_watched:
+                training_desc_logger.info("Using training descriptions of box %s for tomorrow (%s) %s",
+                            box_url, tomorrow, "kept in sync by the box watcher" if tomorrow_is_watched
+                            else f"synced in the last {FRESHNESS_SECONDS:.0f} seconds")
+                training_descriptions_by_date[tomorrow] = db_descriptions_by_date.get(tomorrow, [])
+            elif login.current_user.athlete_id and box_url:
                 try:
-                    # Get box URL from user's most recent booking
-                    box_url = None
-                    last_booking = db.session.query(Booking).filter_by(user_id=login.current_user.id).order_by(Booking.id.desc()).first()
-                    if last_booking and last_booking.url:
-                        box_url = last_booking.url
-                    else:
-                        scraper = get_scraper(login.current_user.email, login.current_user.cookie)
-                        box_url = scraper.get_box_url()
+                    scraper = get_scraper(login.current_user.email, login.current_user.cookie, login.current_user.session_state)
+                    tomorrow_day = scraper.get_day(box_url, login.current_user.athlete_id, tomorrow)
+                    api_training_types = tomorrow_day['training_descriptions'] or []
                     
-                    if box_url:
-                        scraper = get_scraper(login.current_user.email, login.current_user.cookie)
-                        api_training_types = scraper.get_training_descriptions(box_url, login.current_user.athlete_id, tomorrow)
-                        
-                        training_desc_logger.info("Fetched %d training types from API for tomorrow (%s)", 
-                                    len(api_training_types), tomorrow)
+                    training_desc_logger.info("Fetched %d training types from API for tomorrow (%s)", 
+                                len(api_training_types), tomorrow)
+                    
+                    # Create a set of training types from API
+                    tomorrow_descriptions = []
+                    api_training_by_pizarra = {}
+                    for api_training in api_training_types:
+                        id_pizarra = api_training.get('id_pizarra')
+                        training_name = api_training.get('training_name', '')
+                        description = api_training.get('description', '')
                         
-                        # Create a set of training types from API
-                        tomorrow_descriptions = []
-                        api_training_by_pizarra = {}
-                        for api_training in api_training_types:
-                            id_pizarra = api_training.get('id_pizarra')
-                            training_name = api_training.get('training_name', '')
-                            description = api_training.get('description', '')
+                        if id_pizarra:
+                            api_training_by_pizarra[id_pizarra] = api_training
                             
-                            if id_pizarra:
-                                api_training_by_pizarra[id_pizarra] = api_training
-                                
-                                # Check if we have this in DB
-                                if id_pizarra in db_descriptions_by_pizarra:
-                                    # Use DB version (it's more up-to-date)
-                                    desc = db_descriptions_by_pizarra[id_pizarra]
-                                    tomorrow_descriptions.append(desc)
-                                else:
-                                    # Create a temporary object for API-only training type
-                                    class TempDesc:
-                                        def __init__(self, training_name, description, id_pizarra):
-                                            self.training_name = training_name
-                                            self.description = description
-                                            self.id_pizarra = id_pizarra
-                                            self.formatted_description = None
-                                            self.class_date = tomorrow
-                                            # Use negative id_pizarra as temporary ID (DB IDs are positive)
-                                            self.id = -id_pizarra if id_pizarra else None
-                                    
-                                    temp_desc = TempDesc(training_name, description, id_pizarra)
-                                    tomorrow_descriptions.append(temp_desc)
-                                    training_desc_logger.info("Added API-only training type for tomorrow: %s (id_pizarra: %s)", 
-                                                training_name, id_pizarra)
-                        
-                        # Add any DB descriptions that weren't in API (shouldn't happen, but just in case)
-                        for id_pizarra, desc in db_descriptions_by_pizarra.items():
-                            if id_pizarra not in api_training_by_pizarra:
+                            # Check if we have this in DB
+                            if id_pizarra in db_descriptions_by_pizarra:
+                                # Use DB version (it's more up-to-date)
+                                desc = db_descriptions_by_pizarra[id_pizarra]
                                 tomorrow_descriptions.append(desc)
-                                training_desc_logger.info("Added DB-only training type for tomorrow: %s (id_pizarra: %s)", 
-                                            desc.training_name, id_pizarra)
-                        
-                        # Check if auto-sync is enabled and if we need to sync missing descriptions
-                        # This check happens AFTER building the list so we can detect training types showing "Aún no hay el entreno disponible"
-                        auto_sync_enabled = login.current_user.auto_sync_training_descriptions
-                        needs_sync = False
-                        
-                        # Check if any training types in the final list are missing descriptions
-                        for desc in tomorrow_descriptions:
-                            # Check if description is None, empty, or empty after stripping
-                            if not desc.description or not desc.description.strip():
-                                needs_sync = True
-                                training_desc_logger.info("Found training type '%s' without description, will trigger auto-sync", desc.training_name)
-                                break
-                        
-                        # Auto-sync if enabled and needed
-                        if auto_sync_enabled and needs_sync:
-                            training_desc_logger.info("Auto-syncing training descriptions for tomorrow (%s) - user has auto-sync enabled", tomorrow)
-                            try:
-                                sync_result = sync_training_descriptions_for_date(login.current_user, tomorrow, box_url)
-                                if sync_result['success']:
-                                    training_desc_logger.info("Auto-sync completed for tomorrow: %d new, %d updated", 
-                                                sync_result['new'], sync_result['updated'])
-                                    # Refresh DB descriptions after sync
-                                    refreshed_descriptions = db.session.query(ClassTrainingDescription).filter(
-                                        ClassTrainingDescription.user_id == login.current_user.id,
-                                        ClassTrainingDescription.class_date == tomorrow
-                                    ).all()
-                                    # Update our local dict
-                                    db_descriptions_by_pizarra = {
-                                        desc.id_pizarra: desc for desc in refreshed_descriptions
-                                    }
-                                    # Rebuild tomorrow_descriptions with updated data
-                                    tomorrow_descriptions = []
-                                    for api_training in api_training_types:
-                                        id_pizarra = api_training.get('id_pizarra')
-                                        training_name = api_training.get('training_name', '')
-                                        if id_pizarra:
-                                            if id_pizarra in db_descriptions_by_pizarra:
-                                                desc = db_descriptions_by_pizarra[id_pizarra]
-                                                tomorrow_descriptions.append(desc)
-                                            else:
-                                                # Still no DB entry, use API data
-                                                description = api_training.get('description', '')
-                                                class TempDesc:
-                                                    def __init__(self, training_name, description, id_pizarra):
-                                                        self.training_name = training_name
-                                                        self.description = description
-                                                        self.id_pizarra = id_pizarra
-                                                        self.formatted_description = None
-                                                        self.class_date = tomorrow
-                                                        self.id = -id_pizarra if id_pizarra else None
-                                                temp_desc = TempDesc(training_name, description, id_pizarra)
-                                                tomorrow_descriptions.append(temp_desc)
-                                else:
-                                    logging.warning("Auto-sync failed for tomorrow: %s", sync_result.get('errors', []))
-                            except Exception as e:
-                                logging.error("Error during auto-sync for tomorrow: %s", str(e), exc_info=True)
+                            else:
+                                # Create a temporary object for API-only training type
+                                class TempDesc:
+                                    def __init__(self, training_name, description, id_pizarra):
+                                        self.training_name = training_name
+                                        self.description = description
+                                        self.id_pizarra = id_pizarra
+                                        self.formatted_description = None
+                                        self.class_date = tomorrow
+                                        # Use negative id_pizarra as temporary ID (DB IDs are positive)
+                                        self.id = -id_pizarra if id_pizarra else None
+                                
+                                temp_desc = TempDesc(training_name, description, id_pizarra)
+                                tomorrow_descriptions.append(temp_desc)
+                                training_desc_logger.info("Added API-only training type for tomorrow: %s (id_pizarra: %s)", 
+                                            training_name, id_pizarra)
+                    
+                    # Add any DB descriptions that weren't in API (shouldn't happen, but just in case)
+                    for id_pizarra, desc in db_descriptions_by_pizarra.items():
+                        if id_pizarra not in api_training_by_pizarra:
+                            tomorrow_descriptions.append(desc)
+                            training_desc_logger.info("Added DB-only training type for tomorrow: %s (id_pizarra: %s)", 
+                                        desc.training_name, id_pizarra)
+                    
+                    # Check if auto-sync is enabled and if we need to sync missing descriptions
+                    # This check happens AFTER building the list so we can detect training types showing "Aún no hay el entreno disponible"
+                    auto_sync_enabled = login.current_user.auto_sync_training_descriptions
+                    needs_sync = False
+                    
+                    # Check if any training types in the final list are missing descriptions
+                    for desc in tomorrow_descriptions:
+                        # Check if description is None, empty, or empty after stripping
+                        if not desc.description or not desc.description.strip():
+                            needs_sync = True
+                            training_desc_logger.info("Found training type '%s' without description, will trigger auto-sync", desc.training_name)
+                            break
+                    
+                    # Auto-sync if enabled and needed
+                    if auto_sync_enabled and needs_sync:
+                        training_desc_logger.info("Auto-syncing training descriptions for tomorrow (%s) - user has auto-sync enabled", tomorrow)
+                        try:
+                            sync_result = sync_training_descriptions_for_date(login.current_user, tomorrow, box_url, day=tomorrow_day)
+                            if sync_result['success']:
+                                training_desc_logger.info("Auto-sync completed for tomorrow: %d new, %d updated", 
+                                            sync_result['new'], sync_result['updated'])
+                                # Refresh DB descriptions after sync
+                                refreshed_descriptions = db.session.query(BoxTrainingDescription).filter(
+                                    BoxTrainingDescription.box_url == box_url,
+                                    BoxTrainingDescription.class_date == tomorrow
+                                ).all()
+                                # Update our local dict
+                                db_descriptions_by_pizarra = {
+                                    desc.id_pizarra: desc for desc in refreshed_descriptions
+                                }
+                                # Rebuild tomorrow_descriptions with updated data
+                                tomorrow_descriptions = []
+                                for api_training in api_training_types:
+                                    id_pizarra = api_training.get('id_pizarra')
+                                    training_name = api_training.get('training_name', '')
+                                    if id_pizarra:
+                                        if id_pizarra in db_descriptions_by_pizarra:
+                                            desc = db_descriptions_by_pizarra[id_pizarra]
+                                            tomorrow_descriptions.append(desc)
+                                        else:
+                                            # Still no DB entry, use API data
+                                            description = api_training.get('description', '')
+                                            class TempDesc:
+                                                def __init__(self, training_name, description, id_pizarra):
+                                                    self.training_name = training_name
+                                                    self.description = description
+                                                    self.id_pizarra = id_pizarra
+                                                    self.formatted_description = None
+                                                    self.class_date = tomorrow
+                                                    self.id = -id_pizarra if id_pizarra else None
+                                            temp_desc = TempDesc(training_name, description, id_pizarra)
+                                            tomorrow_descriptions.append(temp_desc)
+                            else:
+                                logging.warning("Auto-sync failed for tomorrow: %s", sync_result.get('errors', []))
+                        except Exception as e:
+                            logging.error("Error during auto-sync for tomorrow: %s", str(e), exc_info=True)
+                    
+                    if tomorrow_descriptions:
+                        training_descriptions_by_date[tomorrow] = tomorrow_descriptions
+                    else:
+                        # No training types available for tomorrow
+                        training_descriptions_by_date[tomorrow] = []
                         
-                        if tomorrow_descriptions:
-                            training_descriptions_by_date[tomorrow] = tomorrow_descriptions
-                        else:
-                            # No training types available for tomorrow
-                            training_descriptions_by_date[tomorrow] = []
-                            
                 except Exception as e:
                     logging.error("Error fetching training types from API for tomorrow: %s", str(e), exc_info=True)
                     # Fallback to DB-only descriptions for tomorrow
                     if tomorrow in db_descriptions_by_date:
                         training_descriptions_by_date[tomorrow] = db_descriptions_by_date[tomorrow]
             else:
-                # No athlete_id, just use DB descriptions
+                # No athlete_id or box URL, just use DB descriptions
                 if tomorrow in db_descriptions_by_date:
                     training_descriptions_by_date[tomorrow] = db_descriptions_by_date[tomorrow]
             
@@ -729,7 +763,7 @@ class BookingAdmin(sqla.ModelView):
                 form.type_class.data = form.type_class.data or last_booking.type_class
             else:
                 try:
-                    scraper = get_scraper(login.current_user.email, login.current_user.cookie)
+                    scraper = get_scraper(login.current_user.email, login.current_user.cookie, login.current_user.session_state)
                     form.url.data = form.url.data or scraper.get_box_url()
                 except (PasswordRequired, LoginError, InvalidWodBusterResponse, RequestException) as e:
                     logging.warning("Exception while loading BOX URL %s", e)
@@ -820,7 +854,7 @@ class UserView(sqla.ModelView):
     list_template = 'admin/user/list.html'
 
     column_formatters = dict(
-        cookie=lambda v, c, m, p: _get_cookie_expiration_date(m.cookie),
+        cookie=lambda v, c, m, p: _format_cookie_expiration_date(m.cookie_expires_at),
     )
 
     def is_visible(self):
@@ -856,18 +890,12 @@ class UserView(sqla.ModelView):
     def get_list(self, *args, **kwargs):
         count, data = super().get_list(*args, **kwargs)
         for obj in data:
-            obj.cookie_expiration_date = _get_cookie_expiration_date(obj.cookie)
+            obj.cookie_expiration_date = _format_cookie_expiration_date(obj.cookie_expires_at)
         return count, data
 
 
-def _get_cookie_expiration_date(cookie):
-    session = cloudscraper.create_scraper()
-    session.cookies.update(pickle.loads(cookie))
-    try:
-        expiration_timestamp = next(x for x in session.cookies if x.name == '.WBAuth').expires
-        return datetime.fromtimestamp(expiration_timestamp).strftime('%d/%m/%Y a las %H:%M')
-    except (StopIteration, TypeError):
-        return None
+def _format_cookie_expiration_date(cookie_expires_at):
+    return cookie_expires_at.strftime('%d/%m/%Y a las %H:%M') if cookie_expires_at else None
 
 
 def _format_training_description(text: str) -> str: